@@ -1,6 +1,7 @@
-from config import bot, supabase, admin_update_flow, ROLES
+from config import bot, admin_update_flow, ROLES
 from telebot import types
-from db_helpers import get_user_info
+from db_helpers import get_user_info, invalidate_user
+import repository
 
 @bot.message_handler(commands=['admin_update'])
 def admin_update_command(message):
@@ -38,8 +39,10 @@ def callback_set_role(call):
     target_user_id = parts[1]
     selected_role = parts[2]
     admin_id = call.from_user.id
-    if admin_id in admin_update_flow:
-        admin_update_flow[admin_id]["new_role"] = selected_role
+    flow_data = admin_update_flow.get(admin_id)
+    if flow_data is not None:
+        flow_data["new_role"] = selected_role
+        admin_update_flow[admin_id] = flow_data
     markup = types.InlineKeyboardMarkup()
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("setcca_"))
@@ -50,11 +53,12 @@ def callback_set_cca(call):
     admin_id = call.from_user.id
     new_role = admin_update_flow.get(admin_id, {}).get("new_role", "resident")
     new_cca = None if selected_cca == "No CCA" else selected_cca
-    supabase.table("users").upsert({
+    repository.upsert_user({
         "user_id": int(target_user_id),
         "role": new_role,
         "cca": new_cca
-    }).execute()
+    })
+    invalidate_user(target_user_id)
     bot.edit_message_text(
         f"User {target_user_id} updated: Role = {ROLES[new_role]}, CCA = {new_cca if new_cca else 'None'}.",
         call.message.chat.id,
@@ -1,7 +1,16 @@
-from datetime import datetime as dt
-from config import bot, supabase
-from db_helpers import get_user_info, get_all_venues, get_all_users, parse_duration
-from notifications import notify_approval
+from collections import defaultdict
+from config import bot
+from db_helpers import get_user_info, get_venue_ids_for
+from booking_listing import listing_messages, LISTING_LIMIT
+from booking_utils import parse_selection, filter_selection, select_non_conflicting
+from venue_catalog import catalog
+from notifications import notify_approvals
+from calendar_sync import queue_add_events, queue_add_series
+import booking_index
+from booking_model import decode_rows
+import repository
+
+APPROVAL_VENUES = ["Reading Room", "Dining Hall"]
 
 @bot.message_handler(commands=['approve'])
 def approve_command(message):
@@ -11,73 +20,86 @@ def approve_command(message):
     if user["role"].strip().lower() != "jcrc":
         bot.send_message(user["user_id"], "You do not have permission to approve bookings. Press /start to restart.")
         return
-    venue_ids = get_venue_ids_for(["Reading Room", "Dining Hall"])
-    response = supabase.table("bookings").select("*") \
-        .eq("status", "pending approval") \
-        .in_("venue_id", venue_ids) \
-        .execute()
-    pending = response.data if response.data else []
+    venue_ids = get_venue_ids_for(APPROVAL_VENUES)
+    pending = repository.list_bookings(venue_ids, "pending approval", upcoming=True, limit=LISTING_LIMIT + 1)
     if not pending:
         bot.send_message(user["user_id"], "No pending bookings for approval. Press /start to restart.")
         return
-    venues = get_all_venues()
-    users = get_all_users()
-    venue_dict = {str(v["venue_id"]): v["name"] for v in venues}
-    users_dict = {str(u["user_id"]): u["name"] for u in users}
-    msg = "Pending bookings for approval:\n"
-    for b in pending:
-        booking_start = dt.fromisoformat(b["booking_date"])
-        dur = parse_duration(b["duration"])
-        end_dt = booking_start + dur
-        start_str = booking_start.strftime("%Y-%m-%d %H:%M")
-        end_str = end_dt.strftime("%Y-%m-%d %H:%M")
-        venue_name = venue_dict.get(str(b["venue_id"]), "Unknown Venue")
-        user_name = users_dict.get(str(b["user_id"]), "Unknown User")
-        line = (
-            f"Booking ID: {b['booking_id']}\n"
-            f"Venue: {venue_name}\n"
-            f"Name: {user_name}\n"
-            f"Start: {start_str}\n"
-            f"End: {end_str}\n"
-            f"Status: {b['status']}\n"
-            f"Reason: {b.get('reason', '')}\n"
-            "----------------------"
-        )
-        msg += line + "\n"
-    msg += "\nPlease enter the Booking ID to approve:"
-    bot.send_message(user["user_id"], msg)
+    prompt = ("\nPlease enter the Booking ID(s) to approve (e.g. 12, 15 18), or 'all', "
+              "optionally followed by a venue and/or date (e.g. all Reading Room 2025-03-01):")
+    for text in listing_messages(pending, header="Pending bookings for approval:", footer=prompt):
+        bot.send_message(user["user_id"], text)
     bot.register_next_step_handler(message, process_approval)
 
-def get_venue_ids_for(names):
-    from db_helpers import get_all_venues
-    venues = get_all_venues()
-    return [v["venue_id"] for v in venues if v["name"].strip().lower() in [n.lower() for n in names]]
-
 def process_approval(message):
     user = get_user_info(message.from_user.id)
     if not user:
         return
     try:
-        booking_id = int(message.text.strip())
-        res = supabase.table("bookings").select("*").eq("booking_id", booking_id).execute()
-        if not res.data:
-            bot.send_message(message.from_user.id, "Invalid Booking ID: booking not found. Press /start to restart.")
-            return
-        booking = res.data[0]
-        if booking["status"] != "pending approval":
-            bot.send_message(message.from_user.id, "Invalid Booking ID: booking is not pending approval. Press /start to restart.")
-            return
-        supabase.table("bookings").update({"status": "confirmed"}).eq("booking_id", booking_id).execute()
-        updated_res = supabase.table("bookings").select("*").eq("booking_id", booking_id).execute()
-        updated_booking = updated_res.data[0] if updated_res.data else None
-        if updated_booking:
-            if not updated_booking.get("calendar_event_id"):
-                from calendar_helpers import add_event_to_calendar
-                venue_data = supabase.table("venues").select("*").eq("venue_id", updated_booking["venue_id"]).execute()
-                venue = venue_data.data[0] if venue_data.data else {}
-                event_id = add_event_to_calendar(updated_booking, venue)
-                supabase.table("bookings").update({"calendar_event_id": event_id}).eq("booking_id", booking_id).execute()
-            notify_approval(updated_booking)
-        bot.send_message(message.from_user.id, f"Booking {booking_id} approved. Press /start to restart.")
+        booking_ids, venue, day = parse_selection(message.text)
     except ValueError:
         bot.send_message(message.from_user.id, "Invalid Booking ID. Press /start to restart.")
+        return
+    if booking_ids is None:
+        pending = repository.list_bookings(get_venue_ids_for(APPROVAL_VENUES), "pending approval", upcoming=True)
+        found = filter_selection(pending, venue, day)
+        if not found:
+            bot.send_message(message.from_user.id, "No pending bookings match that selection. Press /start to restart.")
+            return
+        missing = []
+    else:
+        found = decode_rows(repository.get_bookings(booking_ids))
+        found_ids = {b.booking_id for b in found}
+        missing = [i for i in booking_ids if i not in found_ids]
+    not_pending = [b.booking_id for b in found if b.status != "pending approval"]
+    accepted, conflicting, invalid = select_non_conflicting([b for b in found if b.status == "pending approval"])
+    approved = approve_bookings(accepted)
+    approved_ids = {b.booking_id for b in approved}
+    # Approved or cancelled by someone else between our read and the update.
+    not_pending += [b.booking_id for b in accepted if b.booking_id not in approved_ids]
+
+    lines = []
+    if len(approved) == 1:
+        lines.append(f"Booking {approved[0].booking_id} approved.")
+    elif approved:
+        lines.append(f"Approved {len(approved)} bookings: {_id_list(approved_ids)}.")
+    if missing:
+        lines.append(f"Invalid Booking ID: booking not found: {_id_list(missing)}.")
+    if not_pending:
+        lines.append(f"Invalid Booking ID: booking is not pending approval: {_id_list(not_pending)}.")
+    if conflicting:
+        lines.append("Not approved, overlaps a confirmed booking or another booking approved here: "
+                     f"{_id_list(b.booking_id for b in conflicting)}.")
+    if invalid:
+        lines.append(f"Not approved, invalid duration: {_id_list(b.booking_id for b in invalid)}.")
+    lines.append("Press /start to restart.")
+    bot.send_message(message.from_user.id, "\n".join(lines))
+
+def approve_bookings(bookings):
+    """
+    Confirms the given pending bookings with one batched update, queues their
+    calendar events in one outbox transaction and sends grouped
+    notifications. Returns the bookings actually approved.
+    """
+    if not bookings:
+        return []
+    rows = repository.update_bookings(
+        [b.booking_id for b in bookings], {"status": "confirmed"}, status="pending approval"
+    )
+    approved = decode_rows(rows)
+    new_events = [b for b in approved if not b.get("calendar_event_id")]
+    queue_add_events([(b, catalog.get(b.venue_id) or {}) for b in new_events if not b.series_id])
+    # Occurrences of a series approved together share one recurring event.
+    by_series = defaultdict(list)
+    for b in new_events:
+        if b.series_id:
+            by_series[b.series_id].append(b)
+    for members in by_series.values():
+        queue_add_series(members, catalog.get(members[0].venue_id) or {})
+    for booking in approved:
+        booking_index.add_booking(booking)
+    notify_approvals(approved)
+    return approved
+
+def _id_list(ids):
+    return ", ".join(str(i) for i in sorted(ids))
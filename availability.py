@@ -0,0 +1,69 @@
+from datetime import datetime as dt, timedelta
+import booking_index
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# Longest booking handle_duration accepts (24 hours), in slots.
+MAX_DURATION_SLOTS = SLOTS_PER_DAY
+
+
+def occupancy_bitmap(venue_id, day_start, num_slots):
+    """
+    Returns an int whose bit i is set when slot i (SLOT_MINUTES long, counted
+    from day_start) overlaps a confirmed booking.
+    """
+    window_end = day_start + timedelta(minutes=num_slots * SLOT_MINUTES)
+    bitmap = 0
+    for start, end, _ in booking_index.intervals_between(venue_id, day_start, window_end):
+        first = max(0, int((start - day_start).total_seconds() // 60) // SLOT_MINUTES)
+        end_minutes = (end - day_start).total_seconds() / 60
+        last = min(num_slots, -int(-end_minutes // SLOT_MINUTES))
+        if last > first:
+            bitmap |= ((1 << (last - first)) - 1) << first
+    return bitmap
+
+
+def free_runs(bitmap, num_slots):
+    """
+    Returns run[i] = number of consecutive free slots starting at slot i.
+    """
+    runs = [0] * (num_slots + 1)
+    for i in range(num_slots - 1, -1, -1):
+        runs[i] = 0 if (bitmap >> i) & 1 else runs[i + 1] + 1
+    return runs[:num_slots]
+
+
+def free_start_times(venue_id, day, now=None):
+    """
+    Returns [(start_datetime, max_duration_timedelta)] for every 15-minute
+    start on `day` that is free, in the future, and how long a booking from
+    there can run before hitting the next confirmed booking (capped at 24h,
+    possibly running past midnight).
+    """
+    day_start = dt.combine(day, dt.min.time())
+    # Look one day ahead so bookings that run past midnight get their full length.
+    horizon = SLOTS_PER_DAY + MAX_DURATION_SLOTS
+    runs = free_runs(occupancy_bitmap(venue_id, day_start, horizon), horizon)
+    first_slot = 0
+    if now is not None and now.date() == day:
+        minutes = now.hour * 60 + now.minute
+        first_slot = -(-minutes // SLOT_MINUTES)
+    slots = []
+    for i in range(first_slot, SLOTS_PER_DAY):
+        if runs[i]:
+            slots.append((
+                day_start + timedelta(minutes=i * SLOT_MINUTES),
+                timedelta(minutes=min(runs[i], MAX_DURATION_SLOTS) * SLOT_MINUTES)
+            ))
+    return slots
+
+
+def max_duration_from(venue_id, start):
+    """Longest free duration starting at `start`, or timedelta(0) if occupied."""
+    bitmap = occupancy_bitmap(venue_id, start, MAX_DURATION_SLOTS)
+    return timedelta(minutes=free_runs(bitmap, MAX_DURATION_SLOTS)[0] * SLOT_MINUTES)
+
+
+def format_duration(td):
+    minutes = int(td.total_seconds() // 60)
+    return f"{minutes // 60}:{minutes % 60:02d}"
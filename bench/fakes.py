@@ -0,0 +1,353 @@
+"""
+In-process stand-ins for the bot's backends, used by the load benchmark:
+a Supabase client over in-memory tables, a Google Calendar v3 service and a
+Telegram Bot API request sender. Each counts the calls it receives and can
+add a fixed latency per call to model network round trips.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime as dt
+
+_PRIMARY_KEYS = {"bookings": "booking_id", "users": "user_id", "venues": "venue_id"}
+
+
+def _comparable(value):
+    # Postgres compares timestamps, not strings; "2025-03-01 09:00:00" and
+    # "2025-03-01T09:00:00" are the same instant.
+    if isinstance(value, str) and len(value) >= 10 and value[4:5] == "-" and value[7:8] == "-":
+        try:
+            return dt.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(row, filters):
+    for op, column, value in filters:
+        current = row.get(column)
+        if op == "eq" and not (current is not None and _comparable(current) == _comparable(value)):
+            return False
+        if op == "neq" and _comparable(current) == _comparable(value):
+            return False
+        if op == "in" and current not in value and str(current) not in [str(v) for v in value]:
+            return False
+        if op == "is" and not ((value in (None, "null") and current is None) or current == value):
+            return False
+        if op in ("gt", "gte", "lt", "lte"):
+            if current is None:
+                return False
+            a, b = _comparable(current), _comparable(value)
+            if (op == "gt" and not a > b) or (op == "gte" and not a >= b) \
+                    or (op == "lt" and not a < b) or (op == "lte" and not a <= b):
+                return False
+    return True
+
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.columns = None
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.limit_n = None
+        self.offset = 0
+        self.on_conflict = None
+
+    def select(self, columns="*", count=None):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict=None):
+        self.action, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def _filter(self, op, column, value):
+        self.filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def in_(self, column, values):
+        return self._filter("in", column, list(values))
+
+    def is_(self, column, value):
+        return self._filter("is", column, value)
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit_n = start, end - start + 1
+        return self
+
+    def execute(self):
+        return self.db._execute(self)
+
+
+class FakeSupabase:
+    def __init__(self, tables=None, latency=0.0):
+        self.latency = latency
+        self.tables = {name: [dict(r) for r in rows] for name, rows in (tables or {}).items()}
+        self.calls = Counter()
+        self._ids = {}
+        self._lock = threading.Lock()
+        for name, rows in self.tables.items():
+            key = _PRIMARY_KEYS.get(name)
+            if key:
+                self._ids[name] = itertools.count(max([r.get(key) or 0 for r in rows] + [0]) + 1)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def _project(self, row, columns):
+        return dict(row) if columns is None else {c: row.get(c) for c in columns}
+
+    def _execute(self, q):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[f"{q.table}.{q.action}"] += 1
+            rows = self.tables.setdefault(q.table, [])
+            key = _PRIMARY_KEYS.get(q.table)
+            if q.action in ("insert", "upsert"):
+                payload = q.payload if isinstance(q.payload, list) else [q.payload]
+                out = []
+                for item in payload:
+                    item = dict(item)
+                    if "booking_date" in item and isinstance(item["booking_date"], str):
+                        item["booking_date"] = item["booking_date"].replace(" ", "T")
+                    existing = None
+                    if q.action == "upsert" and key and item.get(key) is not None:
+                        existing = next((r for r in rows if r.get(key) == item[key]), None)
+                    if existing is not None:
+                        existing.update(item)
+                        out.append(dict(existing))
+                        continue
+                    if key and item.get(key) is None:
+                        counter = self._ids.setdefault(q.table, itertools.count(1))
+                        item[key] = next(counter)
+                    rows.append(item)
+                    out.append(dict(item))
+                return _Response(out)
+            matched = [r for r in rows if _matches(r, q.filters)]
+            if q.action == "update":
+                for r in matched:
+                    r.update(q.payload)
+                return _Response([dict(r) for r in matched])
+            if q.action == "delete":
+                self.tables[q.table] = [r for r in rows if not _matches(r, q.filters)]
+                return _Response([dict(r) for r in matched])
+            for column, desc in reversed(q.orders):
+                matched.sort(key=lambda r: (r.get(column) is None, _comparable(r.get(column))), reverse=desc)
+            if q.limit_n is not None:
+                matched = matched[q.offset:q.offset + q.limit_n]
+            return _Response([self._project(r, q.columns) for r in matched])
+
+
+class _CalendarRequest:
+    def __init__(self, service, fn):
+        self.service = service
+        self.fn = fn
+
+    def execute(self):
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return self.fn()
+
+
+class _CalendarBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self):
+        with self.service._lock:
+            self.service.calls["batch"] += 1
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        for request_id, request, callback in self.requests:
+            try:
+                response, error = request.fn(), None
+            except Exception as e:
+                response, error = None, e
+            if callback:
+                callback(request_id, response, error)
+
+
+class CalendarHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Resp", (), {"status": status})()
+
+
+class _Events:
+    def __init__(self, service):
+        self.service = service
+
+    def insert(self, calendarId=None, body=None):
+        return _CalendarRequest(self.service, lambda: self.service._insert(body))
+
+    def delete(self, calendarId=None, eventId=None):
+        return _CalendarRequest(self.service, lambda: self.service._delete(eventId))
+
+    def list(self, calendarId=None, syncToken=None, pageToken=None, **kwargs):
+        return _CalendarRequest(self.service, lambda: self.service._list(syncToken, pageToken))
+
+
+class FakeCalendarService:
+    """Google Calendar v3 look-alike supporting events().insert/delete/list and batches."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.events_by_id = {}
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+        self._version = itertools.count(1)
+        self._changes = []
+        self._lock = threading.Lock()
+
+    def events(self):
+        return _Events(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _CalendarBatch(self, callback)
+
+    def _insert(self, body):
+        with self._lock:
+            self.calls["insert"] += 1
+            if body.get("id") in self.events_by_id:
+                raise CalendarHttpError(409)
+            event = dict(body, id=body.get("id") or f"evt{next(self._ids)}", status="confirmed")
+            self.events_by_id[event["id"]] = event
+            self._changes.append((next(self._version), event["id"]))
+            return dict(event)
+
+    def _delete(self, event_id):
+        with self._lock:
+            self.calls["delete"] += 1
+            event = self.events_by_id.get(event_id)
+            master_id, _, instance = event_id.partition("_")
+            if event is None and instance and self.events_by_id.get(master_id, {}).get("recurrence"):
+                # Cancelling one occurrence of a recurring event records a cancelled instance.
+                event = self.events_by_id[event_id] = {"id": event_id, "recurringEventId": master_id}
+            if event is None or event.get("status") == "cancelled":
+                raise CalendarHttpError(410 if event else 404)
+            event["status"] = "cancelled"
+            self._changes.append((next(self._version), event_id))
+            return {}
+
+    def _list(self, sync_token, page_token):
+        with self._lock:
+            self.calls["list"] += 1
+            if sync_token and not str(sync_token).isdigit():
+                raise CalendarHttpError(410)
+            since = int(sync_token or 0)
+            changed = {eid for version, eid in self._changes if version > since}
+            items = [dict(self.events_by_id[eid]) for eid in sorted(changed)]
+            if not sync_token:
+                items = [e for e in items if e.get("status") != "cancelled"]
+            latest = self._changes[-1][0] if self._changes else since
+            return {"items": items, "nextSyncToken": str(latest)}
+
+
+class _TelegramResult:
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeTelegram:
+    """
+    Request sender for telebot.apihelper.CUSTOM_REQUEST_SENDER. Records what
+    the bot sends to each chat (including keyboards) so simulated users can
+    read the bot's replies and press its buttons.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.messages = {}
+        self._message_ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        if self.latency:
+            time.sleep(self.latency)
+        name = url.rsplit("/", 1)[-1]
+        params = dict(params or {})
+        with self._lock:
+            self.calls[name] += 1
+            if name in ("sendMessage", "editMessageText"):
+                chat_id = int(params.get("chat_id"))
+                markup = params.get("reply_markup")
+                if isinstance(markup, str):
+                    markup = json.loads(markup)
+                message_id = int(params["message_id"]) if name == "editMessageText" else next(self._message_ids)
+                record = {"message_id": message_id, "text": params.get("text", ""), "markup": markup}
+                self.messages.setdefault(chat_id, []).append(record)
+                result = {
+                    "message_id": message_id, "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+                }
+            elif name == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            else:
+                result = True
+        return _TelegramResult({"ok": True, "result": result})
+
+    def sent_to(self, chat_id):
+        with self._lock:
+            return list(self.messages.get(chat_id, []))
@@ -0,0 +1,501 @@
+"""
+End-to-end load benchmark. Drives simulated users through the real handlers
+with Supabase, Google Calendar and the Telegram Bot API replaced by the
+in-process fakes in bench.fakes, then reports handler latency percentiles,
+backend calls per operation and peak memory as JSON.
+
+    python -m bench.run --users 50 --output bench-results.json
+    python -m bench.run --replay bot_debug.log
+    python -m bench.run --compare previous.json --max-regression 20
+
+Each phase (register, start, book, view, cancel, approve, mixed) runs to
+completion before the next, so the backend calls made during a phase divided
+by its operations gives calls per operation. Run from the repository root.
+"""
+import argparse
+import ast
+import itertools
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt, timedelta
+
+# Settings the bot reads at import time. The harness waits on the keyed
+# executor, so the concurrency mode is not optional.
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+os.environ["BOT_CONCURRENCY"] = "keyed"
+os.environ.setdefault("CALENDAR_OUTBOX_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-"), "outbox.sqlite3"))
+# Notifications are sent off the handler path; lift the Telegram limits so
+# each phase's queue drains in seconds instead of minutes.
+os.environ.setdefault("NOTIFY_GLOBAL_RATE", "10000")
+os.environ.setdefault("NOTIFY_CHAT_RATE", "10000")
+os.environ.setdefault("NOTIFY_GROUP_RATE", "10000")
+# Simulated users act far faster than people; per-user throttling would shed them.
+os.environ.setdefault("THROTTLE_ENABLED", "0")
+
+from telebot import apihelper, types  # noqa: E402
+
+from bench.fakes import FakeSupabase, FakeCalendarService, FakeTelegram  # noqa: E402
+
+# Venues as they exist in production (see bot_debug.log).
+VENUES = [
+    {"venue_id": 1, "name": "MPSH", "allowed_roles": ["jcrc", "captain", "chairman"],
+     "allowed_ccas": ["Steppers", "Dance", "Badminton", "Volleyball", "Table Tennis", "Floorball", "Takraw"]},
+    {"venue_id": 2, "name": "Band Room", "allowed_roles": ["chairman"], "allowed_ccas": ["Rockers", "Inspire"]},
+    {"venue_id": 3, "name": "Dining Hall", "allowed_roles": ["jcrc", "captain", "chairman", "resident"],
+     "allowed_ccas": None},
+    {"venue_id": 4, "name": "Reading Room ", "allowed_roles": ["jcrc", "captain", "chairman", "resident"],
+     "allowed_ccas": None},
+]
+PHASES = ["register", "start", "book", "view", "cancel", "approve", "mixed"]
+MIX = {"book": 4, "view": 4, "cancel": 1, "start": 1}
+MAX_STEPS = 12
+BOOKING_ID = re.compile(r"Booking ID: (\d+)")
+LOG_COMMAND = re.compile(r"User (\d+) invoked /(\w+)")
+LOG_USER_INFO = re.compile(r"Supabase response for user info: (\[.*\])")
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def rank(q):
+        return round(1000 * ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))], 3)
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(1000 * ordered[-1], 3)}
+
+
+def seed_tables(num_users, num_jcrc, history, rng):
+    users = [{"user_id": 10_000 + i, "name": f"Resident {i}", "role": "Resident", "cca": "No CCA", "block": None}
+             for i in range(num_users)]
+    users += [{"user_id": 20_000 + i, "name": f"JCRC {i}", "role": "JCRC", "cca": "No CCA", "block": None}
+              for i in range(num_jcrc)]
+    users.append({"user_id": 30_000, "name": "Admin", "role": "Admin", "cca": "No CCA", "block": None})
+    bookings = []
+    start = dt.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=14)
+    for n in range(history):
+        venue = VENUES[n % len(VENUES)]
+        # Spread each venue's bookings over three weeks without overlaps.
+        slot = start + timedelta(minutes=15 * ((n // len(VENUES)) * 8 + rng.randrange(4)))
+        status = rng.choice(["confirmed", "confirmed", "pending approval", "cancelled"])
+        bookings.append({
+            "booking_id": n + 1,
+            "user_id": rng.choice(users)["user_id"],
+            "venue_id": venue["venue_id"],
+            "booking_date": slot.isoformat(),
+            "duration": rng.choice(["0:30", "0:45", "1:00"]),
+            "status": status,
+            "reason": "seeded",
+            "calendar_event_id": None,
+        })
+    return {"venues": [dict(v) for v in VENUES], "users": users, "bookings": bookings}
+
+
+class Harness:
+    """Owns the bot, the fakes and the per-phase measurements."""
+
+    def __init__(self, tables, latency, timeout):
+        self.supabase = FakeSupabase(tables, latency=latency)
+        self.calendar = FakeCalendarService(latency=latency)
+        self.telegram = FakeTelegram(latency=latency)
+        self.timeout = timeout
+        apihelper.CUSTOM_REQUEST_SENDER = self.telegram
+
+        import main  # noqa: F401  (registers every handler)
+        import config
+        import calendar_helpers
+        import metrics
+        from calendar_sync import get_outbox
+        from dispatcher import dispatcher
+        from replica import replica
+        config.supabase.override(self.supabase)
+        calendar_helpers.calendar_service.override(self.calendar)
+        if replica is not None:
+            replica.full_sync()
+            replica.start()
+        self.bot = config.bot
+        self.outbox = get_outbox()
+        self.dispatcher = dispatcher
+
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._samples = []
+        self._samples_lock = threading.Lock()
+        metrics.add_observer(self._observe)
+
+    def _observe(self, kind, name, seconds, error):
+        if kind == "handler":
+            with self._samples_lock:
+                self._samples.append(seconds)
+
+    def deliver(self, user_id, update):
+        """Feeds one update to the bot and waits until this user's handlers have run."""
+        self.bot.process_new_updates([types.Update.de_json(update)])
+        done = threading.Event()
+        self.bot.executor.submit(user_id, done.set)
+        if not done.wait(self.timeout):
+            raise TimeoutError(f"handlers for user {user_id} did not finish in {self.timeout}s")
+
+    def settle(self):
+        """Waits for background work started by the phase (calendar sync, notifications)."""
+        while self.outbox.drain_once():
+            pass
+        deadline = time.monotonic() + self.timeout
+        while self.dispatcher.stats()["queued"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def counters(self):
+        calls = Counter({f"supabase.{k}": v for k, v in self.supabase.calls.items()})
+        calls.update({f"calendar.{k}": v for k, v in self.calendar.calls.items()})
+        calls.update({f"telegram.{k}": v for k, v in self.telegram.calls.items()})
+        return calls
+
+    def run_phase(self, name, jobs, clients):
+        """jobs: [(client, [op, ...])]; each client runs its ops in order, clients in parallel."""
+        with self._samples_lock:
+            self._samples = []
+        before = self.counters()
+        results = []
+        results_lock = threading.Lock()
+
+        def run_client(client, ops):
+            for op in ops:
+                begin = time.perf_counter()
+                try:
+                    outcome = getattr(client, op)()
+                except Exception as e:
+                    outcome = f"error: {e}"
+                with results_lock:
+                    results.append((op, outcome, time.perf_counter() - begin))
+
+        begin = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(clients, len(jobs)))) as pool:
+            for future in [pool.submit(run_client, client, ops) for client, ops in jobs]:
+                future.result()
+        wall = time.perf_counter() - begin
+        self.settle()
+        calls = self.counters() - before
+        with self._samples_lock:
+            samples = list(self._samples)
+
+        ops = len(results)
+        outcomes = Counter(outcome for _, outcome, _ in results)
+        return {
+            "ops": ops,
+            "ops_by_type": dict(Counter(op for op, _, _ in results)),
+            "outcomes": dict(outcomes),
+            "errors": sum(n for outcome, n in outcomes.items() if outcome.startswith("error")),
+            "wall_seconds": round(wall, 3),
+            "ops_per_second": round(ops / wall, 2) if wall else None,
+            "handler_calls": len(samples),
+            "handler_latency_ms": percentiles(samples),
+            "op_latency_ms": percentiles([seconds for _, _, seconds in results]),
+            "backend_calls": dict(sorted(calls.items())),
+            "backend_calls_per_op": {k: round(v / ops, 3) for k, v in sorted(calls.items())} if ops else {},
+        }
+
+
+class Client:
+    """One simulated Telegram user in a private chat with the bot."""
+
+    def __init__(self, harness, user_id, name, rng):
+        self.harness = harness
+        self.user_id = user_id
+        self.name = name
+        self.rng = rng
+        self.sender = {"id": user_id, "is_bot": False, "first_name": name}
+        self.chat = {"id": user_id, "type": "private"}
+
+    def _received_since(self, mark):
+        return self.harness.telegram.sent_to(self.user_id)[mark:]
+
+    def send(self, text):
+        mark = len(self.harness.telegram.sent_to(self.user_id))
+        message = {"message_id": next(self.harness._message_ids), "date": int(time.time()),
+                   "chat": self.chat, "from": self.sender, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.harness.deliver(self.user_id, {"update_id": next(self.harness._update_ids), "message": message})
+        return self._received_since(mark)
+
+    def press(self, record, data):
+        mark = len(self.harness.telegram.sent_to(self.user_id))
+        call = {
+            "id": str(next(self.harness._update_ids)), "from": self.sender, "chat_instance": str(self.user_id),
+            "data": data,
+            "message": {"message_id": record["message_id"], "date": int(time.time()), "chat": self.chat,
+                        "text": record["text"]},
+        }
+        self.harness.deliver(self.user_id, {"update_id": next(self.harness._update_ids), "callback_query": call})
+        return self._received_since(mark)
+
+    @staticmethod
+    def keyboard(received):
+        """(record, [callback_data]) of the newest inline keyboard, or (None, [])."""
+        for record in reversed(received):
+            rows = (record["markup"] or {}).get("inline_keyboard")
+            if rows:
+                return record, [b["callback_data"] for row in rows for b in row]
+        return None, []
+
+    @staticmethod
+    def reply_buttons(received):
+        for record in reversed(received):
+            rows = (record["markup"] or {}).get("keyboard")
+            if rows:
+                return [b["text"] if isinstance(b, dict) else b for row in rows for b in row]
+        return []
+
+    @staticmethod
+    def text(received):
+        return "\n".join(r["text"] for r in received)
+
+    # -- operations; each returns a short outcome label ----------------------
+
+    def register(self):
+        received = self.send("/start")
+        if "Welcome!" not in self.text(received):
+            return "already_registered"
+        received = self.send(self.name)
+        return "ok" if "now registered" in self.text(received) else "failed"
+
+    def start(self):
+        received = self.send("/start")
+        return "ok" if received else "no_reply"
+
+    def book(self):
+        venues = [v for v in self.reply_buttons(self.send("/book")) if not v.startswith("/")]
+        if not venues:
+            return "no_venues"
+        received = self.send(self.rng.choice(venues))
+        for _ in range(MAX_STEPS):
+            record, buttons = self.keyboard(received)
+            if record is None:
+                return "stuck"
+            if "confirm_duration" in buttons:
+                record, _ = self.keyboard(self.press(record, "confirm_duration"))
+                if record is None:
+                    return "stuck"
+                self.press(record, "repeat_0")
+                received = self.send("bench booking")
+                return "ok" if "has been placed" in self.text(received) else "failed"
+            durations = [b for b in buttons if b.startswith("pickdur_")]
+            starts = [b for b in buttons if b.startswith("pickstart_")]
+            # Skip today: most of its start times may already be in the past.
+            dates = [b for b in buttons if b.startswith("bookdate_")][1:]
+            choices = durations[:2] or starts or dates
+            if not choices:
+                return "stuck"
+            received = self.press(record, self.rng.choice(choices))
+        return "gave_up"
+
+    def _pick_listed(self, command, success):
+        received = self.send(command)
+        ids = BOOKING_ID.findall(self.text(received))
+        if not ids:
+            return "nothing_listed"
+        received = self.send(self.rng.choice(ids))
+        return "ok" if success in self.text(received) else "rejected"
+
+    def view(self):
+        return "ok" if self.send("/view") else "no_reply"
+
+    def cancel(self):
+        return self._pick_listed("/cancel", "cancelled successfully")
+
+    def approve(self):
+        return self._pick_listed("/approve", "approved")
+
+    def command(self, name):
+        return lambda: "ok" if self.send(f"/{name}") else "no_reply"
+
+    def __getattr__(self, attr):
+        # Replayed commands without a scripted flow are sent as-is.
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return self.command(attr)
+
+
+def parse_log(path):
+    """Returns ({user_id: [command, ...]}, {user_id: role}) from a bot_debug.log."""
+    sessions = defaultdict(list)
+    roles = {}
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = LOG_COMMAND.search(line)
+            if match:
+                sessions[int(match.group(1))].append(match.group(2))
+                continue
+            match = LOG_USER_INFO.search(line)
+            if match:
+                try:
+                    for row in ast.literal_eval(match.group(1)):
+                        roles[int(row["user_id"])] = row.get("role") or "Resident"
+                except (ValueError, SyntaxError, KeyError, TypeError):
+                    continue
+    return dict(sessions), roles
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_synthetic(args, rng):
+    num_jcrc = args.jcrc or max(1, args.users // 25)
+    harness = Harness(seed_tables(args.users, num_jcrc, args.history, rng), args.latency, args.timeout)
+    residents = [Client(harness, 10_000 + i, f"Resident {i}", random.Random(args.seed * 7919 + i))
+                 for i in range(args.users)]
+    jcrc = [Client(harness, 20_000 + i, f"JCRC {i}", random.Random(args.seed * 104729 + i)) for i in range(num_jcrc)]
+    newcomers = [Client(harness, 40_000 + i, f"Newcomer {i}", random.Random(args.seed + i))
+                 for i in range(max(1, args.users // 10))]
+    per_user = args.ops_per_user
+
+    plans = {
+        "register": lambda: [(c, ["register"]) for c in newcomers],
+        "start": lambda: [(c, ["start"] * per_user) for c in residents],
+        "book": lambda: [(c, ["book"] * per_user) for c in residents],
+        "view": lambda: [(c, ["view"] * per_user) for c in residents + jcrc],
+        "cancel": lambda: [(c, ["cancel"] * per_user) for c in residents[::2]],
+        # JCRC members share the approvals, as they do in practice.
+        "approve": lambda: [(c, ["approve"] * -(-args.users // (2 * len(jcrc)))) for c in jcrc],
+        "mixed": lambda: [(c, c.rng.choices(list(MIX), weights=list(MIX.values()), k=per_user * 4))
+                          for c in residents] + [(c, ["approve"] * per_user) for c in jcrc],
+    }
+    phases = {}
+    for name in args.phases:
+        phases[name] = harness.run_phase(name, plans[name](), args.clients or len(residents) + len(jcrc))
+        log_phase(name, phases[name])
+    return phases, {"users": args.users, "jcrc": num_jcrc, "history": args.history}
+
+
+def run_replay(args, rng):
+    sessions, roles = parse_log(args.replay)
+    if not sessions:
+        raise SystemExit(f"No '/command' lines found in {args.replay}")
+    tables = seed_tables(0, 0, args.history, rng)
+    tables["users"] = [{"user_id": uid, "name": f"User {uid}", "role": roles.get(uid, "Resident"),
+                        "cca": "No CCA", "block": None} for uid in sessions]
+    harness = Harness(tables, args.latency, args.timeout)
+    jobs = [(Client(harness, uid, f"User {uid}", random.Random(args.seed + uid)), commands * args.ops_per_user)
+            for uid, commands in sessions.items()]
+    phase = harness.run_phase("replay", jobs, args.clients or len(jobs))
+    log_phase("replay", phase)
+    return {"replay": phase}, {"log": args.replay, "sessions": len(sessions),
+                               "commands": sum(len(c) for c in sessions.values())}
+
+
+def log_phase(name, phase):
+    latency = phase["handler_latency_ms"]
+    calls = sum(phase["backend_calls_per_op"].get(k, 0) for k in phase["backend_calls_per_op"]
+                if k.startswith("supabase."))
+    print(f"{name:>9}: {phase['ops']:5d} ops {phase['ops_per_second'] or 0:8.1f} op/s  handler p50={latency['p50']}ms "
+          f"p95={latency['p95']}ms p99={latency['p99']}ms  supabase/op={calls:.2f}  errors={phase['errors']}",
+          file=sys.stderr)
+
+
+def compare(current, previous, max_regression):
+    """Prints per-phase changes; returns the regressions beyond max_regression percent."""
+    regressions = []
+    for name, phase in current["phases"].items():
+        old = previous.get("phases", {}).get(name)
+        if not old:
+            continue
+        pairs = [(f"handler p{q}", old["handler_latency_ms"][f"p{q}"], phase["handler_latency_ms"][f"p{q}"])
+                 for q in (50, 95, 99)]
+        pairs.append(("backend calls/op", sum(old["backend_calls_per_op"].values()),
+                      sum(phase["backend_calls_per_op"].values())))
+        for label, before, after in pairs:
+            if not before or after is None:
+                continue
+            change = 100.0 * (after - before) / before
+            print(f"{name:>9} {label:>17}: {before:10.3f} -> {after:10.3f} ({change:+.1f}%)", file=sys.stderr)
+            if max_regression is not None and change > max_regression:
+                regressions.append(f"{name} {label} {change:+.1f}%")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="simulated residents")
+    parser.add_argument("--jcrc", type=int, default=0, help="JCRC members (default: users/25, at least 1)")
+    parser.add_argument("--ops-per-user", type=int, default=1)
+    parser.add_argument("--history", type=int, default=400, help="bookings seeded before the run")
+    parser.add_argument("--phases", default=",".join(PHASES), type=lambda s: [p for p in s.split(",") if p])
+    parser.add_argument("--clients", type=int, default=0, help="users active at once (default: all)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every backend call")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--replica", action="store_true", help="serve reads from a local SQLite replica")
+    parser.add_argument("--replay", metavar="LOG", help="replay /command sessions from a bot_debug.log")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--output", metavar="JSON", help="write results here instead of stdout")
+    parser.add_argument("--compare", metavar="JSON", help="results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, help="exit 1 if a compared metric grows by more (percent)")
+    args = parser.parse_args(argv)
+    unknown = set(args.phases) - set(PHASES)
+    if unknown:
+        parser.error(f"unknown phases: {', '.join(sorted(unknown))}")
+
+    if args.replica:
+        os.environ["REPLICA_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "replica.sqlite3")
+    if args.tracemalloc:
+        tracemalloc.start()
+    rng = random.Random(args.seed)
+    started = time.time()
+    phases, workload = run_replay(args, rng) if args.replay else run_synthetic(args, rng)
+    result = {
+        "version": 1,
+        "git": git_commit(),
+        "started_at": dt.fromtimestamp(started).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "settings": {"latency": args.latency, "replica": args.replica, "seed": args.seed, "ops_per_user": args.ops_per_user,
+                     "clients": args.clients, **workload},
+        "phases": phases,
+        "memory": {
+            "peak_rss_kb": peak_rss_kb(),
+            "tracemalloc_peak_kb": tracemalloc.get_traced_memory()[1] // 1024 if args.tracemalloc else None,
+        },
+    }
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions: " + "; ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Focused checks of the recurring-series calendar logic that the load
+benchmark only exercises indirectly: the RRULE/EXDATE built from the gaps
+between occurrences, and the "<eventId>_YYYYMMDDTHHMMSSZ" instance IDs used
+to cancel single occurrences. Runs against the same in-process fakes.
+
+    python -m bench.series_checks
+
+Exits non-zero on the first failed check. Run from the repository root.
+"""
+import random
+import sys
+from datetime import datetime as dt, timedelta
+
+# bench.run sets the environment the bot reads at import time.
+from bench.run import Harness, seed_tables
+
+SERIES_ID = "0123456789abcdef"
+FIRST = dt(2030, 3, 4, 19, 0)  # a Monday, 19:00 at the hall
+
+
+def _bookings(day_offsets, start=FIRST, first_id=1):
+    return [{
+        "booking_id": first_id + i, "user_id": 10_000, "venue_id": 3, "series_id": SERIES_ID,
+        "booking_date": (start + timedelta(days=d)).isoformat(), "duration": "1:30",
+        "status": "confirmed", "reason": "practice", "calendar_event_id": None,
+    } for i, d in enumerate(day_offsets)]
+
+
+def _recurrence(day_offsets):
+    from calendar_helpers import build_series_event
+    return build_series_event(_bookings(day_offsets), {"name": "Dining Hall"})["recurrence"]
+
+
+def _expect(name, actual, expected):
+    if actual != expected:
+        print(f"FAIL {name}:\n  expected {expected!r}\n  got      {actual!r}")
+        sys.exit(1)
+    print(f"ok   {name}")
+
+
+def check_rules():
+    _expect("single occurrence", _recurrence([0]), ["RRULE:FREQ=DAILY;INTERVAL=1;COUNT=1"])
+    _expect("weekly", _recurrence([0, 7, 14]), ["RRULE:FREQ=WEEKLY;INTERVAL=1;COUNT=3"])
+    _expect("fortnightly", _recurrence([0, 14, 28]), ["RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=3"])
+    _expect("daily step", _recurrence([0, 3, 6, 9]), ["RRULE:FREQ=DAILY;INTERVAL=3;COUNT=4"])
+    # Gaps of 14 and 7 days: weekly from the first date, with week 1 excluded.
+    _expect("irregular weekly gaps", _recurrence([0, 14, 21]), [
+        "RRULE:FREQ=WEEKLY;INTERVAL=1;COUNT=4",
+        "EXDATE;TZID=Asia/Singapore:20300311T190000",
+    ])
+    # Gaps of 4 and 6 days share a 2-day step; days 2, 6 and 8 are excluded.
+    _expect("irregular daily gaps", _recurrence([0, 4, 10]), [
+        "RRULE:FREQ=DAILY;INTERVAL=2;COUNT=6",
+        "EXDATE;TZID=Asia/Singapore:20300306T190000,20300310T190000,20300312T190000",
+    ])
+
+
+def check_instance_suffix():
+    from calendar_helpers import instance_suffix
+    late = _bookings([0], start=dt(2030, 3, 4, 23, 30))[0]
+    _expect("late-evening SGT start stays on the same UTC day", instance_suffix(late), "_20300304T153000Z")
+    early = _bookings([0], start=dt(2030, 3, 5, 6, 30))[0]
+    _expect("early-morning SGT start falls on the previous UTC day", instance_suffix(early), "_20300304T223000Z")
+
+
+def check_instance_delete(harness):
+    """Cancelling one occurrence deletes exactly that instance of the recurring event."""
+    import repository
+    from calendar_sync import queue_add_series, queue_remove_instances
+    rows = repository.insert_bookings(_bookings([0, 7, 14], start=dt(2030, 3, 4, 23, 30), first_id=900))
+    queue_add_series(rows, {"name": "Dining Hall"})
+    while harness.outbox.drain_once():
+        pass
+    stored = {r["booking_id"]: r for r in repository.get_bookings([r["booking_id"] for r in rows])}
+    event_ids = {r["calendar_event_id"] for r in stored.values()}
+    _expect("series shares one recurring event", len(event_ids), 1)
+    master = event_ids.pop()
+
+    queue_remove_instances([stored[901]])
+    while harness.outbox.drain_once():
+        pass
+    events = harness.calendar.events_by_id
+    _expect("occurrence cancelled by instance ID", events.get(f"{master}_20300311T153000Z", {}).get("status"),
+            "cancelled")
+    _expect("recurring event kept", events[master].get("status"), "confirmed")
+
+
+def main():
+    # The harness swaps in the fakes; building events reads the booker from "Supabase".
+    harness = Harness(seed_tables(1, 0, 0, random.Random(0)), latency=0, timeout=10)
+    check_rules()
+    check_instance_suffix()
+    check_instance_delete(harness)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 from datetime import datetime as dt, timedelta
 from telebot import types
-from config import bot, user_booking_flow, TZ, supabase
-from db_helpers import parse_duration, get_all_venues, user_can_access_venue, get_user_info
-from booking_utils import check_start_conflict, check_conflict, create_booking
+from config import bot, user_booking_flow, TZ
+from db_helpers import get_accessible_venues, get_user_info
+from booking_utils import (check_start_conflict, check_conflict, create_booking, create_series,
+                           series_starts, check_series_conflicts, MAX_SERIES_OCCURRENCES)
+from availability import free_start_times, max_duration_from, format_duration
+from occupancy import occupancy
+
+DURATION_CHOICES = [timedelta(minutes=m) for m in (30, 60, 90, 120, 180, 240)]
+REPEAT_CHOICES = [("Just once", "repeat_0"), ("Weekly", "repeat_7"), ("Every 2 weeks", "repeat_14"),
+                  ("Every N days", "repeat_custom")]
 
 @bot.message_handler(commands=['book'])
 def book_command(message):
@@ -11,8 +18,7 @@ def book_command(message):
         if not user:
             bot.send_message(message.from_user.id, "Please /start first to register.")
             return
-        venues = get_all_venues()
-        accessible_venues = [v for v in venues if user_can_access_venue(user, v)]
+        accessible_venues = get_accessible_venues(user)
         if not accessible_venues:
             bot.send_message(user["user_id"], "No venues available for booking. Press /start to restart.")
             return
@@ -44,27 +50,12 @@ def handle_venue_selection(message):
         return
     flow_data["venue"] = chosen_venue
     flow_data["step"] = 2
+    user_booking_flow[user_id] = flow_data
 
     # Display confirmed bookings for the next 7 days
-    start_of_week = dt.now(TZ).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_of_week = start_of_week + timedelta(days=7)
-    response = supabase.table("bookings").select("*") \
-        .eq("venue_id", chosen_venue["venue_id"]) \
-        .eq("status", "confirmed") \
-        .gte("booking_date", start_of_week.strftime("%Y-%m-%d 00:00:00")) \
-        .lte("booking_date", end_of_week.strftime("%Y-%m-%d 23:59:59")) \
-        .execute()
-    bookings = response.data if response.data else []
-    if bookings:
-        msg = "Slots booked for this venue for the next 7 days:\n"
-        for b in bookings:
-            b_start = dt.fromisoformat(b['booking_date'])
-            b_date = b_start.strftime("%Y-%m-%d")
-            dur = parse_duration(b["duration"])
-            b_end = (b_start + dur).strftime("%H:%M")
-            b_start_str = b_start.strftime("%H:%M")
-            msg += f"Date: {b_date}, {b_start_str} - {b_end}\n"
-        bot.send_message(user_id, msg)
+    summary = occupancy.summary(chosen_venue["venue_id"])
+    if summary:
+        bot.send_message(user_id, summary)
     else:
         bot.send_message(user_id, f"No confirmed bookings for {chosen_venue['name']} in the next 7 days. Press /start to restart.")
     
@@ -94,12 +85,84 @@ def callback_booking_date(call):
         booking_date = dt.strptime(date_str, "%Y-%m-%d")
         flow_data["booking_date"] = booking_date
         flow_data["step"] = 3
+        user_booking_flow[user_id] = flow_data
         bot.edit_message_text(f"Date selected: {date_str}", call.message.chat.id, call.message.message_id)
-        msg = bot.send_message(user_id, "Enter start time (HH:MM in 24-hr format):")
-        bot.register_next_step_handler(msg, handle_start_time)
+        send_start_time_options(user_id, flow_data)
     except Exception:
         bot.answer_callback_query(call.id, "Invalid date selected. Press /start to restart.")
 
+def send_start_time_options(user_id, flow_data):
+    """
+    Offers every free 15-minute start on the chosen date as a button. Typing a
+    time still works, so the typed-input step handler stays registered.
+    """
+    now = dt.now(TZ).replace(tzinfo=None)
+    slots = free_start_times(flow_data["venue"]["venue_id"], flow_data["booking_date"].date(), now)
+    if not slots:
+        bot.send_message(user_id, "There are no free start times left on this date. Please pick another date.")
+        send_date_selection(user_id)
+        return
+    markup = types.InlineKeyboardMarkup(row_width=4)
+    markup.add(*[
+        types.InlineKeyboardButton(start.strftime("%H:%M"), callback_data=f"pickstart_{start.strftime('%H:%M')}")
+        for start, _ in slots
+    ])
+    msg = bot.send_message(user_id, "Tap a free start time, or enter one (HH:MM in 24-hr format):", reply_markup=markup)
+    bot.register_next_step_handler(msg, handle_start_time)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("pickstart_"))
+def callback_pick_start(call):
+    user_id = call.from_user.id
+    if user_id not in user_booking_flow:
+        bot.answer_callback_query(call.id, "Booking flow expired. Press /start to restart.")
+        return
+    flow_data = user_booking_flow[user_id]
+    # The typed-time handler is no longer wanted once a button is tapped.
+    bot.clear_step_handler_by_chat_id(call.message.chat.id)
+    start_time = dt.strptime(call.data.split("_")[1], "%H:%M").time()
+    if check_start_conflict(flow_data["venue"], dt.combine(flow_data["booking_date"].date(), start_time)):
+        bot.answer_callback_query(call.id, "That start time was just taken.")
+        send_start_time_options(user_id, flow_data)
+        return
+    flow_data["start_time"] = start_time
+    flow_data["step"] = 4
+    user_booking_flow[user_id] = flow_data
+    bot.edit_message_text(f"Start time confirmed as {start_time.strftime('%H:%M')}.", call.message.chat.id, call.message.message_id)
+    send_duration_options(user_id, flow_data)
+
+def send_duration_options(user_id, flow_data):
+    start_dt = dt.combine(flow_data["booking_date"].date(), flow_data["start_time"])
+    longest = max_duration_from(flow_data["venue"]["venue_id"], start_dt)
+    if not longest:
+        bot.send_message(user_id, "That start time is no longer free.")
+        send_start_time_options(user_id, flow_data)
+        return
+    choices = [d for d in DURATION_CHOICES if d <= longest]
+    if longest not in choices:
+        choices.append(longest)
+    markup = types.InlineKeyboardMarkup(row_width=4)
+    markup.add(*[
+        types.InlineKeyboardButton(format_duration(d), callback_data=f"pickdur_{format_duration(d)}")
+        for d in choices
+    ])
+    msg = bot.send_message(
+        user_id,
+        f"Tap a duration or enter one (H:MM). The longest free duration from {start_dt.strftime('%H:%M')} is {format_duration(longest)}.",
+        reply_markup=markup
+    )
+    bot.register_next_step_handler(msg, handle_duration)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("pickdur_"))
+def callback_pick_duration(call):
+    user_id = call.from_user.id
+    if user_id not in user_booking_flow:
+        bot.answer_callback_query(call.id, "Booking flow expired. Press /start to restart.")
+        return
+    bot.clear_step_handler_by_chat_id(call.message.chat.id)
+    duration_str = call.data.split("_")[1]
+    bot.edit_message_text(f"Duration selected: {duration_str}", call.message.chat.id, call.message.message_id)
+    propose_duration(user_id, user_booking_flow[user_id], duration_str)
+
 def handle_start_time(message):
     user_id = message.from_user.id
     if user_id not in user_booking_flow:
@@ -115,10 +178,11 @@ def handle_start_time(message):
             return
         proposed_dt = dt.combine(flow_data["booking_date"].date(), proposed_start)
         if check_start_conflict(flow_data["venue"], proposed_dt):
-            bot.send_message(user_id, "The specified start time conflicts with an existing confirmed booking. Exiting booking process.")
-            user_booking_flow.pop(user_id, None)
+            bot.send_message(user_id, "The specified start time conflicts with an existing confirmed booking.")
+            send_start_time_options(user_id, flow_data)
             return
         flow_data["proposed_start"] = proposed_start
+        user_booking_flow[user_id] = flow_data
         markup = types.InlineKeyboardMarkup()
         markup.add(
             types.InlineKeyboardButton("Confirm", callback_data="confirm_start"),
@@ -140,13 +204,12 @@ def handle_start_time_confirm(call):
     if call.data == "confirm_start":
         flow_data["start_time"] = flow_data["proposed_start"]
         flow_data["step"] = 4
+        user_booking_flow[user_id] = flow_data
         bot.edit_message_text(f"Start time confirmed as {flow_data['start_time'].strftime('%H:%M')}.", call.message.chat.id, call.message.message_id)
-        msg = bot.send_message(user_id, "Enter duration (H:MM):")
-        bot.register_next_step_handler(msg, handle_duration)
+        send_duration_options(user_id, flow_data)
     elif call.data == "reenter_start":
         bot.edit_message_text("Please re-enter start time (HH:MM):", call.message.chat.id, call.message.message_id)
-        msg = bot.send_message(user_id, "Input your new timing")
-        bot.register_next_step_handler(msg, handle_start_time)
+        send_start_time_options(user_id, flow_data)
     else:
         bot.edit_message_text("Booking process cancelled. Press /start to restart.", call.message.chat.id, call.message.message_id)
         user_booking_flow.pop(user_id, None)
@@ -156,37 +219,39 @@ def handle_duration(message):
     if user_id not in user_booking_flow:
         bot.send_message(user_id, "Booking flow expired. Please try /start again.")
         return
-    flow_data = user_booking_flow[user_id]
-    duration_str = message.text.strip()
     try:
-        parts = duration_str.split(":")
-        if len(parts) != 2:
-            raise ValueError("Invalid format")
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        total_minutes = hours * 60 + minutes
-        if total_minutes <= 0 or total_minutes % 15 != 0:
-            raise ValueError("Duration must be positive and in 15-minute increments")
-        if total_minutes > 1440:
-            raise ValueError("Duration cannot exceed 24 hours")
-        flow_data["proposed_duration"] = duration_str
-        start_dt = dt.combine(flow_data["booking_date"].date(), flow_data["start_time"])
-        end_dt = start_dt + timedelta(hours=hours, minutes=minutes)
-        if check_conflict(flow_data["venue"], start_dt, duration_str, user_id):
-            bot.send_message(user_id, "This time slot overlaps with an existing approved booking. Exiting booking process.")
-            user_booking_flow.pop(user_id, None)
-            return
-        markup = types.InlineKeyboardMarkup()
-        markup.add(
-            types.InlineKeyboardButton("Confirm", callback_data="confirm_duration"),
-            types.InlineKeyboardButton("Re-enter", callback_data="reenter_duration"),
-            types.InlineKeyboardButton("Exit", callback_data="exit_duration")
-        )
-        bot.send_message(user_id, f"You entered duration {duration_str} (ending at {end_dt.strftime('%H:%M')}). Confirm?", reply_markup=markup)
+        propose_duration(user_id, user_booking_flow[user_id], message.text.strip())
     except ValueError as ve:
         bot.send_message(user_id, f"Invalid duration format: {ve}. Please try again.")
         bot.register_next_step_handler(message, handle_duration)
 
+def propose_duration(user_id, flow_data, duration_str):
+    parts = duration_str.split(":")
+    if len(parts) != 2:
+        raise ValueError("Invalid format")
+    hours = int(parts[0])
+    minutes = int(parts[1])
+    total_minutes = hours * 60 + minutes
+    if total_minutes <= 0 or total_minutes % 15 != 0:
+        raise ValueError("Duration must be positive and in 15-minute increments")
+    if total_minutes > 1440:
+        raise ValueError("Duration cannot exceed 24 hours")
+    flow_data["proposed_duration"] = duration_str
+    user_booking_flow[user_id] = flow_data
+    start_dt = dt.combine(flow_data["booking_date"].date(), flow_data["start_time"])
+    end_dt = start_dt + timedelta(hours=hours, minutes=minutes)
+    if check_conflict(flow_data["venue"], start_dt, duration_str, user_id):
+        bot.send_message(user_id, "This time slot overlaps with an existing approved booking.")
+        send_duration_options(user_id, flow_data)
+        return
+    markup = types.InlineKeyboardMarkup()
+    markup.add(
+        types.InlineKeyboardButton("Confirm", callback_data="confirm_duration"),
+        types.InlineKeyboardButton("Re-enter", callback_data="reenter_duration"),
+        types.InlineKeyboardButton("Exit", callback_data="exit_duration")
+    )
+    bot.send_message(user_id, f"You entered duration {duration_str} (ending at {end_dt.strftime('%H:%M')}). Confirm?", reply_markup=markup)
+
 @bot.callback_query_handler(func=lambda call: call.data in ["confirm_duration", "reenter_duration", "exit_duration"])
 def handle_duration_confirm(call):
     user_id = call.from_user.id
@@ -196,17 +261,142 @@ def handle_duration_confirm(call):
     flow_data = user_booking_flow[user_id]
     if call.data == "confirm_duration":
         flow_data["duration"] = flow_data["proposed_duration"]
+        user_booking_flow[user_id] = flow_data
         bot.edit_message_text(f"Duration confirmed as {flow_data['duration']}.", call.message.chat.id, call.message.message_id)
-        bot.send_message(user_id, "Enter a short reason for booking the venue:")
-        bot.register_next_step_handler(call.message, handle_reason)
+        markup = types.InlineKeyboardMarkup(row_width=2)
+        markup.add(*[types.InlineKeyboardButton(label, callback_data=data) for label, data in REPEAT_CHOICES])
+        bot.send_message(user_id, "Repeat this booking?", reply_markup=markup)
     elif call.data == "reenter_duration":
         bot.edit_message_text("Please re-enter duration (H:MM):", call.message.chat.id, call.message.message_id)
-        msg = bot.send_message(user_id, "Input your duration again")
-        bot.register_next_step_handler(msg, handle_duration)
+        send_duration_options(user_id, flow_data)
+    else:
+        bot.edit_message_text("Booking process cancelled. Please try /start again.", call.message.chat.id, call.message.message_id)
+        user_booking_flow.pop(user_id, None)
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("repeat_"))
+def callback_repeat(call):
+    user_id = call.from_user.id
+    if user_id not in user_booking_flow:
+        bot.answer_callback_query(call.id, "Booking flow expired. Press /start to restart.")
+        return
+    flow_data = user_booking_flow[user_id]
+    flow_data.pop("series_starts", None)
+    user_booking_flow[user_id] = flow_data
+    if call.data == "repeat_0":
+        bot.edit_message_text("This booking does not repeat.", call.message.chat.id, call.message.message_id)
+        bot.send_message(user_id, "Enter a short reason for booking the venue:")
+        bot.register_next_step_handler(call.message, handle_reason)
+    elif call.data == "repeat_custom":
+        bot.edit_message_text("Repeat every how many days? (e.g. 3)", call.message.chat.id, call.message.message_id)
+        bot.register_next_step_handler(call.message, handle_repeat_interval)
+    else:
+        ask_repeat_until(user_id, flow_data, int(call.data.split("_")[1]), call.message)
+
+def handle_repeat_interval(message):
+    user_id = message.from_user.id
+    if user_id not in user_booking_flow:
+        bot.send_message(user_id, "Booking flow expired. Please try /start again.")
+        return
+    try:
+        every_days = int(message.text.strip())
+        if not 1 <= every_days <= 365:
+            raise ValueError
+    except ValueError:
+        bot.send_message(user_id, "Please enter a whole number of days between 1 and 365.")
+        bot.register_next_step_handler(message, handle_repeat_interval)
+        return
+    ask_repeat_until(user_id, user_booking_flow[user_id], every_days, message)
+
+def ask_repeat_until(user_id, flow_data, every_days, message):
+    flow_data["every_days"] = every_days
+    user_booking_flow[user_id] = flow_data
+    bot.send_message(user_id, "Repeat until which date? (YYYY-MM-DD, inclusive)")
+    bot.register_next_step_handler(message, handle_repeat_until)
+
+def handle_repeat_until(message):
+    user_id = message.from_user.id
+    if user_id not in user_booking_flow:
+        bot.send_message(user_id, "Booking flow expired. Please try /start again.")
+        return
+    flow_data = user_booking_flow[user_id]
+    first_start = dt.combine(flow_data["booking_date"].date(), flow_data["start_time"])
+    try:
+        until = dt.strptime(message.text.strip(), "%Y-%m-%d").date()
+    except ValueError:
+        bot.send_message(user_id, "Invalid date format. Please try again (YYYY-MM-DD).")
+        bot.register_next_step_handler(message, handle_repeat_until)
+        return
+    if until <= first_start.date():
+        bot.send_message(user_id, f"The end date must be after {first_start.strftime('%Y-%m-%d')}. Please try again.")
+        bot.register_next_step_handler(message, handle_repeat_until)
+        return
+    starts = series_starts(first_start, flow_data["every_days"], until)
+    clashes = set(check_series_conflicts(flow_data["venue"], starts, flow_data["duration"]))
+    free = [s for s in starts if s not in clashes]
+    if not free:
+        bot.send_message(user_id, "Every date in this series overlaps an existing approved booking. Press /start to restart.")
+        user_booking_flow.pop(user_id, None)
+        return
+    flow_data["series_starts"] = free
+    user_booking_flow[user_id] = flow_data
+    msg = (f"{len(free)} bookings from {free[0].strftime('%Y-%m-%d')} to {free[-1].strftime('%Y-%m-%d')}, "
+           f"{first_start.strftime('%H:%M')} for {flow_data['duration']} each.")
+    if len(starts) == MAX_SERIES_OCCURRENCES:
+        msg += f"\nA series is limited to {MAX_SERIES_OCCURRENCES} bookings."
+    if clashes:
+        msg += ("\nThese dates overlap existing approved bookings and will be skipped: " +
+                ", ".join(s.strftime("%Y-%m-%d") for s in sorted(clashes)) + ".")
+    markup = types.InlineKeyboardMarkup()
+    markup.add(
+        types.InlineKeyboardButton("Confirm", callback_data="confirm_series"),
+        types.InlineKeyboardButton("Exit", callback_data="exit_series")
+    )
+    bot.send_message(user_id, msg + "\nConfirm?", reply_markup=markup)
+
+@bot.callback_query_handler(func=lambda call: call.data in ["confirm_series", "exit_series"])
+def handle_series_confirm(call):
+    user_id = call.from_user.id
+    if user_id not in user_booking_flow:
+        bot.answer_callback_query(call.id, "Booking flow expired.")
+        return
+    if call.data == "confirm_series":
+        bot.edit_message_text("Series confirmed.", call.message.chat.id, call.message.message_id)
+        bot.send_message(user_id, "Enter a short reason for booking the venue:")
+        bot.register_next_step_handler(call.message, handle_reason)
     else:
         bot.edit_message_text("Booking process cancelled. Please try /start again.", call.message.chat.id, call.message.message_id)
         user_booking_flow.pop(user_id, None)
 
+def place_series(user_id, flow_data, reason):
+    venue = flow_data["venue"]
+    # Dates may have been taken since the summary was shown; re-check them all in one pass.
+    clashes = set(check_series_conflicts(venue, flow_data["series_starts"], flow_data["duration"]))
+    starts = [s for s in flow_data["series_starts"] if s not in clashes]
+    bookings = create_series(
+        user_id=user_id,
+        venue=venue,
+        starts=starts,
+        duration_text=flow_data["duration"],
+        user_role=flow_data["user"]["role"],
+        reason=reason
+    ) if starts else []
+    user_booking_flow.pop(user_id, None)
+    if not bookings:
+        bot.send_message(user_id, "Your bookings could not be saved. Please try /book again.")
+        return
+    first, last = bookings[0], bookings[-1]
+    msg = (f"{len(bookings)} bookings for {venue['name']} from {first.date_text} to {last.date_text}, "
+           f"{first.start_hm} to {first.end_hm}, have been placed.\n")
+    if clashes:
+        msg += ("These dates were taken in the meantime and were skipped: " +
+                ", ".join(s.strftime("%Y-%m-%d") for s in sorted(clashes)) + ".\n")
+    if first.status == "pending approval":
+        msg += "They are pending approval by JCRC."
+    else:
+        msg += "They are confirmed."
+    msg += "\nPress /start to restart the process."
+    bot.send_message(user_id, msg)
+
 def handle_reason(message):
     user_id = message.from_user.id
     if user_id not in user_booking_flow:
@@ -215,9 +405,12 @@ def handle_reason(message):
     flow_data = user_booking_flow[user_id]
     reason = message.text.strip()
     flow_data["reason"] = reason
+    if flow_data.get("series_starts"):
+        place_series(user_id, flow_data, reason)
+        return
     venue = flow_data["venue"]
     booking_start = dt.combine(flow_data["booking_date"].date(), flow_data["start_time"])
-    create_booking(
+    booking = create_booking(
         user_id=user_id,
         venue=venue,
         booking_start=booking_start,
@@ -225,10 +418,11 @@ def handle_reason(message):
         user_role=flow_data["user"]["role"],
         reason=reason
     )
-    display_date = booking_start.strftime("%Y-%m-%d")
-    display_start = flow_data["start_time"].strftime("%H:%M")
-    display_end = (booking_start + parse_duration(flow_data["duration"])).strftime("%H:%M")
-    msg = (f"Booking for {venue['name']} on {display_date} from {display_start} to {display_end} has been placed.\n")
+    if booking is None:
+        bot.send_message(user_id, "Your booking could not be saved. Please try /book again.")
+        user_booking_flow.pop(user_id, None)
+        return
+    msg = (f"Booking for {venue['name']} on {booking.date_text} from {booking.start_hm} to {booking.end_hm} has been placed.\n")
     if (flow_data["user"]["role"].strip().lower() != "jcrc" and 
         venue["name"].strip().lower() in ["reading room", "dining hall"]):
         msg += "It is pending approval by JCRC."
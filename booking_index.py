@@ -0,0 +1,201 @@
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from config import logger
+from booking_model import as_booking, decode_rows, MAX_DURATION_MINUTES
+import repository
+
+
+class VenueIntervalIndex:
+    """
+    Confirmed bookings of a single venue, kept sorted by start time.
+    prefix_max_end[i] is the latest end among the first i+1 intervals, which
+    lets overlap and point queries be answered with one bisect.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.entries = []
+        self.prefix_max_end = []
+        self.by_booking_id = {}
+
+    def _rebuild_prefix(self, from_pos=0):
+        current = self.prefix_max_end[from_pos - 1] if from_pos > 0 else None
+        del self.prefix_max_end[from_pos:]
+        for start, end, _ in self.entries[from_pos:]:
+            current = end if current is None or end > current else current
+            self.prefix_max_end.append(current)
+
+    def add(self, booking_id, start, end):
+        if booking_id in self.by_booking_id:
+            self.remove(booking_id)
+        entry = (start, end, booking_id)
+        pos = bisect_right(self.entries, entry)
+        self.entries.insert(pos, entry)
+        self.starts.insert(pos, start)
+        self.by_booking_id[booking_id] = entry
+        self._rebuild_prefix(pos)
+
+    def remove(self, booking_id):
+        entry = self.by_booking_id.pop(booking_id, None)
+        if entry is None:
+            return False
+        pos = bisect_left(self.entries, entry)
+        del self.entries[pos]
+        del self.starts[pos]
+        self._rebuild_prefix(pos)
+        return True
+
+    def overlaps(self, start, end):
+        # Only intervals starting before `end` can overlap; among them one
+        # does iff the latest end reaches past `start`.
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.prefix_max_end[i - 1] > start
+
+    def overlapping(self, start, end):
+        """Returns (start, end, booking_id) of every interval overlapping [start, end)."""
+        found = []
+        j = bisect_left(self.starts, end) - 1
+        # prefix_max_end never increases going left, so stop once it falls behind `start`.
+        while j >= 0 and self.prefix_max_end[j] > start:
+            if self.entries[j][1] > start:
+                found.append(self.entries[j])
+            j -= 1
+        found.reverse()
+        return found
+
+    def starting_between(self, start, end):
+        """Returns intervals whose start lies in [start, end), in start order."""
+        return self.entries[bisect_left(self.starts, start):bisect_left(self.starts, end)]
+
+    def covers(self, point):
+        i = bisect_right(self.starts, point)
+        return i > 0 and self.prefix_max_end[i - 1] > point
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_indexes = {}
+_lock = threading.RLock()
+_listeners = []
+
+
+def subscribe(listener):
+    """
+    Registers listener(event, booking), called with "added" or "removed" for
+    every confirmed booking that enters or leaves the index.
+    """
+    _listeners.append(listener)
+
+
+def _notify(event, booking):
+    for listener in _listeners:
+        try:
+            listener(event, booking)
+        except Exception:
+            logger.exception(f"Booking index listener failed on {event}:")
+
+
+def booking_interval(booking):
+    """
+    (start, end) the booking blocks. A duration that cannot be parsed or is
+    longer than MAX_DURATION_MINUTES blocks MAX_DURATION_MINUTES, so such a
+    row neither blocks everything after it nor, at zero length, nothing.
+    """
+    booking = as_booking(booking)
+    if booking.valid:
+        return booking.start, booking.end
+    return booking.start, booking.start + timedelta(minutes=MAX_DURATION_MINUTES)
+
+
+def _indexed_interval(booking):
+    if not booking.valid:
+        logger.error(f"Indexing booking {booking.booking_id} with invalid duration {booking.get('duration')!r} "
+                     f"as {MAX_DURATION_MINUTES} minutes")
+    return booking_interval(booking)
+
+
+def _load_venue(venue_id):
+    index = VenueIntervalIndex()
+    # Bookings that ended before the process started can never conflict with new ones.
+    since = repository.window_start(repository.local_now())
+    for b in decode_rows(repository.confirmed_bookings_for_venue(venue_id, since=since)):
+        index.add(b.booking_id, *_indexed_interval(b))
+    return index
+
+
+def get_venue_index(venue_id):
+    """
+    Returns the interval index for the venue, loading its confirmed bookings
+    through the repository the first time the venue is queried.
+    """
+    key = str(venue_id)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _load_venue(venue_id)
+            _indexes[key] = index
+        return index
+
+
+def has_overlap(venue_id, start, end):
+    with _lock:
+        return get_venue_index(venue_id).overlaps(start, end)
+
+
+def conflicting_intervals(venue_id, intervals):
+    """
+    Checks many (start, end) intervals against the venue in one pass under a
+    single lock; returns the positions of those that overlap a confirmed booking.
+    """
+    with _lock:
+        index = get_venue_index(venue_id)
+        return [i for i, (start, end) in enumerate(intervals) if index.overlaps(start, end)]
+
+
+def is_occupied(venue_id, point):
+    with _lock:
+        return get_venue_index(venue_id).covers(point)
+
+
+def intervals_between(venue_id, start, end):
+    with _lock:
+        return get_venue_index(venue_id).overlapping(start, end)
+
+
+def intervals_starting_between(venue_id, start, end):
+    with _lock:
+        return get_venue_index(venue_id).starting_between(start, end)
+
+
+def add_booking(booking):
+    """
+    Records a confirmed booking. Venues that have not been loaded yet are left
+    alone; their first query reads the booking from Supabase anyway.
+    """
+    booking = as_booking(booking)
+    start, end = _indexed_interval(booking)
+    with _lock:
+        index = _indexes.get(str(booking.venue_id))
+        if index is not None:
+            index.add(booking.booking_id, start, end)
+    _notify("added", booking)
+
+
+def remove_booking(booking):
+    booking = as_booking(booking)
+    with _lock:
+        index = _indexes.get(str(booking.venue_id))
+        if index is not None:
+            index.remove(booking.booking_id)
+    if booking.status == "confirmed":
+        _notify("removed", booking)
+
+
+def reset(venue_id=None):
+    with _lock:
+        if venue_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(str(venue_id), None)
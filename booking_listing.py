@@ -0,0 +1,67 @@
+from db_helpers import get_user_names
+from venue_catalog import catalog
+from booking_model import as_booking, decode_rows
+
+# Telegram rejects messages longer than this.
+MAX_MESSAGE_LENGTH = 4096
+# Listings fetch and show at most this many bookings, soonest first.
+LISTING_LIMIT = 30
+
+def format_booking(booking, venue_name, user_name):
+    booking = as_booking(booking)
+    return (
+        f"Booking ID: {booking.booking_id}\n"
+        f"Venue: {venue_name}\n"
+        f"Name: {user_name}\n"
+        f"Start: {booking.start_text}\n"
+        f"End: {booking.end_text if booking.valid else 'invalid duration ' + repr(booking.get('duration'))}\n"
+        f"Status: {booking.status}\n"
+        f"Reason: {booking.get('reason', '')}\n"
+        + (f"Series: {booking.series_id[:8]}\n" if booking.series_id else "")
+        + "----------------------"
+    )
+
+def render_bookings(bookings):
+    """
+    Formats each booking as a listing block. Only the users referenced by the
+    given bookings are looked up; venue names come from the catalog.
+    """
+    bookings = decode_rows(bookings)
+    names = get_user_names({b.user_id for b in bookings})
+    return [
+        format_booking(
+            b,
+            catalog.name_of(b.venue_id),
+            names.get(str(b.user_id), "Unknown User")
+        )
+        for b in bookings
+    ]
+
+def listing_messages(bookings, header="", footer=""):
+    """
+    Listing messages for bookings fetched with limit=LISTING_LIMIT + 1; the
+    extra row only tells that the list was cut short.
+    """
+    blocks = render_bookings(bookings[:LISTING_LIMIT])
+    if len(bookings) > LISTING_LIMIT:
+        blocks.append(f"Showing the first {LISTING_LIMIT} upcoming bookings.")
+    if footer:
+        blocks.append(footer)
+    return chunk_messages(header, blocks)
+
+def chunk_messages(header, blocks, limit=MAX_MESSAGE_LENGTH):
+    """
+    Joins header and blocks with newlines into as few messages as fit in
+    `limit` characters each; the header starts the first one.
+    """
+    messages = []
+    current = header
+    for block in blocks:
+        if current and len(current) + 1 + len(block) > limit:
+            messages.append(current)
+            current = block
+        else:
+            current = f"{current}\n{block}" if current else block
+    if current:
+        messages.append(current)
+    return messages
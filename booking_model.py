@@ -0,0 +1,147 @@
+from datetime import datetime as dt, timedelta
+from config import logger
+
+_EPOCH = dt(1970, 1, 1)
+_EPOCH_DAY = _EPOCH.toordinal()
+# Longest duration the booking flow accepts; longer rows are flagged invalid.
+MAX_DURATION_MINUTES = 24 * 60
+# Bookings in these states no longer hold their slot and cannot change again.
+INACTIVE_STATUSES = ("cancelled", "expired")
+
+
+def duration_minutes(text):
+    """Parses "H:MM" (hours may be zero-padded or large) into minutes."""
+    hours, sep, minutes = str(text).strip().partition(":")
+    if not sep:
+        raise ValueError(f"Invalid duration: {text!r}")
+    hours, minutes = int(hours), int(minutes)
+    if hours < 0 or not 0 <= minutes < 60:
+        raise ValueError(f"Invalid duration: {text!r}")
+    return hours * 60 + minutes
+
+
+def check_duration(text):
+    """
+    Minutes of a duration the booking flow may store: positive and at most
+    MAX_DURATION_MINUTES. Raises ValueError otherwise.
+    """
+    minutes = duration_minutes(text)
+    if not 0 < minutes <= MAX_DURATION_MINUTES:
+        raise ValueError(f"Duration out of range: {text!r}")
+    return minutes
+
+
+def to_minute(value):
+    """Minutes since 1970-01-01 of a naive wall-clock datetime."""
+    return (value.toordinal() - _EPOCH_DAY) * 1440 + value.hour * 60 + value.minute
+
+
+class Booking:
+    """
+    A bookings row decoded once: start and end are kept as epoch minutes, and
+    the end datetime and display strings are built on first use and kept.
+    Item access (booking["status"], booking.get("reason")) reads the original
+    row, so a Booking can be passed wherever a row dict was.
+
+    `valid` is False when the duration cannot be parsed (the booking is then
+    treated as zero-length, as before) or exceeds MAX_DURATION_MINUTES. Such
+    bookings are never created or approved; the booking index blocks
+    MAX_DURATION_MINUTES for existing ones, feeds leave them out and listings
+    flag them.
+    """
+
+    __slots__ = ("row", "booking_id", "user_id", "venue_id", "status", "series_id", "start_minute", "end_minute",
+                 "valid", "_start", "_end", "_start_text", "_end_text")
+
+    def __init__(self, row):
+        booking_date = dt.fromisoformat(row["booking_date"])
+        if booking_date.tzinfo is not None or booking_date.second or booking_date.microsecond:
+            booking_date = booking_date.replace(tzinfo=None, second=0, microsecond=0)
+        start = to_minute(booking_date)
+        try:
+            minutes = duration_minutes(row["duration"])
+            valid = 0 < minutes <= MAX_DURATION_MINUTES
+        except (ValueError, TypeError, KeyError):
+            minutes, valid = 0, False
+        self.row = row
+        self.booking_id = row.get("booking_id")
+        self.user_id = row.get("user_id")
+        self.venue_id = row.get("venue_id")
+        self.status = row.get("status")
+        self.series_id = row.get("series_id")
+        self.start_minute = start
+        self.end_minute = start + minutes
+        self.valid = valid
+        self._start = booking_date
+        self._end = self._start_text = self._end_text = None
+
+    @property
+    def duration_minutes(self):
+        return self.end_minute - self.start_minute
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        if self._end is None:
+            self._end = self._start + timedelta(minutes=self.end_minute - self.start_minute)
+        return self._end
+
+    @property
+    def start_text(self):
+        """ "YYYY-MM-DD HH:MM" """
+        if self._start_text is None:
+            self._start_text = _format(self.start)
+        return self._start_text
+
+    @property
+    def end_text(self):
+        if self._end_text is None:
+            self._end_text = _format(self.end)
+        return self._end_text
+
+    @property
+    def date_text(self):
+        return self.start_text[:10]
+
+    @property
+    def start_hm(self):
+        return self.start_text[11:]
+
+    @property
+    def end_hm(self):
+        return self.end_text[11:]
+
+    def __getitem__(self, key):
+        return self.row[key]
+
+    def get(self, key, default=None):
+        return self.row.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.row
+
+    def __repr__(self):
+        return f"<Booking {self.booking_id} venue={self.venue_id} {self.status} {self.start_text}-{self.end_hm}>"
+
+
+def _format(value):
+    return value.isoformat(" ", "minutes")
+
+
+def as_booking(row):
+    """Returns row as a Booking, decoding it unless it already is one."""
+    return row if isinstance(row, Booking) else Booking(row)
+
+
+def decode_rows(rows):
+    """Decodes rows into Bookings, skipping (and logging) rows with an unreadable booking_date."""
+    bookings = []
+    for row in rows or []:
+        try:
+            bookings.append(as_booking(row))
+        except (ValueError, TypeError, KeyError):
+            logger.error(f"Skipping booking {row.get('booking_id')} with unreadable booking_date {row.get('booking_date')!r}")
+    return bookings
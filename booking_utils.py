@@ -1,18 +1,44 @@
-from datetime import timedelta, datetime as dt
-from config import supabase
-from calendar_helpers import add_event_to_calendar, remove_event_from_calendar
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime as dt, timedelta
+from config import logger
+import repository
+import booking_index
+from booking_index import VenueIntervalIndex
+from calendar_sync import queue_add_event, queue_add_series, queue_remove_events, queue_remove_instances
 from db_helpers import parse_duration
-from notifications import notify_jcrc_of_new_request
+from booking_model import as_booking, decode_rows, check_duration, INACTIVE_STATUSES
+from notifications import notify_jcrc_of_new_request, notify_jcrc_of_new_series
+from venue_catalog import catalog
 
-def create_booking(user_id, venue, booking_start, duration_text, user_role, reason):
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# Two semesters of weekly bookings.
+MAX_SERIES_OCCURRENCES = 52
+
+def booking_status(venue, user_role):
     venue_name = venue["name"].strip().lower()
     if venue_name in ["reading room", "dining hall"]:
-        status = "confirmed" if user_role.strip().lower() == "jcrc" else "pending approval"
+        return "confirmed" if user_role.strip().lower() == "jcrc" else "pending approval"
     elif venue_name in ["mpsh", "band room"]:
-        status = "confirmed"
-    else:
-        status = "pending approval"
-    
+        return "confirmed"
+    return "pending approval"
+
+def _storable_duration(duration_text):
+    # The booking index can only keep a booking from being double-booked
+    # when its duration parses and is within MAX_DURATION_MINUTES.
+    try:
+        check_duration(duration_text)
+        return True
+    except (ValueError, TypeError):
+        logger.error(f"Refusing to store a booking with invalid duration {duration_text!r}")
+        return False
+
+def create_booking(user_id, venue, booking_start, duration_text, user_role, reason):
+    if not _storable_duration(duration_text):
+        return None
+    status = booking_status(venue, user_role)
+    venue_name = venue["name"].strip().lower()
     booking_start_str = booking_start.strftime("%Y-%m-%d %H:%M:%S")
     data = {
         "user_id": user_id,
@@ -22,76 +48,191 @@ def create_booking(user_id, venue, booking_start, duration_text, user_role, reas
         "status": status,
         "reason": reason
     }
-    supabase.table("bookings").insert(data).execute()
-    result = supabase.table("bookings").select("*") \
-        .eq("user_id", user_id) \
-        .eq("venue_id", venue["venue_id"]) \
-        .eq("booking_date", booking_start_str) \
-        .eq("duration", duration_text) \
-        .eq("reason", reason) \
-        .execute()
-    new_booking_data = result.data[0] if result.data else None
-    if new_booking_data and status == "confirmed":
-        event_id = add_event_to_calendar(new_booking_data, venue)
-        supabase.table("bookings").update({"calendar_event_id": event_id}).eq("booking_id", new_booking_data["booking_id"]).execute()
-    if venue_name in ["reading room", "dining hall"] and status == "pending approval":
-        result = supabase.table("bookings").select("*") \
-            .eq("user_id", user_id) \
-            .eq("venue_id", venue["venue_id"]) \
-            .eq("booking_date", booking_start_str) \
-            .eq("status", "pending approval") \
-            .eq("reason", reason) \
-            .execute()
-        new_booking_data = result.data[0] if result.data else None
-        if new_booking_data: 
-            print(new_booking_data)
-            notify_jcrc_of_new_request(new_booking_data)
+    row = repository.insert_booking(data)
+    if not row:
+        return None
+    # Decoded once here and shared by the index, calendar and notification paths.
+    new_booking = as_booking(row)
+    if status == "confirmed":
+        booking_index.add_booking(new_booking)
+        # The calendar sync worker creates the event and writes back calendar_event_id.
+        queue_add_event(new_booking, venue)
+    elif venue_name in ["reading room", "dining hall"]:
+        notify_jcrc_of_new_request(new_booking)
+    return new_booking
+
+def series_starts(first_start, every_days, until):
+    """
+    Start times from first_start repeating every `every_days` days up to and
+    including the date `until`, at most MAX_SERIES_OCCURRENCES of them.
+    """
+    starts = []
+    current = first_start
+    while current.date() <= until and len(starts) < MAX_SERIES_OCCURRENCES:
+        starts.append(current)
+        current += timedelta(days=every_days)
+    return starts
+
+def check_series_conflicts(venue, starts, duration_text):
+    """Returns the starts among `starts` whose slot overlaps a confirmed booking, in one index pass."""
+    length = parse_duration(duration_text)
+    clashes = booking_index.conflicting_intervals(venue["venue_id"], [(s, s + length) for s in starts])
+    return [starts[i] for i in clashes]
+
+def create_series(user_id, venue, starts, duration_text, user_role, reason):
+    """
+    Books every start in `starts` with one bulk insert, linking the rows by a
+    new series_id. Confirmed series get one recurring calendar event; pending
+    ones send the JCRC one request for the whole series. Returns the bookings.
+    """
+    if not _storable_duration(duration_text):
+        return []
+    status = booking_status(venue, user_role)
+    series_id = str(uuid.uuid4())
+    rows = repository.insert_bookings([
+        {
+            "user_id": user_id,
+            "venue_id": venue["venue_id"],
+            "booking_date": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "duration": duration_text,
+            "status": status,
+            "reason": reason,
+            "series_id": series_id,
+        }
+        for start in starts
+    ])
+    bookings = sorted(decode_rows(rows), key=lambda b: b.start)
+    if not bookings:
+        return []
+    if status == "confirmed":
+        for booking in bookings:
+            booking_index.add_booking(booking)
+        queue_add_series(bookings, venue)
+    elif venue["name"].strip().lower() in ["reading room", "dining hall"]:
+        notify_jcrc_of_new_series(bookings)
+    return bookings
 
 def check_conflict(venue, new_booking_start, duration_text, user_id):
-    new_duration = parse_duration(duration_text)
-    new_booking_end = new_booking_start + new_duration
-    response = supabase.table("bookings").select("*") \
-        .eq("venue_id", venue["venue_id"]) \
-        .eq("status", "confirmed") \
-        .execute()
-    bookings = response.data if response.data else []
-    for b in bookings:
-        confirmed_start = dt.fromisoformat(b["booking_date"])
-        try:
-            confirmed_duration = parse_duration(b["duration"])
-        except Exception:
-            confirmed_duration = timedelta(0)
-        confirmed_end = confirmed_start + confirmed_duration
-        if new_booking_start < confirmed_end and new_booking_end > confirmed_start:
-            return True
-    return False
+    new_booking_end = new_booking_start + parse_duration(duration_text)
+    return booking_index.has_overlap(venue["venue_id"], new_booking_start, new_booking_end)
 
 def check_start_conflict(venue, proposed_start):
-    response = supabase.table("bookings").select("*") \
-        .eq("venue_id", venue["venue_id"]) \
-        .eq("status", "confirmed") \
-        .execute()
-    bookings = response.data if response.data else []
-    for b in bookings:
-        confirmed_start = dt.fromisoformat(b["booking_date"])
-        try:
-            confirmed_duration = parse_duration(b["duration"])
-        except Exception:
-            confirmed_duration = timedelta(0)
-        confirmed_end = confirmed_start + confirmed_duration
-        if confirmed_start <= proposed_start < confirmed_end:
-            return True
-    return False
+    return booking_index.is_occupied(venue["venue_id"], proposed_start)
 
 def cancel_booking(booking_id, user_id, is_admin=False):
-    query = supabase.table("bookings").select("*").eq("booking_id", booking_id)
-    if not is_admin:
-        query = query.eq("user_id", user_id)
-    result = query.execute()
-    if not result.data:
-        return False
-    booking = result.data[0]
-    supabase.table("bookings").update({"status": "cancelled"}).eq("booking_id", booking_id).execute()
-    if booking.get("calendar_event_id"):
-        remove_event_from_calendar(booking["calendar_event_id"])
-    return True
\ No newline at end of file
+    return bool(cancel_bookings([booking_id], user_id, is_admin=is_admin))
+
+def cancel_bookings(booking_ids, user_id, is_admin=False, whole_series=False):
+    """
+    Cancels every booking in booking_ids that the user may cancel (admins:
+    any) and that is not cancelled or expired already, using one read, one
+    batched update per status and one calendar outbox transaction. With
+    whole_series, bookings that belong to a recurring series take the rest
+    of their series with them. Returns the bookings cancelled, each with the
+    status it was cancelled from.
+    """
+    owner = None if is_admin else user_id
+    bookings = [
+        b for b in decode_rows(repository.get_bookings(booking_ids, user_id=owner)) if b.status not in INACTIVE_STATUSES
+    ]
+    if whole_series:
+        selected = {b.booking_id for b in bookings}
+        for series_id in {b.series_id for b in bookings if b.series_id}:
+            bookings += [
+                b for b in decode_rows(repository.list_series(series_id))
+                if b.status not in INACTIVE_STATUSES and b.booking_id not in selected and (owner is None or b.user_id == owner)
+            ]
+    if not bookings:
+        return []
+    by_status = defaultdict(list)
+    for b in bookings:
+        by_status[b.status].append(b.booking_id)
+    cancelled = []
+    for status, ids in by_status.items():
+        # Only bookings still in the status read above change, and the rows
+        # returned (with any calendar_event_id written back since) drive the
+        # index and calendar, so one approved or cancelled meanwhile is skipped.
+        rows = repository.update_bookings(ids, {"status": "cancelled"}, status=status)
+        cancelled += decode_rows([dict(row, status=status) for row in rows])
+    for booking in cancelled:
+        booking_index.remove_booking(booking)
+    _remove_calendar_events(cancelled)
+    return cancelled
+
+def _remove_calendar_events(bookings):
+    # A series cancelled completely loses its recurring event(s); a partly
+    # cancelled one only loses the cancelled occurrences.
+    single = [b for b in bookings if not b.series_id]
+    instances = []
+    by_series = defaultdict(list)
+    for b in bookings:
+        if b.series_id:
+            by_series[b.series_id].append(b)
+    for series_id, members in by_series.items():
+        cancelled = {b.booking_id for b in members}
+        remaining = [r for r in repository.list_series(series_id)
+                     if r["status"] not in INACTIVE_STATUSES and r["booking_id"] not in cancelled]
+        if remaining:
+            instances += members
+            continue
+        seen_events = set()
+        for b in members:
+            event_id = b.get("calendar_event_id")
+            if event_id is None or event_id not in seen_events:
+                seen_events.add(event_id)
+                single.append(b)
+    queue_remove_events(single)
+    queue_remove_instances(instances)
+
+def parse_selection(text):
+    """
+    Parses a bulk selection: booking IDs separated by commas or spaces
+    ("12, 15 18"), or "all" optionally followed by a venue name and/or a date
+    ("all Reading Room 2025-03-01"). Returns (ids, venue, day), where ids is
+    None for "all". Raises ValueError for anything else.
+    """
+    words = (text or "").replace(",", " ").split()
+    if not words:
+        raise ValueError("Nothing selected")
+    if words[0].lower() != "all":
+        return list(dict.fromkeys(int(w) for w in words)), None, None
+    rest = words[1:]
+    day = None
+    if rest and _DATE.match(rest[-1]):
+        day = dt.strptime(rest.pop(), "%Y-%m-%d").date()
+    venue = None
+    if rest:
+        venue = catalog.find(" ".join(rest))
+        if venue is None:
+            raise ValueError(f"Unknown venue: {' '.join(rest)}")
+    return None, venue, day
+
+def filter_selection(bookings, venue=None, day=None):
+    """Decodes bookings and keeps those at `venue` and starting on `day` (when given)."""
+    return [
+        b for b in decode_rows(bookings)
+        if (venue is None or str(b.venue_id) == str(venue["venue_id"])) and (day is None or b.start.date() == day)
+    ]
+
+def select_non_conflicting(bookings):
+    """
+    Splits bookings about to be confirmed into (accepted, conflicting,
+    invalid). A booking conflicts when it overlaps a confirmed booking or one
+    accepted earlier in the same batch; earlier requests (lower booking_id)
+    win. Bookings whose duration is invalid (see Booking.valid) are never
+    accepted.
+    """
+    accepted, conflicting, invalid = [], [], []
+    batch = {}
+    for booking in sorted(bookings, key=lambda b: b.booking_id):
+        if not booking.valid:
+            invalid.append(booking)
+            continue
+        index = batch.setdefault(str(booking.venue_id), VenueIntervalIndex())
+        if booking_index.has_overlap(booking.venue_id, booking.start, booking.end) \
+                or index.overlaps(booking.start, booking.end):
+            conflicting.append(booking)
+        else:
+            index.add(booking.booking_id, booking.start, booking.end)
+            accepted.append(booking)
+    return accepted, conflicting, invalid
\ No newline at end of file
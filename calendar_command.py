@@ -0,0 +1,20 @@
+from config import bot
+from db_helpers import get_user_info
+from venue_catalog import catalog
+from ics_feed import feed_url
+
+@bot.message_handler(commands=['calendar'])
+def calendar_command(message):
+    user = get_user_info(message.from_user.id)
+    if not user:
+        return
+    own_feed = feed_url("user", user["user_id"])
+    if own_feed is None:
+        bot.send_message(user["user_id"], "Calendar feeds are not available. Press /start to restart.")
+        return
+    lines = ["Subscribe to these links in your calendar app (e.g. Google Calendar: Other calendars > From URL).",
+             "", f"Your confirmed bookings:\n{own_feed}"]
+    for venue in catalog.venues_for_role(user["role"]):
+        lines.append(f"\n{venue['name'].strip()}:\n{feed_url('venue', venue['venue_id'])}")
+    lines.append("\nKeep these links private; anyone with a link can see its bookings.")
+    bot.send_message(user["user_id"], "\n".join(lines))
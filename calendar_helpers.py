@@ -1,28 +1,33 @@
-import google.oauth2.service_account
-from googleapiclient.discovery import build
-from datetime import datetime as dt
-from config import VENUE_COLORS
+from math import gcd
+from datetime import timedelta
+from pytz import utc
+from config import VENUE_COLORS, TZ
 from db_helpers import get_user_info
+from booking_model import as_booking
+from lazy import Lazy
 
 # Google Calendar setup
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 SERVICE_ACCOUNT_FILE = r'facility-booking-bot-cc90373ee34e.json'
 calendar_id = 'fde2719902f4ca8ada620b4922fa8365a333b2cf79885e048e107dd6d7834b9a@group.calendar.google.com'
 
-credentials = google.oauth2.service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-calendar_service = build('calendar', 'v3', credentials=credentials)
+def _build_calendar_service():
+    import google.oauth2.service_account
+    from googleapiclient.discovery import build
+    credentials = google.oauth2.service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    # The discovery document bundled with the library avoids a network fetch.
+    return build('calendar', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False)
 
-def add_event_to_calendar(booking, venue):
-    start_dt = dt.fromisoformat(booking["booking_date"])
-    from booking_utils import parse_duration  # to get duration
-    duration_td = parse_duration(booking["duration"])
-    end_dt = start_dt + duration_td
+calendar_service = Lazy(_build_calendar_service, "calendar_service")
+
+def build_event(booking, venue):
+    booking = as_booking(booking)
+    start_dt = booking.start
+    end_dt = booking.end
 
-    # Get user info from booking if needed (omitted here; assume already available)
     summary = f"{venue['name']}: {booking.get('reason', 'No Reason Provided')}"
-    user_info = get_user_info(booking["user_id"])
-    print(user_info)
+    user_info = get_user_info(booking["user_id"]) or {}
     description = f"Booked by: {user_info.get('name', 'Unknown User')}"
     if user_info.get("role", "Resident") != "Resident":
         description += f"({user_info.get('role','')})"
@@ -42,13 +47,41 @@ def add_event_to_calendar(booking, venue):
         },
         'colorId': color_id
     }
-    created_event = calendar_service.events().insert(calendarId=calendar_id, body=event).execute()
-    print('Event created on Calendar: {}'.format(created_event.get('htmlLink')))
-    return created_event.get("id")
-
-def remove_event_from_calendar(event_id):
-    try:
-        calendar_service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
-        print(f"Event {event_id} removed from Google Calendar.")
-    except Exception as e:
-        print(f"Failed to remove event from calendar: {e}")
\ No newline at end of file
+    if booking.get("booking_id") is not None:
+        event['extendedProperties'] = {'private': {'booking_id': str(booking["booking_id"])}}
+    return event
+
+def build_series_event(bookings, venue):
+    """
+    One recurring event for bookings of a series (same time of day and
+    duration). The rule repeats every gcd-of-gaps days from the first
+    occurrence; dates in that progression without a booking become EXDATEs.
+    """
+    bookings = sorted((as_booking(b) for b in bookings), key=lambda b: b.start)
+    first = bookings[0]
+    event = build_event(first, venue)
+    starts = {b.start for b in bookings}
+    step = 0
+    for b in bookings[1:]:
+        step = gcd(step, (b.start - first.start).days)
+    step = step or 1
+    count = (bookings[-1].start - first.start).days // step + 1
+    if step % 7 == 0:
+        rule = f"RRULE:FREQ=WEEKLY;INTERVAL={step // 7};COUNT={count}"
+    else:
+        rule = f"RRULE:FREQ=DAILY;INTERVAL={step};COUNT={count}"
+    skipped = [first.start + timedelta(days=step * i) for i in range(count)]
+    skipped = [d for d in skipped if d not in starts]
+    event['recurrence'] = [rule]
+    if skipped:
+        event['recurrence'].append(
+            "EXDATE;TZID=Asia/Singapore:" + ",".join(d.strftime("%Y%m%dT%H%M%S") for d in skipped)
+        )
+    if first.series_id:
+        event['extendedProperties']['private']['series_id'] = first.series_id
+    return event
+
+def instance_suffix(booking):
+    """The "_YYYYMMDDTHHMMSSZ" part Google appends to a recurring event's ID for this occurrence."""
+    start = TZ.localize(as_booking(booking).start).astimezone(utc)
+    return start.strftime("_%Y%m%dT%H%M%SZ")
@@ -0,0 +1,306 @@
+"""
+Repairs drift between confirmed bookings and the shared Google Calendar.
+
+The reconciler mirrors the calendar's events in the outbox SQLite file and
+keeps the Calendar API sync token next to them, so each run downloads only
+the events changed since the last one (one list call when nothing changed).
+It then compares upcoming confirmed bookings with the mirror:
+
+- missing:    confirmed booking without a live event -> event queued
+- relinked:   a live event carries the booking_id but the booking does not
+              point at it (e.g. a lost write-back) -> calendar_event_id set
+- orphaned:   live upcoming event for a booking that is no longer confirmed
+              -> event deleted
+- duplicates: extra live events for the same booking -> deleted
+
+Events without a booking_id extended property were not made by the bot and
+are left alone. Repairs go through the calendar outbox, so they are sent in
+batch requests and retried like any other calendar write.
+"""
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime as dt
+from config import logger, TZ, CALENDAR_OUTBOX_PATH, CALENDAR_RECONCILE_INTERVAL
+from booking_model import decode_rows
+from calendar_sync import get_outbox, queue_add_events, queue_add_series, write_back_event_id, http_status
+from venue_catalog import catalog
+import metrics
+import repository
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar_sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS calendar_events (
+    event_id TEXT PRIMARY KEY,
+    booking_id INTEGER,
+    series_id TEXT,
+    start TEXT
+);
+CREATE INDEX IF NOT EXISTS calendar_events_booking ON calendar_events (booking_id);
+CREATE INDEX IF NOT EXISTS calendar_events_series ON calendar_events (series_id);
+"""
+
+
+def _event_start(event):
+    value = (event.get("start") or {}).get("dateTime")
+    if not value:
+        return None
+    start = dt.fromisoformat(value.replace("Z", "+00:00"))
+    if start.tzinfo is not None:
+        start = start.astimezone(TZ).replace(tzinfo=None)
+    return start.isoformat()
+
+
+class CalendarReconciler:
+    """
+    Mirror of the calendar's live events plus the drift check described in
+    the module docstring. run(dry_run=True) only reports.
+    """
+
+    def __init__(self, path, service, calendar_id, outbox, interval=CALENDAR_RECONCILE_INTERVAL):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.outbox = outbox
+        self.interval = interval
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # One run at a time: overlapping runs would both see the same bookings
+        # missing before either has queued them, and insert them twice.
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.full_syncs = 0
+        self.errors = 0
+        self.repaired = 0
+        self.last_report = None
+
+    # -- mirror -------------------------------------------------------------
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _sync_token(self):
+        rows = self._execute("SELECT value FROM calendar_sync_state WHERE key = 'sync_token'")
+        return rows[0][0] if rows else None
+
+    def _list_pages(self, sync_token):
+        page_token = None
+        while True:
+            kwargs = {"calendarId": self.calendar_id}
+            if page_token:
+                kwargs["pageToken"] = page_token
+            if sync_token:
+                kwargs["syncToken"] = sync_token
+            with metrics.timed("calendar", "list"):
+                response = self.service.events().list(**kwargs).execute()
+            yield response
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _apply_pages(self, pages, full):
+        changed = 0
+        token = None
+        rows, gone = [], []
+        for response in pages:
+            for event in response.get("items", []):
+                changed += 1
+                private = (event.get("extendedProperties") or {}).get("private") or {}
+                # Cancelled events, and single cancelled occurrences of a series, are not live.
+                if event.get("status") == "cancelled" or event.get("recurringEventId"):
+                    gone.append((event["id"],))
+                    continue
+                booking_id = private.get("booking_id")
+                rows.append((event["id"], int(booking_id) if booking_id and booking_id.isdigit() else None,
+                             private.get("series_id"), _event_start(event)))
+            token = response.get("nextSyncToken") or token
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if full:
+                    self._conn.execute("DELETE FROM calendar_events")
+                self._conn.executemany("DELETE FROM calendar_events WHERE event_id = ?", gone)
+                self._conn.executemany("INSERT OR REPLACE INTO calendar_events VALUES (?, ?, ?, ?)", rows)
+                if token:
+                    self._conn.execute("INSERT OR REPLACE INTO calendar_sync_state VALUES ('sync_token', ?)", (token,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def refresh(self, full=False):
+        """
+        Brings the mirror up to date and returns the number of changed events
+        downloaded. Without a sync token, or when Google has expired it (410),
+        every event is listed again.
+        """
+        token = None if full else self._sync_token()
+        if token:
+            try:
+                # Pages are consumed inside _apply_pages, so a 410 surfaces there.
+                return self._apply_pages(self._list_pages(token), full=False)
+            except Exception as e:
+                if http_status(e) != 410:
+                    raise
+                logger.warning("Calendar sync token expired; listing every event again.")
+        self.full_syncs += 1
+        return self._apply_pages(self._list_pages(None), full=True)
+
+    # -- diff ---------------------------------------------------------------
+
+    def diff(self, now=None):
+        """Returns the drift report; see the module docstring for the categories."""
+        now = now or repository.local_now()
+        window = repository.window_start(now).isoformat()
+        # Read order matters: queued work first, then bookings, then the
+        # calendar, so an event created in between is seen before its booking.
+        busy = self.outbox.pending_booking_ids()
+        venue_ids = [v["venue_id"] for v in catalog.all()]
+        bookings = decode_rows(repository.list_bookings(venue_ids, "confirmed", upcoming=True, now=now))
+        self.refresh()
+        events = self._execute("SELECT event_id, booking_id, series_id, start FROM calendar_events")
+        live = {e[0]: e for e in events}
+        by_booking = defaultdict(list)
+        by_series = defaultdict(list)
+        for event_id, booking_id, series_id, _ in events:
+            if series_id:
+                by_series[series_id].append(event_id)
+            elif booking_id is not None:
+                by_booking[booking_id].append(event_id)
+
+        report = {"missing": [], "relinked": [], "orphaned": [], "duplicates": []}
+        referenced = {b.get("calendar_event_id") for b in bookings} & live.keys()
+        confirmed_series = {b.series_id for b in bookings if b.series_id}
+        for b in bookings:
+            if b.booking_id in busy or b.get("calendar_event_id") in live:
+                continue
+            candidates = by_series.get(b.series_id, []) if b.series_id else by_booking.get(b.booking_id, [])
+            if len(candidates) > 1 and b.series_id:
+                # Approved in parts: several events share the series and it is
+                # not known which covers this booking, so leave it be.
+                referenced.update(candidates)
+            elif candidates:
+                referenced.add(candidates[0])
+                report["relinked"].append((b, candidates[0]))
+            else:
+                report["missing"].append(b)
+
+        upcoming_ids = {b.booking_id for b in bookings}
+        for booking_id, event_ids in by_booking.items():
+            if booking_id not in upcoming_ids or booking_id in busy:
+                continue
+            keep = next((e for e in event_ids if e in referenced), event_ids[0])
+            report["duplicates"] += [(booking_id, e) for e in event_ids if e != keep]
+
+        # Only upcoming events can be orphans: past events of archived bookings stay as history.
+        candidates = [e for e in events if e[3] and e[3] >= window and e[0] not in referenced
+                      and (e[1] is not None or e[2]) and e[1] not in busy]
+        duplicate_ids = {e for _, e in report["duplicates"]}
+        single = [e for e in candidates if not e[2] and e[0] not in duplicate_ids]
+        if single:
+            # Re-read: the booking may have been confirmed after the listing above.
+            current = {b.booking_id: b for b in decode_rows(repository.get_bookings({e[1] for e in single}))}
+            report["orphaned"] += [(e[1], e[0]) for e in single
+                                   if current.get(e[1]) is None or current[e[1]].status != "confirmed"]
+        report["orphaned"] += [(e[1], e[0]) for e in candidates if e[2] and e[2] not in confirmed_series]
+        return report
+
+    # -- repair -------------------------------------------------------------
+
+    def repair(self, report):
+        missing = report["missing"]
+        queue_add_events([(b, catalog.get(b.venue_id) or {}) for b in missing if not b.series_id])
+        by_series = defaultdict(list)
+        for b in missing:
+            if b.series_id:
+                by_series[b.series_id].append(b)
+        for members in by_series.values():
+            queue_add_series(members, catalog.get(members[0].venue_id) or {})
+        relinks = defaultdict(list)
+        for b, event_id in report["relinked"]:
+            relinks[event_id].append(b.booking_id)
+        for event_id, booking_ids in relinks.items():
+            write_back_event_id(booking_ids[0], event_id, members=booking_ids if len(booking_ids) > 1 else None)
+        self.outbox.enqueue_deletes(report["orphaned"] + report["duplicates"])
+        count = sum(len(v) for v in report.values())
+        self.repaired += count
+        return count
+
+    def run(self, dry_run=False):
+        with self._run_lock:
+            return self._run_once(dry_run)
+
+    def _run_once(self, dry_run):
+        report = self.diff()
+        if not dry_run:
+            self.repair(report)
+        self.runs += 1
+        self.last_report = {k: len(v) for k, v in report.items()}
+        if any(report.values()):
+            logger.warning(f"Calendar drift{' (dry run)' if dry_run else ''}: {self.last_report}")
+        return report
+
+    # -- worker -------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="calendar-reconcile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run()
+            except Exception:
+                self.errors += 1
+                logger.exception("Calendar reconciliation failed:")
+
+    def stats(self):
+        return {"runs": self.runs, "full_syncs": self.full_syncs, "errors": self.errors, "repaired": self.repaired,
+                **{f"last_{k}": v for k, v in (self.last_report or {}).items()}}
+
+
+def format_report(report, dry_run):
+    lines = ["Calendar reconciliation" + (" (dry run, nothing changed):" if dry_run else ":")]
+    labels = {
+        "missing": "Confirmed bookings without an event",
+        "relinked": "Bookings re-linked to their event",
+        "orphaned": "Events of bookings no longer confirmed",
+        "duplicates": "Duplicate events",
+    }
+    for key, label in labels.items():
+        items = report[key]
+        if key == "missing":
+            ids = [b.booking_id for b in items]
+        elif key == "relinked":
+            ids = [b.booking_id for b, _ in items]
+        else:
+            ids = [booking_id for booking_id, _ in items]
+        lines.append(f"{label}: {len(items)}" + (f" (booking IDs: {', '.join(map(str, sorted(set(ids))))})" if ids else ""))
+    return "\n".join(lines)
+
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+def get_reconciler():
+    global _reconciler
+    with _reconciler_lock:
+        if _reconciler is None:
+            from calendar_helpers import calendar_service, calendar_id
+            _reconciler = CalendarReconciler(CALENDAR_OUTBOX_PATH, calendar_service, calendar_id, get_outbox())
+            metrics.register_gauges("calendar_reconcile", _reconciler.stats)
+        return _reconciler
@@ -0,0 +1,401 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from config import logger, CALENDAR_OUTBOX_PATH, CALENDAR_SYNC_INTERVAL
+import metrics
+import repository
+
+# Google accepts at most 50 calls in one batch HTTP request.
+MAX_BATCH_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar_outbox (
+    op_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    booking_id INTEGER,
+    body TEXT,
+    event_id TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    members TEXT
+);
+CREATE INDEX IF NOT EXISTS calendar_outbox_due ON calendar_outbox (status, next_attempt);
+CREATE INDEX IF NOT EXISTS calendar_outbox_booking ON calendar_outbox (booking_id, kind);
+"""
+
+
+def http_status(exc):
+    """HTTP status of a Google API error, or None if it carries none."""
+    resp = getattr(exc, "resp", None)
+    status = getattr(resp, "status", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def outbox_event_id(op_id, created_at):
+    """
+    Event ID an outbox insert is sent with, so a retry after a lost response
+    finds the event already created (Google answers 409) instead of adding a
+    duplicate. Hex digits are valid base32hex event IDs; created_at keeps the
+    IDs of a new outbox file, whose op_ids restart at 1, from colliding.
+    """
+    return hashlib.sha1(f"{op_id}:{created_at!r}".encode("utf-8")).hexdigest()
+
+
+def write_back_event_id(booking_id, event_id, members=None):
+    """Records the event on its booking, or on every booking a recurring event covers."""
+    if members:
+        repository.update_bookings(members, {"calendar_event_id": event_id})
+    else:
+        repository.update_booking(booking_id, {"calendar_event_id": event_id})
+
+
+class CalendarOutbox:
+    """
+    Durable queue of Google Calendar operations kept in SQLite.
+
+    Handlers enqueue inserts and deletes and return immediately; a worker
+    thread drains due operations in Calendar batch requests, retries failures
+    with exponential backoff and writes created event IDs back to the
+    bookings table. `service` is anything shaped like the Calendar v3 client
+    (events() and new_batch_http_request()), so a fake can be passed in.
+    """
+
+    def __init__(self, path, service, calendar_id, write_back=write_back_event_id,
+                 batch_size=MAX_BATCH_SIZE, max_attempts=8, base_delay=2.0,
+                 max_delay=600.0, poll_interval=CALENDAR_SYNC_INTERVAL):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.write_back = write_back
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(calendar_outbox)")}
+        if "members" not in columns:
+            # Outbox files created before recurring events.
+            self._conn.execute("ALTER TABLE calendar_outbox ADD COLUMN members TEXT")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -- enqueueing ---------------------------------------------------------
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def enqueue_insert(self, booking_id, body):
+        self.enqueue_inserts([(booking_id, body)])
+
+    def enqueue_inserts(self, items):
+        """Queues [(booking_id, event_body)] in one transaction; they drain in the same batch request."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO calendar_outbox (kind, booking_id, body, created_at) VALUES ('insert', ?, ?, ?)",
+                [(booking_id, json.dumps(body), now) for booking_id, body in items]
+            )
+        self._wake.set()
+
+    def enqueue_series_insert(self, booking_ids, body):
+        """
+        Queues one recurring event covering booking_ids. The op is keyed by the
+        first booking; the event ID is written back to all of them.
+        """
+        booking_ids = list(booking_ids)
+        self._execute(
+            "INSERT INTO calendar_outbox (kind, booking_id, body, members, created_at) VALUES ('insert', ?, ?, ?, ?)",
+            (booking_ids[0], json.dumps(body), json.dumps(booking_ids), time.time())
+        )
+        self._wake.set()
+
+    def enqueue_delete(self, booking_id, event_id=None):
+        """
+        Queues removal of a booking's event. When the event is not known yet
+        the worker resolves it from the booking's earlier insert, or drops
+        both operations if that insert never reached Google.
+        """
+        self.enqueue_deletes([(booking_id, event_id)])
+
+    def enqueue_deletes(self, items):
+        """Queues [(booking_id, event_id or None)] in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO calendar_outbox (kind, booking_id, event_id, created_at) VALUES ('delete', ?, ?, ?)",
+                [(booking_id, event_id, now) for booking_id, event_id in items]
+            )
+        self._wake.set()
+
+    def enqueue_instance_deletes(self, items):
+        """
+        Queues [(booking_id, event_id or None, instance_suffix)]: removal of single
+        occurrences from a recurring event, leaving the rest of the series.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO calendar_outbox (kind, booking_id, event_id, body, created_at) "
+                "VALUES ('delete_instance', ?, ?, ?, ?)",
+                [(booking_id, event_id, suffix, now) for booking_id, event_id, suffix in items]
+            )
+        self._wake.set()
+
+    def pending_booking_ids(self):
+        """Bookings with calendar work still queued, including every member of a queued recurring event."""
+        ids = set()
+        for booking_id, members in self._execute(
+                "SELECT booking_id, members FROM calendar_outbox WHERE status = 'pending'"):
+            ids.add(booking_id)
+            ids.update(json.loads(members) if members else ())
+        return ids
+
+    def pending_count(self):
+        return self._execute("SELECT COUNT(*) FROM calendar_outbox WHERE status = 'pending'")[0][0]
+
+    # -- draining -----------------------------------------------------------
+
+    def _mark(self, op_id, status, event_id=None, error=None):
+        self._execute(
+            "UPDATE calendar_outbox SET status = ?, event_id = COALESCE(?, event_id), last_error = ? WHERE op_id = ?",
+            (status, event_id, error, op_id)
+        )
+
+    def _retry(self, op_id, attempts, error):
+        attempts += 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Calendar operation {op_id} failed permanently: {error}")
+            self._execute(
+                "UPDATE calendar_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE op_id = ?",
+                (attempts, error, op_id)
+            )
+            return
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        self._execute(
+            "UPDATE calendar_outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE op_id = ?",
+            (attempts, time.time() + delay, error, op_id)
+        )
+
+    def _find_insert(self, booking_id, condition):
+        # Recurring events list the bookings they cover in `members`.
+        rows = self._execute(
+            "SELECT op_id, event_id, attempts, created_at FROM calendar_outbox WHERE kind = 'insert' "
+            "AND (booking_id = ? OR EXISTS "
+            "(SELECT 1 FROM json_each(calendar_outbox.members) WHERE value = ?)) AND " + condition +
+            " ORDER BY op_id DESC LIMIT 1",
+            (booking_id, booking_id)
+        )
+        return rows[0] if rows else None
+
+    def _resolve_delete(self, op_id, booking_id):
+        """Returns the event ID to delete, or None if nothing is left to do."""
+        pending_insert = self._find_insert(booking_id, "status IN ('pending', 'failed')")
+        if pending_insert and not pending_insert[1]:
+            insert_op_id, _, attempts, created_at = pending_insert
+            self._mark(insert_op_id, "skipped")
+            # An insert already sent may have created its event before failing.
+            return outbox_event_id(insert_op_id, created_at) if attempts else None
+        done_insert = self._find_insert(booking_id, "event_id IS NOT NULL")
+        return done_insert[1] if done_insert else None
+
+    def _resolve_instance(self, booking_id):
+        """
+        Returns (recurring event ID or None, wait). An occurrence whose event
+        has not been created yet waits for it; the rest of the series still
+        needs that insert, so it cannot be dropped.
+        """
+        pending_insert = self._find_insert(booking_id, "status = 'pending' AND event_id IS NULL")
+        if pending_insert:
+            return None, True
+        done_insert = self._find_insert(booking_id, "event_id IS NOT NULL")
+        return (done_insert[1] if done_insert else None), False
+
+    def _write_back(self, op_id, booking_id, members, event_id, attempts):
+        try:
+            self.write_back(booking_id, event_id, members=json.loads(members) if members else None)
+        except Exception as e:
+            # Keep the op pending with its event_id; the next drain only retries the write-back.
+            self._mark(op_id, "pending", event_id=event_id)
+            self._retry(op_id, attempts, f"write-back failed: {e}")
+            return
+        self._mark(op_id, "done", event_id=event_id)
+
+    def drain_once(self):
+        """Sends one batch of due operations. Returns how many were attempted."""
+        rows = self._execute(
+            "SELECT op_id, kind, booking_id, body, event_id, attempts, members, created_at FROM calendar_outbox "
+            "WHERE status = 'pending' AND next_attempt <= ? ORDER BY op_id LIMIT ?",
+            (time.time(), self.batch_size)
+        )
+        if not rows:
+            return 0
+        # Resolve deletes first: one may cancel an insert in this same batch.
+        event_ids = {}
+        for op_id, kind, booking_id, _, event_id, _, _, _ in rows:
+            if kind == "delete":
+                event_ids[op_id] = event_id or self._resolve_delete(op_id, booking_id)
+        skipped = {r[0] for r in self._execute("SELECT op_id FROM calendar_outbox WHERE status = 'skipped' "
+                                               "AND op_id IN (%s)" % ",".join(str(r[0]) for r in rows))}
+        calls = {}
+        insert_ids = {}
+        for op_id, kind, booking_id, body, event_id, attempts, members, created_at in rows:
+            if op_id in skipped:
+                continue
+            if kind == "insert" and event_id:
+                self._write_back(op_id, booking_id, members, event_id, attempts)
+            elif kind == "insert":
+                insert_ids[op_id] = outbox_event_id(op_id, created_at)
+                request = self.service.events().insert(calendarId=self.calendar_id,
+                                                       body=dict(json.loads(body), id=insert_ids[op_id]))
+                calls[str(op_id)] = (op_id, kind, booking_id, members, attempts, request)
+            elif kind == "delete_instance":
+                wait = False
+                if not event_id:
+                    event_id, wait = self._resolve_instance(booking_id)
+                if wait:
+                    self._execute("UPDATE calendar_outbox SET next_attempt = ? WHERE op_id = ?",
+                                  (time.time() + self.poll_interval, op_id))
+                    continue
+                if not event_id:
+                    self._mark(op_id, "skipped")
+                    continue
+                self._mark(op_id, "pending", event_id=event_id)
+                request = self.service.events().delete(calendarId=self.calendar_id, eventId=event_id + body)
+                calls[str(op_id)] = (op_id, kind, booking_id, members, attempts, request)
+            elif kind == "delete":
+                event_id = event_ids[op_id]
+                if not event_id:
+                    self._mark(op_id, "skipped")
+                    continue
+                self._mark(op_id, "pending", event_id=event_id)
+                request = self.service.events().delete(calendarId=self.calendar_id, eventId=event_id)
+                calls[str(op_id)] = (op_id, kind, booking_id, members, attempts, request)
+        if not calls:
+            return len(rows)
+
+        results = {}
+
+        def on_response(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        batch = self.service.new_batch_http_request(callback=on_response)
+        for request_id, call in calls.items():
+            batch.add(call[5], request_id=request_id)
+        try:
+            with metrics.timed("calendar", "batch"):
+                batch.execute()
+        except Exception as e:
+            for op_id, _, _, _, attempts, _ in calls.values():
+                self._retry(op_id, attempts, f"batch failed: {e}")
+            return len(rows)
+
+        for request_id, (op_id, kind, booking_id, members, attempts, _) in calls.items():
+            response, exception = results.get(request_id, (None, RuntimeError("no response in batch")))
+            if exception is None:
+                if kind == "insert":
+                    self._write_back(op_id, booking_id, members, response.get("id"), attempts)
+                else:
+                    self._mark(op_id, "done")
+            elif kind == "insert" and http_status(exception) == 409:
+                # Created by an earlier attempt whose response was lost.
+                self._write_back(op_id, booking_id, members, insert_ids[op_id], attempts)
+            elif kind != "insert" and http_status(exception) in (404, 410):
+                self._mark(op_id, "done", error="already deleted")
+            elif http_status(exception) in (400, 404) and kind == "insert":
+                logger.error(f"Calendar rejected insert for booking {booking_id}: {exception}")
+                self._mark(op_id, "failed", error=str(exception))
+            else:
+                self._retry(op_id, attempts, str(exception))
+        return len(rows)
+
+    # -- worker -------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="calendar-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.drain_once() and not self._stop.is_set():
+                    pass
+            except Exception:
+                logger.exception("Calendar sync worker error:")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            from calendar_helpers import calendar_service, calendar_id
+            _outbox = CalendarOutbox(CALENDAR_OUTBOX_PATH, calendar_service, calendar_id)
+            metrics.register_gauges("calendar_outbox", lambda: {"pending": _outbox.pending_count()})
+        return _outbox
+
+
+def queue_add_event(booking, venue):
+    queue_add_events([(booking, venue)])
+
+
+def queue_add_events(bookings_and_venues):
+    from calendar_helpers import build_event
+    if not bookings_and_venues:
+        return
+    get_outbox().enqueue_inserts([(b["booking_id"], build_event(b, venue)) for b, venue in bookings_and_venues])
+
+
+def queue_add_series(bookings, venue):
+    """Queues one recurring event for the given bookings of a series."""
+    from calendar_helpers import build_series_event
+    if not bookings:
+        return
+    get_outbox().enqueue_series_insert([b["booking_id"] for b in bookings], build_series_event(bookings, venue))
+
+
+def queue_remove_event(booking):
+    queue_remove_events([booking])
+
+
+def queue_remove_events(bookings):
+    if not bookings:
+        return
+    get_outbox().enqueue_deletes([(b["booking_id"], b.get("calendar_event_id")) for b in bookings])
+
+
+def queue_remove_instances(bookings):
+    """Queues removal of single occurrences of recurring events, keeping the rest of each series."""
+    from calendar_helpers import instance_suffix
+    if not bookings:
+        return
+    get_outbox().enqueue_instance_deletes(
+        [(b["booking_id"], b.get("calendar_event_id"), instance_suffix(b)) for b in bookings]
+    )
@@ -4,7 +4,11 @@ import os
 import pytz
 from dotenv import load_dotenv
 import telebot
-from supabase import create_client, Client
+from lazy import Lazy
+import metrics
+from keyed_executor import KeyedTeleBot
+import throttle
+from flow_store import FlowStore
 
 load_dotenv()
 
@@ -24,13 +28,67 @@ telebot.logger.setLevel(logging.ERROR)
 
 # Bot configuration
 TOKEN = os.getenv("BOT_TOKEN")
-bot = telebot.TeleBot(TOKEN)
+# "keyed": parallel across users, in order per user; "telebot": telebot's own worker pool
+BOT_CONCURRENCY = os.getenv("BOT_CONCURRENCY", "keyed")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "8"))
+if BOT_CONCURRENCY == "keyed":
+    bot = KeyedTeleBot(TOKEN, num_workers=BOT_WORKERS)
+else:
+    bot = telebot.TeleBot(TOKEN, num_threads=BOT_WORKERS)
+metrics.instrument_bot(bot)
+if BOT_CONCURRENCY == "keyed":
+    metrics.register_gauges("handler", lambda: {"backlog": bot.executor.backlog()})
+
+# Per-user limits applied before any handler runs: "command=rate/burst" with
+# rates in requests per second; callback actions use their data prefix
+# ("confirm", "pickdur"), plain replies "message", and "default" the rest.
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1") == "1"
+THROTTLE_LIMITS = throttle.parse_limits(os.getenv(
+    "THROTTLE_LIMITS", "default=1/5,book=0.2/3,view=0.2/3,cancel=0.2/3,approve=0.2/3"))
+# Repeats of a callback query (or of a tap on the same button) within this many seconds are dropped
+CALLBACK_DEDUPE_WINDOW = float(os.getenv("CALLBACK_DEDUPE_WINDOW", "2"))
+if THROTTLE_ENABLED:
+    update_throttle = throttle.Throttle(THROTTLE_LIMITS, dedupe_window=CALLBACK_DEDUPE_WINDOW)
+    throttle.install(bot, update_throttle)
+    metrics.register_gauges("throttle", update_throttle.stats)
+
+# Update ingestion: "polling" or "webhook" (served by the local HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Required unless WEBHOOK_URL is set, in which case a random one is generated per run
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+HTTP_HOST = os.getenv("HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("HTTP_PORT", "8080"))
+# Serve /metrics and the .ics feeds in polling mode too (webhook mode always serves)
+HTTP_ENABLED = os.getenv("HTTP_ENABLED", "0") == "1"
 
 # Timezone and Supabase
 TZ = pytz.timezone('Asia/Singapore')
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def _create_supabase():
+    from supabase import create_client
+    metrics.instrument_postgrest()
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Built on first query so startup does not wait on the client import.
+supabase = Lazy(_create_supabase, "supabase")
+
+# Optional local SQLite read replica of bookings/users/venues. Reads fall
+# back to Supabase whenever it has not synced within REPLICA_MAX_STALENESS.
+REPLICA_PATH = os.getenv("REPLICA_PATH")
+REPLICA_POLL_INTERVAL = float(os.getenv("REPLICA_POLL_INTERVAL", "15"))
+REPLICA_FULL_SYNC_INTERVAL = float(os.getenv("REPLICA_FULL_SYNC_INTERVAL", "3600"))
+REPLICA_MAX_STALENESS = float(os.getenv("REPLICA_MAX_STALENESS", "120"))
+
+# User record cache (seconds / entries)
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+
+# Venue catalog refresh period (seconds)
+VENUE_REFRESH_INTERVAL = int(os.getenv("VENUE_REFRESH_INTERVAL", "300"))
 
 # Global constants (roles, blocks, etc.)
 ROLES = {
@@ -43,9 +101,53 @@ VENUE_COLORS = {
     "Dining Hall": "3",
 }
 
-# Global dictionaries to keep track of ongoing flows
-user_booking_flow = {}
-admin_update_flow = {}
+# Ongoing conversation flows: expire after FLOW_TTL seconds idle, capped at
+# FLOW_MAX_SIZE users each; set FLOW_STORE_PATH to keep them across restarts.
+FLOW_TTL = int(os.getenv("FLOW_TTL", "1800"))
+FLOW_MAX_SIZE = int(os.getenv("FLOW_MAX_SIZE", "10000"))
+FLOW_STORE_PATH = os.getenv("FLOW_STORE_PATH")
+STEP_HANDLER_SAVE_PATH = os.getenv("STEP_HANDLER_SAVE_PATH", "./.handler-saves/step.save")
+user_booking_flow = FlowStore("booking", ttl=FLOW_TTL, max_size=FLOW_MAX_SIZE, path=FLOW_STORE_PATH)
+admin_update_flow = FlowStore("admin_update", ttl=FLOW_TTL, max_size=FLOW_MAX_SIZE, path=FLOW_STORE_PATH)
+if FLOW_STORE_PATH:
+    # Pending register_next_step_handler callbacks are needed to resume a flow too.
+    bot.enable_save_next_step_handlers(delay=2, filename=STEP_HANDLER_SAVE_PATH)
+    bot.load_next_step_handlers(filename=STEP_HANDLER_SAVE_PATH, del_file_after_loading=False)
+metrics.register_gauges("booking_flow", user_booking_flow.stats)
 
 # List of group chat IDs (if any)
 GROUP_CHAT_IDS = []
+
+# Calendar outbox (SQLite file drained by the calendar sync worker)
+CALENDAR_OUTBOX_PATH = os.getenv("CALENDAR_OUTBOX_PATH", "calendar_outbox.sqlite3")
+CALENDAR_SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "5"))
+# Seconds between calendar reconciliation runs (0 disables the background run)
+CALENDAR_RECONCILE_INTERVAL = float(os.getenv("CALENDAR_RECONCILE_INTERVAL", "900"))
+
+# Read-only .ics feeds of confirmed bookings served by the local HTTP server
+# (only when ICS_FEED_SECRET is set). Links are only handed out when
+# ICS_FEED_BASE_URL (where that server is reachable from outside) is set;
+# each carries an HMAC of ICS_FEED_SECRET. /metrics then only answers loopback.
+ICS_FEED_BASE_URL = os.getenv("ICS_FEED_BASE_URL")
+ICS_FEED_SECRET = os.getenv("ICS_FEED_SECRET")
+if ICS_FEED_BASE_URL and not ICS_FEED_SECRET:
+    raise RuntimeError("ICS_FEED_SECRET must be set when ICS_FEED_BASE_URL is")
+# Cached feeds are rebuilt on booking changes, and at least this often (seconds)
+ICS_FEED_MAX_AGE = float(os.getenv("ICS_FEED_MAX_AGE", "3600"))
+
+# Outgoing notification limits (Telegram: ~30 msg/s overall, 1 msg/s per chat, 20 msg/min per group)
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+NOTIFY_GROUP_RATE = float(os.getenv("NOTIFY_GROUP_RATE", str(20 / 60)))
+
+# Booking reminders: minutes before the start, and how fast they are handed to the dispatcher
+REMINDER_OFFSETS = [int(m) for m in os.getenv("REMINDER_OFFSETS", "1440,30").split(",") if m.strip()]
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "5"))
+# Reminders missed by at most this many seconds (e.g. during a restart) are still sent
+REMINDER_GRACE = float(os.getenv("REMINDER_GRACE", "300"))
+
+# Maintenance: expiring past pending requests and archiving old bookings (0 days disables archiving)
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "900"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
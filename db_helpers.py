@@ -1,6 +1,12 @@
 from datetime import timedelta
-import json
-from config import supabase
+from config import USER_CACHE_TTL, USER_CACHE_SIZE
+from cache import TTLCache
+import metrics
+from venue_catalog import catalog
+import repository
+
+user_cache = TTLCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+metrics.register_gauges("user_cache", user_cache.stats)
 
 def parse_duration(duration_text):
     parts = duration_text.split(":")
@@ -8,49 +14,57 @@ def parse_duration(duration_text):
     minutes = int(parts[1])
     return timedelta(hours=hours, minutes=minutes)
 
-def get_all_venues():
-    response = supabase.table("venues").select("*").execute()
-    return response.data if response.data else []
-
-def get_all_users():
-    response = supabase.table("users").select("*").execute()
-    return response.data if response.data else []
+def get_user_names(user_ids):
+    """
+    Returns {str(user_id): name} for the given ids. Cached users are answered
+    locally; the rest are fetched with a single `in` query.
+    """
+    names = {}
+    missing = []
+    for user_id in user_ids:
+        user = user_cache.get(str(user_id))
+        if user is not None:
+            names[str(user_id)] = user["name"]
+        else:
+            missing.append(user_id)
+    if missing:
+        for u in repository.get_users(missing):
+            names[str(u["user_id"])] = u["name"]
+    return names
 
 def get_user_info(user_id):
-    response = supabase.table("users").select("*").eq("user_id", user_id).execute()
-    if response.data and len(response.data) > 0:
-        return response.data[0]
-    return None
+    """
+    Returns the user record, served from user_cache when possible.
+    Unregistered users are not cached so that a fresh /start sees them at once.
+    """
+    key = str(user_id)
+    user = user_cache.get(key)
+    if user is not None:
+        return user
+    user = repository.get_user(user_id)
+    if user is not None:
+        user_cache.set(key, user)
+    return user
+
+def invalidate_user(user_id):
+    user_cache.invalidate(str(user_id))
 
 def get_venue_ids_for(names):
     """
     Returns a list of venue_ids for venues whose names match any name in the provided list.
     The comparison is done case-insensitively.
     """
-    venues = get_all_venues()
-    lower_names = [n.lower() for n in names]
-    return [v["venue_id"] for v in venues if v["name"].strip().lower() in lower_names]
+    return catalog.ids_for(names)
 
-def get_user_bookings(user_id, is_admin=False):
+def get_user_bookings(user_id, is_admin=False, limit=None):
     """
-    Returns all bookings for the given user.
-    If is_admin is True, returns all non-cancelled bookings;
+    Returns the upcoming (not yet ended) bookings for the given user, soonest first.
+    If is_admin is True, returns all non-cancelled upcoming bookings;
     otherwise, only bookings made by the given user.
     """
-    query = supabase.table("bookings").select("*").neq("status", "cancelled")
-    if not is_admin:
-        query = query.eq("user_id", user_id)
-    result = query.execute()
-    return result.data if result.data else []
+    return repository.list_active_bookings(None if is_admin else user_id, upcoming=True, limit=limit)
 
-def user_can_access_venue(user, venue):
+def get_accessible_venues(user):
     if user is None:
-        return False
-    user_role = user["role"].strip().lower()
-    allowed_roles = venue.get("allowed_roles") or []
-    if isinstance(allowed_roles, str):
-        allowed_roles = json.loads(allowed_roles)
-    allowed_roles = [r.lower() for r in allowed_roles]
-    if allowed_roles:
-        return user_role in allowed_roles
-    return False
+        return []
+    return catalog.venues_for_role(user["role"])
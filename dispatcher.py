@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import threading
+import time
+from config import bot, logger, NOTIFY_WORKERS, NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_GROUP_RATE
+from ratelimit import TokenBucket, BucketMap
+import metrics
+
+PRIORITY_HIGH = 0      # direct replies about the user's own booking
+PRIORITY_NORMAL = 10   # committee fan-out
+PRIORITY_LOW = 20      # group broadcasts, reminders
+
+
+def _retry_after(exc):
+    """Returns Telegram's retry_after for a 429 error, or None for any other error."""
+    if getattr(exc, "error_code", None) != 429:
+        return None
+    result = getattr(exc, "result_json", None) or {}
+    return float((result.get("parameters") or {}).get("retry_after", 1))
+
+
+class NotificationDispatcher:
+    """
+    Queues outgoing Telegram messages and sends them from a small worker pool
+    while respecting a global token bucket and one bucket per chat. Lower
+    priority values are sent first; messages to one chat keep their order.
+    """
+
+    def __init__(self, send, workers=NOTIFY_WORKERS, global_rate=NOTIFY_GLOBAL_RATE,
+                 chat_rate=NOTIFY_CHAT_RATE, group_rate=NOTIFY_GROUP_RATE, max_attempts=5):
+        self.send = send
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate)
+        # Negative chat IDs are groups, which Telegram limits much harder.
+        self.chat_buckets = BucketMap(
+            lambda chat_id: group_rate if int(chat_id) < 0 else chat_rate,
+            lambda chat_id: 1
+        )
+        self._ready = []
+        self._delayed = []
+        self._seq = itertools.count()
+        self._inflight = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def enqueue(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        item = [priority, next(self._seq), chat_id, text, kwargs, 0]
+        with self._cond:
+            heapq.heappush(self._ready, item)
+            self._cond.notify()
+        self.start()
+
+    def _defer(self, item, delay):
+        with self._cond:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, item[1], item))
+            self._cond.notify()
+
+    def _next_item(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    heapq.heappush(self._ready, heapq.heappop(self._delayed)[2])
+                # One message per chat at a time keeps each chat's messages in order.
+                skipped = []
+                found = None
+                while self._ready:
+                    item = heapq.heappop(self._ready)
+                    if item[2] in self._inflight:
+                        skipped.append(item)
+                    else:
+                        found = item
+                        break
+                for item in skipped:
+                    heapq.heappush(self._ready, item)
+                if found is not None:
+                    self._inflight.add(found[2])
+                    return found
+                if self._stopping and not self._ready and not self._delayed and not self._inflight:
+                    return None
+                timeout = self._delayed[0][0] - now if self._delayed else 0.5
+                self._cond.wait(timeout)
+
+    def _done(self, item):
+        with self._cond:
+            self._inflight.discard(item[2])
+            self._cond.notify_all()
+
+    def _send(self, item):
+        priority, _, chat_id, text, kwargs, attempts = item
+        wait = self.chat_buckets.get(chat_id).try_acquire()
+        if wait > 0:
+            self._defer(item, wait)
+            return
+        self.global_bucket.acquire()
+        try:
+            self.send(chat_id, text, **kwargs)
+            self.sent += 1
+        except Exception as e:
+            retry_after = _retry_after(e)
+            item[5] = attempts + 1
+            if retry_after is not None and item[5] < self.max_attempts:
+                self.rate_limited += 1
+                self.chat_buckets.get(chat_id).penalize(retry_after)
+                self._defer(item, retry_after)
+            else:
+                self.failed += 1
+                print(f"Failed to notify {chat_id}: {e}")
+
+    def _worker(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            try:
+                self._send(item)
+            except Exception:
+                logger.exception("Notification dispatcher error:")
+            finally:
+                self._done(item)
+
+    def start(self):
+        if self._threads:
+            return
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"notify-{i}", daemon=True)
+                self._threads.append(t)
+                t.start()
+
+    def stop(self, timeout=None):
+        """Lets the workers send everything still queued, then stops them."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._ready) + len(self._delayed)
+        return {"queued": queued, "sent": self.sent, "failed": self.failed, "rate_limited": self.rate_limited}
+
+
+dispatcher = NotificationDispatcher(bot.send_message)
+metrics.register_gauges("notifications", dispatcher.stats)
+
+
+def notify(chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+    dispatcher.enqueue(chat_id, text, priority=priority, **kwargs)
@@ -0,0 +1,162 @@
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flow_state (
+    store TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (store, key)
+);
+CREATE INDEX IF NOT EXISTS flow_state_expiry ON flow_state (expires_at);
+"""
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _connect(path):
+    # Stores sharing a file share one connection.
+    with _connections_lock:
+        conn = _connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _connections[path] = conn
+        return conn
+
+
+class FlowStore:
+    """
+    Per-user conversation state with a sliding TTL and LRU eviction beyond
+    max_size. Used like a dict keyed by user ID. When `path` is given,
+    entries are also written to SQLite so flows survive a restart.
+
+    In memory the store keeps the caller's object itself, but SQLite only
+    sees a value when it is assigned, so callers that mutate a flow dict
+    write it back with `store[user_id] = flow_data`. Reads extend the TTL;
+    the new expiry is written to SQLite at most every EXPIRY_WRITE_INTERVAL
+    of the TTL.
+    """
+
+    # Fraction of the TTL a read must extend the stored expiry by before it is written.
+    EXPIRY_WRITE_INTERVAL = 0.1
+
+    def __init__(self, name, ttl=1800, max_size=10000, path=None, clock=time.time):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._data = OrderedDict()
+        # Expiry last written to SQLite per key.
+        self._persisted = {}
+        self._lock = threading.RLock()
+        self._conn = _connect(path) if path else None
+        self.evictions = 0
+        self.expirations = 0
+        if self._conn is not None:
+            self._db("DELETE FROM flow_state WHERE store = ? AND expires_at <= ?", (name, clock()))
+
+    def _db(self, sql, params):
+        return self._conn.execute(sql, params).fetchall()
+
+    def _purge_expired(self, now):
+        # Entries are kept in access order and share one TTL, so the oldest
+        # ones sit at the front.
+        while self._data:
+            key, (_, expires_at) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            self._data.popitem(last=False)
+            self._persisted.pop(key, None)
+            self.expirations += 1
+
+    def _load(self, key, now):
+        if self._conn is None:
+            return None
+        rows = self._db("SELECT value, expires_at FROM flow_state WHERE store = ? AND key = ?", (self.name, key))
+        if not rows or rows[0][1] <= now:
+            return None
+        try:
+            value = pickle.loads(rows[0][0])
+        except Exception:
+            return None
+        self._persisted[key] = rows[0][1]
+        return value
+
+    def get(self, user_id, default=None):
+        key = str(user_id)
+        now = self.clock()
+        with self._lock:
+            self._purge_expired(now)
+            item = self._data.get(key)
+            if item is not None:
+                value = item[0]
+            else:
+                value = self._load(key, now)
+                if value is None:
+                    return default
+            self._store(key, value, now, persist=False)
+            return value
+
+    def _store(self, key, value, now, persist=True):
+        expires_at = now + self.ttl
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            evicted, _ = self._data.popitem(last=False)
+            self._persisted.pop(evicted, None)
+            self.evictions += 1
+            if self._conn is not None:
+                self._db("DELETE FROM flow_state WHERE store = ? AND key = ?", (self.name, evicted))
+        if self._conn is None:
+            return
+        if persist:
+            self._db(
+                "INSERT OR REPLACE INTO flow_state (store, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.name, key, pickle.dumps(value), expires_at)
+            )
+            self._persisted[key] = expires_at
+        elif expires_at - self._persisted.get(key, 0) >= self.ttl * self.EXPIRY_WRITE_INTERVAL:
+            # Only the sliding expiry moved; keep SQLite close so a restart does not expire the flow early.
+            self._db("UPDATE flow_state SET expires_at = ? WHERE store = ? AND key = ?", (expires_at, self.name, key))
+            self._persisted[key] = expires_at
+
+    def __setitem__(self, user_id, value):
+        now = self.clock()
+        with self._lock:
+            self._purge_expired(now)
+            self._store(str(user_id), value, now)
+
+    def __getitem__(self, user_id):
+        value = self.get(user_id)
+        if value is None:
+            raise KeyError(user_id)
+        return value
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def pop(self, user_id, default=None):
+        key = str(user_id)
+        with self._lock:
+            item = self._data.pop(key, None)
+            value = item[0] if item is not None else self._load(key, self.clock())
+            self._persisted.pop(key, None)
+            if self._conn is not None:
+                self._db("DELETE FROM flow_state WHERE store = ? AND key = ?", (self.name, key))
+        return default if value is None else value
+
+    def __len__(self):
+        with self._lock:
+            self._purge_expired(self.clock())
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "evictions": self.evictions, "expirations": self.expirations}
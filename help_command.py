@@ -9,7 +9,10 @@ def help_command(message):
         "/book - Start a venue booking\n"
         "/cancel - Cancel an existing booking\n"
         "/view - View your active bookings\n"
+        "/calendar - Get links to subscribe to bookings in a calendar app\n"
         "/restart - Restart the bot (admin-only)\n"
+        "/stats - Show bot performance statistics (admin-only)\n"
+        "/reconcile - Check the calendar against bookings; '/reconcile fix' repairs it (admin-only)\n"
         "\nFor further assistance, contact: @winstonzhao or @Jaredee"
     )
     bot.send_message(message.chat.id, help_text)
@@ -0,0 +1,220 @@
+import hashlib
+import hmac
+import threading
+import time
+from datetime import datetime as dt, timezone
+from pytz import utc
+from config import logger, TZ, ICS_FEED_SECRET, ICS_FEED_BASE_URL, ICS_FEED_MAX_AGE
+from booking_model import decode_rows
+from calendar_helpers import build_event
+from venue_catalog import catalog
+import booking_index
+import local_http
+import metrics
+import repository
+
+FEED_PATH = "/calendar"
+KINDS = ("venue", "user")
+_PRODID = "-//Facility Booking Bot//Bookings//EN"
+
+
+def feed_token(kind, key):
+    """Unguessable part of a feed URL, so a user's feed is only readable by whoever was given the link."""
+    return hmac.new(ICS_FEED_SECRET.encode("utf-8"), f"{kind}:{key}".encode("utf-8"),
+                    hashlib.sha256).hexdigest()[:32]
+
+
+def feed_url(kind, key):
+    """Public URL of a feed, or None when ICS_FEED_BASE_URL (and so ICS_FEED_SECRET) is not configured."""
+    if not ICS_FEED_BASE_URL:
+        return None
+    return f"{ICS_FEED_BASE_URL.rstrip('/')}{FEED_PATH}/{kind}/{key}/{feed_token(kind, key)}.ics"
+
+
+def _escape(text):
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line):
+    # RFC 5545: lines longer than 75 octets continue on lines starting with a space.
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+    parts, start, width = [], 0, 75
+    while start < len(data):
+        end = min(start + width, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1  # never split a multi-byte character
+        parts.append(data[start:end].decode("utf-8"))
+        start, width = end, 74
+    return "\r\n ".join(parts)
+
+
+def _utc(value):
+    return TZ.localize(value).astimezone(utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _event_lines(booking, venue):
+    event = build_event(booking, venue)
+    return [
+        "BEGIN:VEVENT",
+        f"UID:booking-{booking.booking_id}@facility-booking-bot",
+        f"DTSTART:{_utc(booking.start)}",
+        f"DTEND:{_utc(booking.end)}",
+        f"SUMMARY:{_escape(event['summary'])}",
+        f"DESCRIPTION:{_escape(event['description'])}",
+        f"LOCATION:{_escape(event['location'])}",
+        "STATUS:CONFIRMED",
+        "END:VEVENT",
+    ]
+
+
+def render_calendar(name, bookings, stamp):
+    """
+    An iCalendar document of the bookings. Returns (events digest, body);
+    the digest leaves out DTSTAMP so a rebuild with the same events can keep
+    its ETag.
+    """
+    events = []
+    for booking in sorted(bookings, key=lambda b: (b.start_minute, b.booking_id)):
+        venue = catalog.get(booking.venue_id) or {"name": "Unknown Venue"}
+        events.append(_event_lines(booking, venue))
+    digest = hashlib.sha1("\n".join("\n".join(e) for e in events).encode("utf-8")).hexdigest()
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{_PRODID}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH",
+             f"X-WR-CALNAME:{_escape(name)}", "X-WR-TIMEZONE:Asia/Singapore"]
+    for event in events:
+        lines.extend(event[:2] + [f"DTSTAMP:{stamp}"] + event[2:])
+    lines.append("END:VCALENDAR")
+    return digest, "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+class _Feed:
+    __slots__ = ("digest", "etag", "body", "built_at")
+
+    def __init__(self, digest, body, built_at):
+        self.digest = digest
+        self.etag = f'"{digest}"'
+        self.body = body.encode("utf-8")
+        self.built_at = built_at
+
+
+class FeedCache:
+    """
+    Rendered .ics feeds of upcoming confirmed bookings, one per venue and
+    one per user, kept in memory. A feed is rebuilt only after a booking
+    index event touches its venue or user, or once it is ICS_FEED_MAX_AGE
+    seconds old (bookings that ended drop out, edits made outside the bot
+    show up), so calendar apps polling it read neither Supabase nor
+    Telegram. The ETag is the digest of the feed's events.
+    """
+
+    def __init__(self, max_age=ICS_FEED_MAX_AGE, clock=time.time):
+        self.max_age = max_age
+        self.clock = clock
+        self._feeds = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a feed built across one is not kept.
+        self._changes = 0
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+        booking_index.subscribe(self._on_booking_event)
+
+    def _on_booking_event(self, event, booking):
+        with self._lock:
+            self._changes += 1
+            self._feeds.pop(("venue", str(booking.venue_id)), None)
+            if booking.user_id is None:
+                # Not known which user's feed shows it.
+                for key in [k for k in self._feeds if k[0] == "user"]:
+                    del self._feeds[key]
+            else:
+                self._feeds.pop(("user", str(booking.user_id)), None)
+
+    def invalidate(self, kind=None, key=None):
+        with self._lock:
+            self._changes += 1
+            if kind is None:
+                self._feeds.clear()
+            else:
+                self._feeds.pop((kind, str(key)), None)
+
+    def _build(self, kind, key):
+        if kind == "venue":
+            venue = catalog.get(key)
+            if venue is None:
+                return None, None
+            name = venue["name"].strip()
+            rows = repository.list_bookings([venue["venue_id"]], "confirmed", upcoming=True)
+        else:
+            rows = [r for r in repository.list_active_bookings(int(key), upcoming=True) if r["status"] == "confirmed"]
+            name = "My bookings"
+        return name, [b for b in decode_rows(rows) if b.valid]
+
+    def get(self, kind, key):
+        """Returns the cached feed, building it if needed, or None for an unknown venue."""
+        cache_key = (kind, str(key))
+        now = self.clock()
+        with self._lock:
+            feed = self._feeds.get(cache_key)
+            if feed is not None and now - feed.built_at < self.max_age:
+                self.hits += 1
+                return feed
+            changes = self._changes
+        name, bookings = self._build(kind, key)
+        if name is None:
+            return None
+        stamp = dt.fromtimestamp(now, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        digest, body = render_calendar(name, bookings, stamp)
+        with self._lock:
+            self.builds += 1
+            if feed is not None and feed.digest == digest:
+                feed.built_at = now
+            else:
+                feed = _Feed(digest, body, now)
+            if changes == self._changes:
+                self._feeds[cache_key] = feed
+        return feed
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._feeds), "hits": self.hits, "builds": self.builds,
+                    "not_modified": self.not_modified}
+
+
+def _matches(if_none_match, etag):
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
+def feed_app(environ, start_response):
+    """GET /calendar/<venue|user>/<id>/<token>.ics"""
+    if environ.get("REQUEST_METHOD") not in ("GET", "HEAD"):
+        return local_http.respond(start_response, "405 Method Not Allowed", "GET only")
+    parts = environ.get("PATH_INFO", "")[len(FEED_PATH):].strip("/").split("/")
+    if len(parts) != 3 or parts[0] not in KINDS or not parts[1].isdigit() or not parts[2].endswith(".ics"):
+        return local_http.respond(start_response, "404 Not Found", "not found")
+    kind, key, token = parts[0], parts[1], parts[2][:-len(".ics")]
+    if not ICS_FEED_SECRET or not hmac.compare_digest(token, feed_token(kind, key)):
+        return local_http.respond(start_response, "404 Not Found", "not found")
+    try:
+        feed = feeds.get(kind, key)
+    except Exception:
+        logger.exception(f"Failed to build the {kind} {key} calendar feed:")
+        return local_http.respond(start_response, "503 Service Unavailable", "feed unavailable")
+    if feed is None:
+        return local_http.respond(start_response, "404 Not Found", "not found")
+    headers = [("ETag", feed.etag), ("Cache-Control", "no-cache")]
+    if _matches(environ.get("HTTP_IF_NONE_MATCH", ""), feed.etag):
+        feeds.not_modified += 1
+        start_response("304 Not Modified", headers)
+        return [b""]
+    body = feed.body if environ["REQUEST_METHOD"] == "GET" else b""
+    start_response("200 OK", [("Content-Type", "text/calendar; charset=utf-8"),
+                              ("Content-Length", str(len(feed.body)))] + headers)
+    return [body]
+
+
+feeds = FeedCache()
+metrics.register_gauges("ics_feed", feeds.stats)
@@ -0,0 +1,102 @@
+import itertools
+import queue
+import threading
+import telebot
+
+_STOP = object()
+
+
+class KeyedExecutor:
+    """
+    Fixed pool of worker threads where every task with the same key runs on
+    the same worker, so tasks for one key execute strictly in submission
+    order while different keys run in parallel.
+    """
+
+    def __init__(self, num_workers=8, name="keyed"):
+        self.num_workers = max(1, num_workers)
+        self._queues = [queue.Queue() for _ in range(self.num_workers)]
+        self._round_robin = itertools.count()
+        self._threads = []
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._worker, args=(q,), name=f"{name}-{i}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _worker(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                fn, args, kwargs = item
+                fn(*args, **kwargs)
+            except Exception:
+                telebot.logger.exception("Unhandled exception in keyed worker:")
+            finally:
+                q.task_done()
+
+    def submit(self, key, fn, *args, **kwargs):
+        if key is None:
+            index = next(self._round_robin) % self.num_workers
+        else:
+            index = hash(key) % self.num_workers
+        self._queues[index].put((fn, args, kwargs))
+
+    def backlog(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def shutdown(self, wait=True):
+        """Runs everything already submitted, then stops the workers."""
+        for q in self._queues:
+            q.put(_STOP)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+
+def update_key(obj):
+    """Returns the user an update belongs to, or None for batch/system tasks."""
+    user = getattr(obj, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(obj, "chat", None)
+    if chat is not None:
+        return chat.id
+    return None
+
+
+class KeyedTeleBot(telebot.TeleBot):
+    """
+    TeleBot that runs handlers on a KeyedExecutor keyed by the sending user.
+    Updates from different users are handled concurrently; updates from one
+    user are handled in the order received, which register_next_step_handler
+    flows depend on.
+    """
+
+    def __init__(self, token, num_workers=8, **kwargs):
+        # Handlers are dispatched by _exec_task below, not telebot's own pool.
+        kwargs["threaded"] = False
+        super().__init__(token, **kwargs)
+        self.executor = KeyedExecutor(num_workers, name="handler")
+
+    def _exec_task(self, task, *args, **kwargs):
+        key = update_key(args[0]) if args else None
+        self.executor.submit(key, super()._exec_task, task, *args, **kwargs)
+
+    def _notify_next_handlers(self, new_messages):
+        # Same as telebot's, but without popping from the list being iterated,
+        # which skips the next user's message when one batch holds several.
+        handled = []
+        for message in new_messages:
+            handlers = self.next_step_backend.get_handlers(message.chat.id)
+            if handlers:
+                for handler in handlers:
+                    self._exec_task(handler["callback"], message, *handler["args"], **handler["kwargs"])
+                handled.append(message)
+        for message in handled:
+            new_messages.remove(message)
+
+    def stop_bot(self):
+        super().stop_bot()
+        self.executor.shutdown()
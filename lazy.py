@@ -0,0 +1,38 @@
+import threading
+
+
+class Lazy:
+    """
+    Thread-safe lazily built singleton. Attribute access is forwarded to the
+    object returned by `factory`, which is called once, on first use.
+    """
+
+    def __init__(self, factory, name=None):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "client")
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def override(self, instance):
+        """Replaces the wrapped object, e.g. with a fake backend."""
+        with self._lock:
+            self._instance = instance
+
+    @property
+    def is_built(self):
+        return self._instance is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"<Lazy {self._name} built={self.is_built}>"
@@ -0,0 +1,58 @@
+import ipaddress
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+# (path prefix, WSGI app); the longest matching prefix wins.
+_routes = []
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def route(prefix, app):
+    _routes.append((prefix, app))
+    _routes.sort(key=lambda r: len(r[0]), reverse=True)
+
+
+def respond(start_response, status, body=b"", content_type="text/plain; charset=utf-8", headers=()):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body)))] + list(headers))
+    return [body]
+
+
+def loopback_only(app):
+    """Wraps app so it answers only direct requests from this host; others get a 404."""
+    def guarded(environ, start_response):
+        try:
+            local = ipaddress.ip_address(environ.get("REMOTE_ADDR", "")).is_loopback
+        except ValueError:
+            local = False
+        # A reverse proxy on this host connects from loopback on behalf of anyone.
+        if not local or environ.get("HTTP_X_FORWARDED_FOR") or environ.get("HTTP_FORWARDED"):
+            return respond(start_response, "404 Not Found", "not found")
+        return app(environ, start_response)
+    return guarded
+
+
+def application(environ, start_response):
+    path = environ.get("PATH_INFO", "")
+    for prefix, app in _routes:
+        if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+            return app(environ, start_response)
+    return respond(start_response, "404 Not Found", "not found")
+
+
+def serve(host, port):
+    """Starts the local HTTP server on a background thread and returns it."""
+    server = make_server(host, port, application,
+                         server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name="local-http", daemon=True).start()
+    return server
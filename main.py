@@ -1,17 +1,63 @@
-from config import logger, bot
-import help_command
-import registration
-import booking_flow
-import booking_utils
-import admin
-import approval
-import view_cancel
-import restart
+import startup
+
+with startup.phase("config"):
+    from config import (logger, bot, BOT_MODE, HTTP_ENABLED, HTTP_HOST, HTTP_PORT,
+                        ICS_FEED_BASE_URL, ICS_FEED_SECRET)
+with startup.phase("services"):
+    from replica import replica
+    from venue_catalog import catalog
+    from calendar_sync import get_outbox
+    from calendar_reconcile import get_reconciler
+    from dispatcher import dispatcher
+    from occupancy import occupancy
+    from reminders import reminders
+    from maintenance import maintenance
+    from webhook import run_webhook
+    import ics_feed
+    import local_http
+    import metrics
+with startup.phase("handlers"):
+    import help_command
+    import registration
+    import booking_flow
+    import booking_utils
+    import admin
+    import approval
+    import view_cancel
+    import restart
+    import stats_command
+    import reconcile_command
+    import calendar_command
 
 if __name__ == "__main__":
-    logger.critical("Bot is starting polling...")
-    try:
-        bot.polling(none_stop=True)
-    except Exception:
-        logger.exception("Unhandled exception in bot polling:")
-        raise
\ No newline at end of file
+    with startup.phase("workers"):
+        # The catalog and replica load in the background; clients are built on first use.
+        if replica is not None:
+            replica.start()
+        catalog.start()
+        get_outbox().start()
+        get_reconciler().start()
+        occupancy.start()
+        reminders.start()
+        maintenance.start()
+        if ICS_FEED_BASE_URL:
+            # The server is reachable from outside for the feeds; metrics are not for them.
+            local_http.route("/metrics", local_http.loopback_only(metrics.metrics_app))
+        else:
+            local_http.route("/metrics", metrics.metrics_app)
+        if ICS_FEED_SECRET:
+            local_http.route(ics_feed.FEED_PATH, ics_feed.feed_app)
+        server = local_http.serve(HTTP_HOST, HTTP_PORT) if HTTP_ENABLED or BOT_MODE == "webhook" else None
+    logger.critical(startup.report())
+    if BOT_MODE == "webhook":
+        run_webhook(server, on_shutdown=[reminders.stop, maintenance.stop, get_reconciler().stop,
+                                         lambda: dispatcher.stop(timeout=10), get_outbox().stop])
+    else:
+        logger.critical("Bot is starting polling...")
+        try:
+            # A webhook left over from webhook mode makes getUpdates fail.
+            bot.remove_webhook()
+            bot.polling(none_stop=True)
+        except Exception:
+            logger.exception("Unhandled exception in bot polling:")
+            raise
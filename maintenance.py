@@ -0,0 +1,112 @@
+import threading
+from datetime import timedelta
+from config import logger, MAINTENANCE_INTERVAL, ARCHIVE_AFTER_DAYS, MAINTENANCE_BATCH_SIZE
+from booking_model import decode_rows
+from notifications import notify_expirations
+import metrics
+import repository
+
+# Rows in these states are finished once they are in the past.
+ARCHIVE_STATUSES = ("confirmed", "cancelled", "expired")
+# Requests that started longer ago than this expire silently (e.g. the
+# backlog found on the first run); nobody is waiting on them any more.
+NOTIFY_WITHIN = timedelta(days=7)
+
+
+class MaintenanceJob:
+    """
+    Periodic housekeeping for the bookings table:
+
+    - pending requests whose start time has passed are marked "expired" and
+      their requesters told, one message per requester per run (unless
+      the request is older than NOTIFY_WITHIN);
+    - finished bookings that started more than ARCHIVE_AFTER_DAYS ago are
+      copied to bookings_archive and deleted from bookings, so listings and
+      the replica only carry recent rows.
+
+    Both work in batches of MAINTENANCE_BATCH_SIZE rows. The status-guarded
+    update makes expiry safe to run on several instances at once.
+    """
+
+    def __init__(self, interval=MAINTENANCE_INTERVAL, archive_after_days=ARCHIVE_AFTER_DAYS,
+                 batch_size=MAINTENANCE_BATCH_SIZE):
+        self.interval = interval
+        self.archive_after_days = archive_after_days
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.errors = 0
+        self.expired = 0
+        self.archived = 0
+
+    def expire_pending(self, now=None):
+        """Expires pending requests that started before `now`; returns how many."""
+        now = now or repository.local_now()
+        total = 0
+        while True:
+            stale = repository.list_bookings_before(["pending approval"], now, limit=self.batch_size)
+            if not stale:
+                break
+            rows = repository.update_bookings(
+                [r["booking_id"] for r in stale], {"status": "expired"}, status="pending approval"
+            )
+            notify_expirations([b for b in decode_rows(rows) if b.start >= now - NOTIFY_WITHIN])
+            total += len(rows)
+            # No progress means another instance got there first (and our read was stale).
+            if not rows or len(stale) < self.batch_size:
+                break
+        self.expired += total
+        return total
+
+    def archive(self, now=None):
+        """Moves finished bookings older than the archive window; returns how many."""
+        if self.archive_after_days <= 0:
+            return 0
+        cutoff = (now or repository.local_now()) - timedelta(days=self.archive_after_days)
+        total = 0
+        while True:
+            # Read from Supabase: a replica row may be an older version than the one archived.
+            rows = repository.list_bookings_before(ARCHIVE_STATUSES, cutoff, limit=self.batch_size, columns="*",
+                                                   use_replica=False)
+            if not rows:
+                break
+            archived = repository.archive_bookings(rows)
+            deleted = repository.delete_bookings([r["booking_id"] for r in archived], ARCHIVE_STATUSES, cutoff)
+            total += len(deleted)
+            if not deleted or len(rows) < self.batch_size:
+                break
+        self.archived += total
+        return total
+
+    def run_once(self, now=None):
+        expired = self.expire_pending(now)
+        archived = self.archive(now)
+        self.runs += 1
+        if expired or archived:
+            logger.info(f"Maintenance: expired {expired} pending requests, archived {archived} bookings.")
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                self.errors += 1
+                logger.exception("Maintenance run failed:")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        return {"runs": self.runs, "errors": self.errors, "expired": self.expired, "archived": self.archived}
+
+
+maintenance = MaintenanceJob()
+metrics.register_gauges("maintenance", maintenance.stats)
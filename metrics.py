@@ -0,0 +1,210 @@
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "total", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+# Characters Prometheus does not allow in a metric name.
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+_series = {}
+_gauges = []
+_observers = []
+_lock = threading.Lock()
+
+
+def observe(kind, name, seconds, error=False):
+    key = (kind, name)
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        series.observe(seconds, error)
+    for observer in _observers:
+        observer(kind, name, seconds, error)
+
+
+def add_observer(observer):
+    """Registers observer(kind, name, seconds, error), called with every raw sample."""
+    _observers.append(observer)
+
+
+@contextmanager
+def timed(kind, name):
+    begin = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        observe(kind, name, time.perf_counter() - begin, error)
+
+
+def wrap(kind, name, fn):
+    @functools.wraps(fn)
+    def timed_call(*args, **kwargs):
+        with timed(kind, name):
+            return fn(*args, **kwargs)
+    return timed_call
+
+
+def _metric_name(name):
+    """name with every character Prometheus does not allow replaced by "_"."""
+    name = _INVALID_NAME_CHARS.sub("_", str(name))
+    return name if name[:1].isalpha() or name[:1] == "_" else f"_{name}"
+
+
+def register_gauges(prefix, provider):
+    """
+    provider() returns {name: number}; exported as bot_<prefix>_<name>, with
+    characters not allowed in a metric name replaced by "_".
+    """
+    _gauges.append((_metric_name(prefix), provider))
+
+
+def _gauge_values():
+    values = []
+    for prefix, provider in _gauges:
+        try:
+            for name, value in provider().items():
+                values.append((_metric_name(f"bot_{prefix}_{name}"), value))
+        except Exception:
+            continue
+    return values
+
+
+def render_prometheus():
+    lines = [
+        "# HELP bot_latency_seconds Latency of handlers and backend calls.",
+        "# TYPE bot_latency_seconds histogram",
+    ]
+    with _lock:
+        items = sorted(_series.items())
+        for (kind, name), s in items:
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), s.buckets):
+                cumulative += n
+                lines.append(f'bot_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"bot_latency_seconds_sum{{{labels}}} {s.total:.6f}")
+            lines.append(f"bot_latency_seconds_count{{{labels}}} {s.count}")
+        lines.append("# TYPE bot_errors_total counter")
+        for (kind, name), s in items:
+            lines.append(f'bot_errors_total{{kind="{kind}",name="{name}"}} {s.errors}')
+    for name, value in _gauge_values():
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def render_summary():
+    """Compact human-readable table for the /stats command."""
+    lines = []
+    with _lock:
+        items = sorted(_series.items())
+        for (kind, name), s in items:
+            error_rate = 100.0 * s.errors / s.count if s.count else 0.0
+            lines.append(
+                f"{kind}/{name}: n={s.count} avg={1000 * s.total / s.count:.0f}ms "
+                f"p50<={1000 * s.quantile(0.5):.0f}ms p95<={1000 * s.quantile(0.95):.0f}ms err={error_rate:.1f}%"
+            )
+    for name, value in _gauge_values():
+        lines.append(f"{name} = {value}")
+    return "\n".join(lines) if lines else "No metrics recorded yet."
+
+
+def metrics_app(environ, start_response):
+    body = render_prometheus().encode("utf-8")
+    start_response("200 OK", [("Content-Type", "text/plain; version=0.0.4"), ("Content-Length", str(len(body)))])
+    return [body]
+
+
+def instrument_bot(bot):
+    """
+    Times every message/callback handler, next-step handler and outgoing
+    send_message/edit_message_text call on this bot instance. Must run before
+    handler modules register their handlers.
+    """
+    add_message_handler = bot.add_message_handler
+    add_callback_query_handler = bot.add_callback_query_handler
+    exec_task = bot._exec_task
+
+    def timed_handler_dict(handler_dict):
+        fn = handler_dict["function"]
+        handler_dict["function"] = wrap("handler", fn.__name__, fn)
+        return handler_dict
+
+    def timed_exec_task(task, *args, **kwargs):
+        # Registered handlers run through bot methods and are already timed;
+        # plain functions here are next-step handlers.
+        if getattr(task, "__self__", None) is not bot:
+            task = wrap("handler", getattr(task, "__name__", "task"), task)
+        return exec_task(task, *args, **kwargs)
+
+    bot.add_message_handler = lambda handler_dict: add_message_handler(timed_handler_dict(handler_dict))
+    bot.add_callback_query_handler = lambda handler_dict: add_callback_query_handler(timed_handler_dict(handler_dict))
+    bot._exec_task = timed_exec_task
+    bot.send_message = wrap("telegram", "send_message", bot.send_message)
+    bot.edit_message_text = wrap("telegram", "edit_message_text", bot.edit_message_text)
+
+
+def _table_of(builder):
+    request = getattr(builder, "request", builder)
+    path = str(getattr(request, "path", None) or getattr(builder, "path", "") or "")
+    return path.rstrip("/").rsplit("/", 1)[-1] or "unknown"
+
+
+def instrument_postgrest():
+    """Times every Supabase (postgrest) query .execute(), labelled by table."""
+    try:
+        from postgrest._sync import request_builder
+    except ImportError:
+        return
+    for cls_name in ("SyncQueryRequestBuilder", "SyncSingleRequestBuilder", "SyncMaybeSingleRequestBuilder"):
+        cls = getattr(request_builder, cls_name, None)
+        if cls is None or getattr(cls.execute, "_instrumented", False):
+            continue
+        original = cls.execute
+
+        def execute(self, _original=original):
+            with timed("supabase", _table_of(self)):
+                return _original(self)
+        execute._instrumented = True
+        cls.execute = execute
@@ -1,72 +1,80 @@
-from datetime import datetime as dt
-from config import bot, GROUP_CHAT_IDS, supabase
-from db_helpers import parse_duration, get_user_info
+from collections import defaultdict
+from config import GROUP_CHAT_IDS
+from dispatcher import notify, PRIORITY_HIGH, PRIORITY_LOW
+from db_helpers import get_user_info, get_user_names
+from booking_listing import format_booking, chunk_messages
+from booking_model import as_booking, decode_rows
+from venue_catalog import catalog
+import repository
 
 def notify_approval(booking):
-    booking_id = booking["booking_id"]
-    user_id = booking["user_id"]
-    user_info = get_user_info(user_id)
-    user_name = user_info.get("name", "Unknown User") if user_info else "Unknown User"
-    venue_data = supabase.table("venues").select("*").eq("venue_id", booking["venue_id"]).execute()
-    venue = venue_data.data[0] if venue_data.data else {}
-    venue_name = venue.get("name", "Unknown Venue")
-    booking_start = dt.fromisoformat(booking["booking_date"])
-    dur = parse_duration(booking["duration"])
-    end_dt = booking_start + dur
-    start_str = booking_start.strftime("%Y-%m-%d %H:%M")
-    end_str = end_dt.strftime("%Y-%m-%d %H:%M")
-    detail_message = (
-        f"Booking ID: {booking_id}\n"
-        f"Venue: {venue_name}\n"
-        f"Name: {user_name}\n"
-        f"Start: {start_str}\n"
-        f"End: {end_str}\n"
-        f"Status: {booking['status']}\n"
-        f"Reason: {booking.get('reason','')}\n"
-        "----------------------"
-    )
-    try:
-        bot.send_message(user_id, f"Your booking has been approved!\n\n{detail_message}")
-    except Exception as e:
-        print(f"Failed to message user {user_id}: {e}")
-    broadcast_text = f"Booking Approved!\n\n{detail_message}"
+    notify_approvals([as_booking(booking)])
+
+def notify_approvals(bookings):
+    """
+    Tells each requester about all of their newly approved bookings in one
+    message, and each group chat about the whole batch in one message
+    (split only where Telegram's length limit requires).
+    """
+    bookings = decode_rows(bookings)
+    if not bookings:
+        return
+    names = get_user_names({b.user_id for b in bookings})
+    blocks_by_user = defaultdict(list)
+    blocks = []
+    for b in bookings:
+        block = format_booking(b, catalog.name_of(b.venue_id), names.get(str(b.user_id), "Unknown User"))
+        blocks_by_user[b.user_id].append(block)
+        blocks.append(block)
+    for user_id, user_blocks in blocks_by_user.items():
+        header = "Your booking has been approved!\n" if len(user_blocks) == 1 else \
+            f"{len(user_blocks)} of your bookings have been approved!\n"
+        for text in chunk_messages(header, user_blocks):
+            notify(user_id, text, priority=PRIORITY_HIGH)
+    header = "Booking Approved!\n" if len(blocks) == 1 else f"{len(blocks)} Bookings Approved!\n"
     for chat_id in GROUP_CHAT_IDS:
-        try:
-            bot.send_message(chat_id, broadcast_text)
-        except Exception as e:
-            print(f"Failed to notify group {chat_id}: {e}")
+        for text in chunk_messages(header, blocks):
+            notify(chat_id, text, priority=PRIORITY_LOW)
 
 def notify_jcrc_of_new_request(booking):
-    jcrc_result = supabase.table("users").select("*").eq("role", "JCRC").execute()
-    jcrc_users = jcrc_result.data if jcrc_result.data else []
+    jcrc_users = repository.list_users(role="JCRC")
     if not jcrc_users:
         return
-    booking_id = booking["booking_id"]
     user_id = booking["user_id"]
     user_info = get_user_info(user_id)
     user_name = user_info.get("name", "Unknown User") if user_info else "Unknown User"
-    venue_data = supabase.table("venues").select("*").eq("venue_id", booking["venue_id"]).execute()
-    venue = venue_data.data[0] if venue_data.data else {}
-    venue_name = venue.get("name", "Unknown Venue")
-    booking_start = dt.fromisoformat(booking["booking_date"])
-    dur = parse_duration(booking["duration"])
-    end_dt = booking_start + dur
-    start_str = booking_start.strftime("%Y-%m-%d %H:%M")
-    end_str = end_dt.strftime("%Y-%m-%d %H:%M")
-    detail_msg = (
-        f"New booking request (Pending Approval)!\n"
-        f"Booking ID: {booking_id}\n"
-        f"Venue: {venue_name}\n"
-        f"Name: {user_name}\n"
-        f"Start: {start_str}\n"
-        f"End: {end_str}\n"
-        f"Status: {booking['status']}\n"
-        f"Reason: {booking.get('reason', '')}\n"
-        "----------------------"
-    )
+    detail_msg = "New booking request (Pending Approval)!\n" + \
+        format_booking(booking, catalog.name_of(booking["venue_id"]), user_name)
     for jcrc_user in jcrc_users:
-        jcrc_user_id = jcrc_user["user_id"]
-        try:
-            bot.send_message(jcrc_user_id, detail_msg)
-        except Exception as e:
-            print(f"Failed to notify JCRC user {jcrc_user_id}: {e}")
+        notify(jcrc_user["user_id"], detail_msg)
+
+def notify_jcrc_of_new_series(bookings):
+    """One request per JCRC member for a whole recurring series, listing every occurrence."""
+    bookings = decode_rows(bookings)
+    jcrc_users = repository.list_users(role="JCRC")
+    if not bookings or not jcrc_users:
+        return
+    first = bookings[0]
+    user_info = get_user_info(first.user_id)
+    user_name = user_info.get("name", "Unknown User") if user_info else "Unknown User"
+    venue_name = catalog.name_of(first.venue_id)
+    header = f"New recurring booking request (Pending Approval), {len(bookings)} bookings!\n"
+    blocks = [format_booking(b, venue_name, user_name) for b in bookings]
+    for jcrc_user in jcrc_users:
+        for text in chunk_messages(header, blocks):
+            notify(jcrc_user["user_id"], text)
+
+def notify_expirations(bookings):
+    """Tells each requester, in one message, which of their requests expired unapproved."""
+    bookings = decode_rows(bookings)
+    blocks_by_user = defaultdict(list)
+    for b in bookings:
+        blocks_by_user[b.user_id].append(
+            f"- {catalog.name_of(b.venue_id)} on {b.date_text} from {b.start_hm} (Booking ID {b.booking_id})"
+        )
+    for user_id, blocks in blocks_by_user.items():
+        header = "Your booking request expired before it was approved:" if len(blocks) == 1 else \
+            f"{len(blocks)} of your booking requests expired before they were approved:"
+        blocks = blocks + ["Press /book to make a new request."]
+        for text in chunk_messages(header, blocks):
+            notify(user_id, text)
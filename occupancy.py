@@ -0,0 +1,95 @@
+import threading
+from bisect import insort
+from datetime import datetime as dt, timedelta
+from config import TZ, logger
+import booking_index
+
+WINDOW_DAYS = 7
+
+
+class _VenueWeek:
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.text = None
+
+
+class OccupancyView:
+    """
+    Materialized "next 7 days" occupancy per venue with its rendered summary.
+    Built from the in-memory booking index, patched by booking index events
+    and rolled forward at midnight (config.TZ), so serving it reads no data.
+    """
+
+    def __init__(self):
+        self._venues = {}
+        self._window_start = None
+        self._lock = threading.Lock()
+        self._timer = None
+        booking_index.subscribe(self._on_booking_event)
+
+    def _window(self):
+        start = dt.now(TZ).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        # Same range the venue-selection query used: today through day 7, inclusive.
+        return start, start + timedelta(days=WINDOW_DAYS + 1)
+
+    def _roll_if_needed(self):
+        start, _ = self._window()
+        if start != self._window_start:
+            self._window_start = start
+            self._venues.clear()
+
+    def _week(self, venue_id):
+        key = str(venue_id)
+        week = self._venues.get(key)
+        if week is None:
+            start, end = self._window()
+            week = _VenueWeek(booking_index.intervals_starting_between(venue_id, start, end))
+            self._venues[key] = week
+        return week
+
+    def summary(self, venue_id):
+        """Returns the "Slots booked" text for the venue, or None when nothing is booked."""
+        with self._lock:
+            self._roll_if_needed()
+            week = self._week(venue_id)
+            if not week.entries:
+                return None
+            if week.text is None:
+                msg = "Slots booked for this venue for the next 7 days:\n"
+                for b_start, b_end, _ in week.entries:
+                    msg += f"Date: {b_start.strftime('%Y-%m-%d')}, {b_start.strftime('%H:%M')} - {b_end.strftime('%H:%M')}\n"
+                week.text = msg
+            return week.text
+
+    def _on_booking_event(self, event, booking):
+        start, end = booking_index.booking_interval(booking)
+        with self._lock:
+            week = self._venues.get(str(booking["venue_id"]))
+            if week is None or not (self._window_start <= start < self._window_start + timedelta(days=WINDOW_DAYS + 1)):
+                return
+            week.entries = [e for e in week.entries if e[2] != booking["booking_id"]]
+            if event == "added":
+                insort(week.entries, (start, end, booking["booking_id"]))
+            week.text = None
+
+    def roll(self):
+        with self._lock:
+            self._roll_if_needed()
+
+    def start(self):
+        """Schedules the midnight roll-over, rescheduling itself each day."""
+        now = dt.now(TZ)
+        next_midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._timer = threading.Timer((next_midnight - now).total_seconds() + 1, self._midnight)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _midnight(self):
+        try:
+            self.roll()
+        except Exception:
+            logger.exception("Occupancy roll-over failed:")
+        self.start()
+
+
+occupancy = OccupancyView()
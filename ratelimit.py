@@ -0,0 +1,83 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1.0):
+        """
+        Takes tokens if available and returns 0. Otherwise takes nothing and
+        returns the number of seconds until enough tokens will be available.
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1.0):
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        """Empties the bucket so nothing is granted for `seconds` (e.g. after a 429)."""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class BucketMap:
+    """Lazily created token buckets keyed by chat, user, etc."""
+
+    def __init__(self, rate_for, capacity_for=None, max_idle=3600, clock=time.monotonic):
+        self.rate_for = rate_for
+        self.capacity_for = capacity_for
+        self.max_idle = max_idle
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+
+    def get(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                capacity = self.capacity_for(key) if self.capacity_for else None
+                bucket = TokenBucket(self.rate_for(key), capacity, clock=self.clock)
+                self._buckets[key] = bucket
+            now = self.clock()
+            if now - self._last_sweep > self.max_idle:
+                self._sweep(now)
+            return bucket
+
+    def _sweep(self, now):
+        # Full, idle buckets carry no state worth keeping.
+        for key in [k for k, b in self._buckets.items()
+                    if now - b.updated > self.max_idle
+                    and b.tokens + (now - b.updated) * b.rate >= b.capacity]:
+            del self._buckets[key]
+        self._last_sweep = now
+
+    def __len__(self):
+        return len(self._buckets)
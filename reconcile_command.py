@@ -0,0 +1,14 @@
+from config import bot
+from db_helpers import get_user_info
+from calendar_reconcile import get_reconciler, format_report
+
+@bot.message_handler(commands=['reconcile'])
+def reconcile_command(message):
+    user = get_user_info(message.from_user.id)
+    if not user or user["role"].strip().lower() != "admin":
+        bot.send_message(message.from_user.id, "You do not have permission to reconcile the calendar. Press /start to restart.")
+        return
+    # "/reconcile" only reports; "/reconcile fix" also queues the repairs.
+    dry_run = message.text.split()[1:2] != ["fix"]
+    report = get_reconciler().run(dry_run=dry_run)
+    bot.send_message(message.from_user.id, format_report(report, dry_run))
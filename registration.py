@@ -1,6 +1,7 @@
-from config import bot, supabase, user_booking_flow
+from config import bot, user_booking_flow
 from telebot import types
-from db_helpers import get_user_info
+from db_helpers import get_user_info, invalidate_user
+import repository
 
 @bot.message_handler(commands=['start'])
 def start(message):
@@ -33,7 +34,8 @@ def register_new_user(message):
         "cca": "No CCA",
         "block": None,
     }
-    supabase.table("users").insert(new_user).execute()
+    repository.insert_user(new_user)
+    invalidate_user(user_id)
     bot.send_message(
         user_id, f"Thanks {name}! You are now registered as a Resident."
     )
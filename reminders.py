@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import threading
+import time
+from config import logger, TZ, REMINDER_OFFSETS, REMINDER_RATE, REMINDER_GRACE
+from dispatcher import notify, PRIORITY_LOW
+from ratelimit import TokenBucket
+from booking_model import as_booking, decode_rows
+from venue_catalog import catalog
+import booking_index
+import metrics
+import repository
+
+# A failed re-check is retried this many seconds later, for as long as the
+# reminder is still within REMINDER_GRACE of its due time.
+RETRY_DELAY = 30
+
+
+def _describe(minutes):
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return "1 hour" if hours == 1 else f"{hours} hours"
+    return "1 minute" if minutes == 1 else f"{minutes} minutes"
+
+
+class ReminderScheduler:
+    """
+    Sends each confirmed booking's owner a reminder REMINDER_OFFSETS minutes
+    before it starts. All reminders sit in one heap ordered by due time and
+    a single thread sleeps until the earliest one. The heap is loaded once
+    from upcoming confirmed bookings and then follows booking index events,
+    so the database is only read again to re-check bookings about to be
+    reminded.
+
+    Removing a booking bumps its generation; heap entries of an older
+    generation are dropped when they come up instead of being searched for.
+    A booking's generation is forgotten with its last heap entry, and due
+    reminders whose re-check read fails are retried, not lost.
+    """
+
+    def __init__(self, offsets=REMINDER_OFFSETS, rate=REMINDER_RATE, grace=REMINDER_GRACE, clock=time.time):
+        self.offsets = sorted(set(offsets), reverse=True)
+        self.grace = grace
+        self.clock = clock
+        self.bucket = TokenBucket(rate)
+        self._heap = []
+        self._generation = {}
+        # Heap entries (of any generation) per booking; the generation is
+        # forgotten once none are left.
+        self._queued = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.sent = 0
+        self.dropped = 0
+        booking_index.subscribe(self._on_booking_event)
+
+    # -- scheduling ---------------------------------------------------------
+
+    def schedule(self, booking, grace=0.0):
+        """
+        (Re)schedules the reminders of a confirmed booking. Reminders due more
+        than `grace` seconds ago are skipped: a booking made 10 minutes before
+        it starts gets no "30 minutes" reminder.
+        """
+        booking = as_booking(booking)
+        starts_at = TZ.localize(booking.start).timestamp()
+        now = self.clock()
+        with self._cond:
+            # Drawn from the shared sequence, so a generation is never reused
+            # even after the booking's entry was forgotten.
+            generation = next(self._seq)
+            self._generation[booking.booking_id] = generation
+            earliest = self._heap[0][0] if self._heap else None
+            for minutes in self.offsets:
+                due = starts_at - minutes * 60
+                if due < now - grace:
+                    continue
+                self._push((due, next(self._seq), booking.booking_id, generation, minutes))
+            if booking.booking_id not in self._queued:
+                del self._generation[booking.booking_id]
+            if self._heap and self._heap[0][0] != earliest:
+                self._cond.notify()
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, entry)
+        self._queued[entry[2]] = self._queued.get(entry[2], 0) + 1
+
+    def _pop(self):
+        entry = heapq.heappop(self._heap)
+        booking_id = entry[2]
+        live = self._generation.get(booking_id) == entry[3]
+        self._queued[booking_id] -= 1
+        if not self._queued[booking_id]:
+            del self._queued[booking_id]
+            self._generation.pop(booking_id, None)
+        return entry, live
+
+    def unschedule(self, booking_id):
+        with self._cond:
+            if booking_id in self._generation:
+                self._generation[booking_id] = next(self._seq)
+
+    def _on_booking_event(self, event, booking):
+        if event == "added":
+            self.schedule(booking)
+        else:
+            self.unschedule(as_booking(booking).booking_id)
+
+    def load(self):
+        """
+        Schedules every upcoming confirmed booking, including reminders that
+        fell due up to REMINDER_GRACE seconds ago (e.g. during a restart).
+        """
+        rows = repository.list_bookings([v["venue_id"] for v in catalog.all()], "confirmed", upcoming=True)
+        for booking in decode_rows(rows):
+            self.schedule(booking, grace=self.grace)
+
+    def pending(self):
+        with self._cond:
+            return sum(1 for _, _, booking_id, generation, _ in self._heap
+                       if self._generation.get(booking_id) == generation)
+
+    # -- sending ------------------------------------------------------------
+
+    def _pop_due(self):
+        """Waits for the next due reminders and returns them, or None when stopping."""
+        with self._cond:
+            while not self._stopping:
+                # Discard cancelled entries at the top so they do not set the wait.
+                while self._heap and self._generation.get(self._heap[0][2]) != self._heap[0][3]:
+                    self._pop()
+                    self.dropped += 1
+                now = self.clock()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        entry, live = self._pop()
+                        if live:
+                            due.append(entry)
+                    return due
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            return None
+
+    def _retry(self, due):
+        """Puts reminders whose re-check failed back on the heap, RETRY_DELAY seconds on."""
+        retry_at = self.clock() + RETRY_DELAY
+        with self._cond:
+            for due_at, _, booking_id, generation, minutes in due:
+                # Pushed back past its grace the reminder would be too late to
+                # be useful; a booking rescheduled meanwhile has a new generation.
+                if retry_at - due_at > self.grace or self._generation.get(booking_id, generation) != generation:
+                    self.dropped += 1
+                    continue
+                self._generation[booking_id] = generation
+                self._push((retry_at, next(self._seq), booking_id, generation, minutes))
+            self._cond.notify()
+
+    def _send(self, due):
+        # One read re-checks everything due together (a change made by another
+        # instance may not have reached this one's index).
+        try:
+            rows = repository.get_bookings({e[2] for e in due})
+        except Exception:
+            logger.exception("Re-checking due booking reminders failed; retrying:")
+            self._retry(due)
+            return
+        bookings = {b.booking_id: b for b in decode_rows(rows)}
+        for _, _, booking_id, _, minutes in due:
+            booking = bookings.get(booking_id)
+            if booking is None or booking.status != "confirmed":
+                self.dropped += 1
+                continue
+            self.bucket.acquire()
+            notify(
+                booking.user_id,
+                f"Reminder: your booking for {catalog.name_of(booking.venue_id)} starts in {_describe(minutes)}, "
+                f"on {booking.date_text} from {booking.start_hm} to {booking.end_hm} (Booking ID {booking_id}).\n"
+                "If you no longer need it, please /cancel it so others can book the venue.",
+                priority=PRIORITY_LOW
+            )
+            self.sent += 1
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Loading booking reminders failed:")
+        while True:
+            due = self._pop_due()
+            if due is None:
+                return
+            try:
+                self._send(due)
+            except Exception:
+                logger.exception("Sending booking reminders failed:")
+
+    def start(self):
+        if self._thread is not None or not self.offsets:
+            return
+        self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"pending": self.pending(), "sent": self.sent, "dropped": self.dropped}
+
+
+reminders = ReminderScheduler()
+metrics.register_gauges("reminders", reminders.stats)
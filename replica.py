@@ -0,0 +1,281 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime as dt, timedelta, timezone
+from config import (supabase, logger, REPLICA_PATH, REPLICA_POLL_INTERVAL,
+                    REPLICA_FULL_SYNC_INTERVAL, REPLICA_MAX_STALENESS)
+import metrics
+
+# Rows per request of a full sync; at most PostgREST's default max-rows.
+SYNC_PAGE_SIZE = 1000
+
+# Each mirrored table keeps the full row as JSON plus the columns reads filter on.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    venue_id INTEGER,
+    booking_date TEXT,
+    status TEXT,
+    series_id TEXT,
+    version REAL,
+    row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_venue_status_date ON bookings (venue_id, status, booking_date);
+CREATE INDEX IF NOT EXISTS bookings_user_status_date ON bookings (user_id, status, booking_date);
+CREATE INDEX IF NOT EXISTS bookings_status_date ON bookings (status, booking_date);
+CREATE INDEX IF NOT EXISTS bookings_series ON bookings (series_id);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    role TEXT,
+    version REAL,
+    row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_role ON users (role);
+CREATE TABLE IF NOT EXISTS venues (
+    venue_id INTEGER PRIMARY KEY,
+    version REAL,
+    row TEXT NOT NULL
+);
+"""
+
+_COLUMNS = {
+    "bookings": ("booking_id", ("user_id", "venue_id", "booking_date", "status", "series_id")),
+    "users": ("user_id", ("role",)),
+    "venues": ("venue_id", ()),
+}
+
+# Bump when _SCHEMA changes. The mirror is only a cache, so an older file is
+# dropped and rebuilt by the next full sync.
+SCHEMA_VERSION = 3
+
+# Re-read this much before the newest updated_at seen, so rows stamped by a
+# writer whose clock lags ours are not skipped.
+DELTA_OVERLAP = timedelta(seconds=30)
+
+# Delta sync only sees rows whose updated_at moved. The repository stamps it
+# on every write the bot makes; for edits made elsewhere (e.g. the Supabase
+# dashboard) install this trigger, or they arrive with the next full sync.
+UPDATED_AT_TRIGGER = """
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN NEW.updated_at = now(); RETURN NEW; END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER bookings_touch BEFORE INSERT OR UPDATE ON bookings FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+CREATE TRIGGER users_touch BEFORE INSERT OR UPDATE ON users FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+CREATE TRIGGER venues_touch BEFORE INSERT OR UPDATE ON venues FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+"""
+
+
+def _version(row):
+    value = row.get("updated_at")
+    if not value:
+        return None
+    try:
+        parsed = dt.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _normalize_date(value):
+    # Postgres returns "T"; rows written through may still carry a space.
+    return str(value).replace(" ", "T", 1) if value is not None else None
+
+
+class Replica:
+    """
+    Local SQLite mirror of bookings, users and venues. Loaded with a full
+    sync, kept current by polling rows whose updated_at changed (plus a
+    periodic full sync that also drops deleted rows), and patched directly
+    with the rows returned by the bot's own writes.
+
+    staleness() is the time since the last successful sync; reads should
+    only be served from here while is_fresh().
+    """
+
+    def __init__(self, path, poll_interval=REPLICA_POLL_INTERVAL, full_sync_interval=REPLICA_FULL_SYNC_INTERVAL,
+                 max_staleness=REPLICA_MAX_STALENESS, clock=time.time):
+        self.poll_interval = poll_interval
+        self.full_sync_interval = full_sync_interval
+        self.max_staleness = max_staleness
+        self.clock = clock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in _COLUMNS:
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._watermarks = {}
+        self._last_sync = None
+        self._last_full_sync = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.syncs = 0
+        self.full_syncs = 0
+        self.sync_errors = 0
+        self.fallbacks = 0
+
+    # -- writes into the mirror ---------------------------------------------
+
+    def _upsert(self, table, rows):
+        key, columns = _COLUMNS[table]
+        names = (key,) + columns + ("version", "row")
+        sql = (
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+            f"ON CONFLICT ({key}) DO UPDATE SET "
+            + ", ".join(f"{n} = excluded.{n}" for n in names[1:])
+            # An older copy (e.g. a delta fetched before our own write) never wins.
+            + f" WHERE excluded.version IS NULL OR {table}.version IS NULL OR excluded.version >= {table}.version"
+        )
+        params = []
+        for row in rows:
+            values = [row.get(key)]
+            for c in columns:
+                values.append(_normalize_date(row.get(c)) if c == "booking_date" else row.get(c))
+            values.append(_version(row))
+            values.append(json.dumps(row, default=str))
+            params.append(values)
+        with self._lock:
+            self._conn.executemany(sql, params)
+            for row in rows:
+                version = _version(row)
+                if version is not None and version > self._watermarks.get(table, float("-inf")):
+                    self._watermarks[table] = version
+
+    def apply(self, table, rows):
+        """Write-through: records rows Supabase returned from an insert/update/upsert."""
+        rows = [r for r in rows or [] if r.get(_COLUMNS[table][0]) is not None]
+        if rows:
+            self._upsert(table, rows)
+
+    def remove(self, table, keys):
+        """Write-through of a delete."""
+        key = _COLUMNS[table][0]
+        keys = list(keys)
+        if keys:
+            with self._lock:
+                self._conn.execute(f"DELETE FROM {table} WHERE {key} IN ({','.join('?' * len(keys))})", keys)
+
+    # -- sync ---------------------------------------------------------------
+
+    def _fetch_all(self, table):
+        # PostgREST caps each response at its max-rows setting, so a table is
+        # read in key order one page at a time until a short page comes back.
+        key = _COLUMNS[table][0]
+        rows, start = [], 0
+        while True:
+            page = (supabase.table(table).select("*").order(key)
+                    .range(start, start + SYNC_PAGE_SIZE - 1).execute().data or [])
+            rows.extend(page)
+            if len(page) < SYNC_PAGE_SIZE:
+                return rows
+            start += SYNC_PAGE_SIZE
+
+    def full_sync(self):
+        started = self.clock()
+        # Every page of every table is fetched before anything is deleted, so
+        # a failed read never drops rows from the mirror.
+        fetched = {table: self._fetch_all(table) for table in _COLUMNS}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for table, rows in fetched.items():
+                    key = _COLUMNS[table][0]
+                    rows = [r for r in rows if r.get(key) is not None]
+                    self._conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS seen_{table} (id INTEGER PRIMARY KEY)")
+                    self._conn.execute(f"DELETE FROM seen_{table}")
+                    self._conn.executemany(f"INSERT OR IGNORE INTO seen_{table} VALUES (?)", [(r[key],) for r in rows])
+                    # Rows written through since the fetch started are kept.
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE {key} NOT IN (SELECT id FROM seen_{table}) "
+                        f"AND (version IS NULL OR version < ?)", (started,)
+                    )
+                    self._upsert(table, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._last_sync = self._last_full_sync = started
+            self.full_syncs += 1
+
+    def sync_delta(self):
+        started = self.clock()
+        for table in _COLUMNS:
+            watermark = self._watermarks.get(table)
+            if watermark is None:
+                # Nothing carries updated_at yet; only full syncs can see changes.
+                continue
+            since = dt.fromtimestamp(watermark, timezone.utc) - DELTA_OVERLAP
+            rows = supabase.table(table).select("*").gte("updated_at", since.isoformat()).execute().data or []
+            self.apply(table, rows)
+        with self._lock:
+            self._last_sync = started
+            self.syncs += 1
+
+    def sync(self):
+        if self._last_full_sync is None or self.clock() - self._last_full_sync >= self.full_sync_interval:
+            self.full_sync()
+        else:
+            self.sync_delta()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="replica-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception:
+                self.sync_errors += 1
+                logger.exception("Replica sync failed:")
+            self._stop.wait(self.poll_interval)
+
+    # -- reads --------------------------------------------------------------
+
+    def staleness(self):
+        last = self._last_sync
+        return float("inf") if last is None else max(0.0, self.clock() - last)
+
+    def is_fresh(self):
+        return self.staleness() <= self.max_staleness
+
+    def query(self, table, where="1", params=(), order=None, limit=None):
+        """Returns the stored rows matching a SQL condition on the indexed columns."""
+        sql = f"SELECT row FROM {table} WHERE {where}"
+        if order:
+            sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with metrics.timed("replica", table):
+            with self._lock:
+                rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def stats(self):
+        staleness = self.staleness()
+        with self._lock:
+            counts = {f"{t}_rows": self._conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in _COLUMNS}
+        return {
+            "staleness_seconds": round(staleness, 1) if staleness != float("inf") else -1,
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "sync_errors": self.sync_errors,
+            "fallbacks": self.fallbacks,
+            **counts,
+        }
+
+
+replica = Replica(REPLICA_PATH) if REPLICA_PATH else None
+if replica is not None:
+    metrics.register_gauges("replica", replica.stats)
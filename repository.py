@@ -0,0 +1,353 @@
+"""
+Data access for bookings, users and venues. Reads are answered by the local
+replica (replica.py) while it is enabled and fresh, and by Supabase
+otherwise. Writes always go to Supabase; the rows it returns are written
+through to the replica so the bot sees its own changes at once.
+
+Supabase reads name the columns they need and, where only current bookings
+matter, filter on booking_date so old history is not fetched. The indexes
+those filters rely on are in SCHEMA_CHANGES.
+"""
+from datetime import datetime as dt, timedelta, timezone
+from config import supabase, TZ
+from replica import replica
+from booking_model import MAX_DURATION_MINUTES, INACTIVE_STATUSES, decode_rows, to_minute
+
+# Columns added to the Supabase schema after the original tables, and the
+# indexes behind the filters below; run once in the SQL editor before
+# deploying code that uses them.
+SCHEMA_CHANGES = """
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS series_id text;
+CREATE INDEX IF NOT EXISTS bookings_series_id ON bookings (series_id) WHERE series_id IS NOT NULL;
+-- interval index loads and venue listings: venue_id/status, booking_date window
+CREATE INDEX IF NOT EXISTS bookings_venue_status_date ON bookings (venue_id, status, booking_date);
+-- /view and /cancel for one user
+CREATE INDEX IF NOT EXISTS bookings_user_status_date ON bookings (user_id, status, booking_date);
+-- admin listings, expiry and archival sweeps by status and date
+CREATE INDEX IF NOT EXISTS bookings_status_date ON bookings (status, booking_date);
+-- replica delta syncs
+CREATE INDEX IF NOT EXISTS bookings_updated_at ON bookings (updated_at);
+CREATE INDEX IF NOT EXISTS users_updated_at ON users (updated_at);
+CREATE INDEX IF NOT EXISTS users_role ON users (role);
+-- past bookings moved out by maintenance.py
+CREATE TABLE IF NOT EXISTS bookings_archive (LIKE bookings INCLUDING DEFAULTS, PRIMARY KEY (booking_id));
+ALTER TABLE bookings_archive ADD COLUMN IF NOT EXISTS archived_at timestamptz DEFAULT now();
+"""
+
+# Projections: only the columns the bot reads.
+BOOKING_COLUMNS = "booking_id, user_id, venue_id, booking_date, duration, status, reason, calendar_event_id, series_id"
+INTERVAL_COLUMNS = "booking_id, venue_id, booking_date, duration, status"
+USER_COLUMNS = "user_id, name, role, cca, block"
+VENUE_COLUMNS = "venue_id, name, allowed_roles, allowed_ccas"
+
+
+def _replica():
+    if replica is None:
+        return None
+    if not replica.is_fresh():
+        replica.fallbacks += 1
+        return None
+    return replica
+
+
+def _stamp(payload):
+    # Lets delta syncs (ours and other instances') pick the change up.
+    return dict(payload, updated_at=dt.now(timezone.utc).isoformat())
+
+
+def _write_through(table, data):
+    if replica is not None and data:
+        replica.apply(table, data)
+    return data or []
+
+
+def _placeholders(values):
+    return ",".join("?" * len(values))
+
+
+def local_now():
+    """Current wall-clock time at the hall, naive like booking_date."""
+    return dt.now(TZ).replace(tzinfo=None)
+
+
+def window_start(now):
+    """
+    Earliest booking_date of a booking that may still be running at `now`:
+    nothing lasts longer than MAX_DURATION_MINUTES.
+    """
+    return now - timedelta(minutes=MAX_DURATION_MINUTES)
+
+
+def _not_ended(rows, now):
+    # The booking_date window is coarse; drop rows that ended before `now`.
+    minute = to_minute(now)
+    return [b.row for b in decode_rows(rows) if b.end_minute > minute]
+
+
+def _bookings_query(columns=BOOKING_COLUMNS, since=None, limit=None):
+    query = supabase.table("bookings").select(columns)
+    if since is not None:
+        query = query.gte("booking_date", since.isoformat())
+    if since is not None or limit is not None:
+        query = query.order("booking_date")
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _windowed(fetch, upcoming, limit, now):
+    # fetch(since, limit) runs the query; `since` is None unless upcoming.
+    if not upcoming:
+        return fetch(None, limit)
+    now = now or local_now()
+    rows = fetch(window_start(now), limit)
+    kept = _not_ended(rows, now)
+    if limit is not None and len(rows) == limit and len(kept) < limit:
+        # Bookings that already ended used up some of the limit; fetch past them once.
+        kept = _not_ended(fetch(window_start(now), limit + len(rows) - len(kept)), now)[:limit]
+    return kept
+
+
+def _local_order(since):
+    return "booking_date, booking_id" if since is not None else "booking_id"
+
+
+def _local_window(where, params, since):
+    if since is None:
+        return where, params
+    return where + " AND booking_date >= ?", params + [since.isoformat()]
+
+
+# -- bookings ------------------------------------------------------------------
+
+def get_booking(booking_id, user_id=None):
+    """Returns the booking, optionally only if it belongs to user_id, or None."""
+    local = _replica()
+    if local is not None:
+        where, params = "booking_id = ?", [booking_id]
+        if user_id is not None:
+            where, params = where + " AND user_id = ?", params + [user_id]
+        rows = local.query("bookings", where, params)
+    else:
+        query = supabase.table("bookings").select(BOOKING_COLUMNS).eq("booking_id", booking_id)
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        rows = query.execute().data
+    return rows[0] if rows else None
+
+
+def get_bookings(booking_ids, user_id=None):
+    """Returns the bookings among booking_ids (optionally only user_id's) in one query."""
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return []
+    local = _replica()
+    if local is not None:
+        where, params = f"booking_id IN ({_placeholders(booking_ids)})", list(booking_ids)
+        if user_id is not None:
+            where, params = where + " AND user_id = ?", params + [user_id]
+        return local.query("bookings", where, params, order="booking_id")
+    query = supabase.table("bookings").select(BOOKING_COLUMNS).in_("booking_id", booking_ids)
+    if user_id is not None:
+        query = query.eq("user_id", user_id)
+    return query.execute().data or []
+
+
+def list_active_bookings(user_id=None, upcoming=False, limit=None, now=None):
+    """
+    Active (not cancelled or expired) bookings, all of them or only those made by user_id. With
+    `upcoming`, only bookings that have not ended yet, soonest first; `limit`
+    caps how many are returned.
+    """
+    def fetch(since, limit):
+        local = _replica()
+        if local is not None:
+            where, params = f"status NOT IN ({_placeholders(INACTIVE_STATUSES)})", list(INACTIVE_STATUSES)
+            if user_id is not None:
+                where, params = where + " AND user_id = ?", params + [user_id]
+            where, params = _local_window(where, params, since)
+            return local.query("bookings", where, params, order=_local_order(since), limit=limit)
+        query = _bookings_query(since=since, limit=limit)
+        for status in INACTIVE_STATUSES:
+            query = query.neq("status", status)
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        return query.execute().data or []
+    return _windowed(fetch, upcoming, limit, now)
+
+
+def list_bookings(venue_ids, status, upcoming=False, limit=None, now=None):
+    """Bookings with the given status at any of the venues; `upcoming` and `limit` as in list_active_bookings."""
+    venue_ids = list(venue_ids)
+    if not venue_ids:
+        return []
+
+    def fetch(since, limit):
+        local = _replica()
+        if local is not None:
+            where, params = _local_window(
+                f"status = ? AND venue_id IN ({_placeholders(venue_ids)})", [status] + venue_ids, since
+            )
+            return local.query("bookings", where, params, order=_local_order(since), limit=limit)
+        return _bookings_query(since=since, limit=limit).eq("status", status).in_("venue_id", venue_ids) \
+            .execute().data or []
+    return _windowed(fetch, upcoming, limit, now)
+
+
+def confirmed_bookings_for_venue(venue_id, since=None):
+    """
+    The venue's confirmed bookings, as INTERVAL_COLUMNS only. With `since`,
+    only those starting at or after it (see window_start).
+    """
+    local = _replica()
+    if local is not None:
+        where, params = _local_window("venue_id = ? AND status = 'confirmed'", [venue_id], since)
+        return local.query("bookings", where, params)
+    query = supabase.table("bookings").select(INTERVAL_COLUMNS) \
+        .eq("venue_id", venue_id) \
+        .eq("status", "confirmed")
+    if since is not None:
+        query = query.gte("booking_date", since.isoformat())
+    return query.execute().data or []
+
+
+def list_bookings_before(statuses, before, limit=None, columns=BOOKING_COLUMNS, use_replica=True):
+    """
+    Bookings in any of `statuses` that start before `before`, oldest first.
+    Pass use_replica=False when the rows are copied elsewhere and must be current.
+    """
+    statuses = list(statuses)
+    local = _replica() if use_replica else None
+    if local is not None:
+        return local.query(
+            "bookings", f"status IN ({_placeholders(statuses)}) AND booking_date < ?",
+            statuses + [before.isoformat()], order="booking_date, booking_id", limit=limit
+        )
+    query = supabase.table("bookings").select(columns).in_("status", statuses) \
+        .lt("booking_date", before.isoformat()).order("booking_date")
+    if limit is not None:
+        query = query.limit(limit)
+    return query.execute().data or []
+
+
+def list_series(series_id):
+    """Every booking of a recurring series, cancelled ones included, in booking order."""
+    local = _replica()
+    if local is not None:
+        return local.query("bookings", "series_id = ?", [series_id], order="booking_id")
+    return supabase.table("bookings").select(BOOKING_COLUMNS).eq("series_id", series_id).order("booking_id") \
+        .execute().data or []
+
+
+def insert_booking(data):
+    """Inserts a booking and returns the stored row, or None."""
+    rows = _write_through("bookings", supabase.table("bookings").insert(_stamp(data)).execute().data)
+    return rows[0] if rows else None
+
+
+def insert_bookings(rows):
+    """Inserts several bookings in one request and returns the stored rows."""
+    if not rows:
+        return []
+    return _write_through("bookings", supabase.table("bookings").insert([_stamp(r) for r in rows]).execute().data)
+
+
+def update_booking(booking_id, changes):
+    """Applies changes to one booking and returns the updated row, or None."""
+    rows = _write_through(
+        "bookings", supabase.table("bookings").update(_stamp(changes)).eq("booking_id", booking_id).execute().data
+    )
+    return rows[0] if rows else None
+
+
+def update_bookings(booking_ids, changes, status=None):
+    """
+    Applies changes to all of booking_ids in one request and returns the
+    updated rows. With `status`, only bookings still in that status change,
+    so a concurrent update is not overwritten.
+    """
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return []
+    query = supabase.table("bookings").update(_stamp(changes)).in_("booking_id", booking_ids)
+    if status is not None:
+        query = query.eq("status", status)
+    return _write_through("bookings", query.execute().data)
+
+
+def archive_bookings(rows):
+    """
+    Copies rows into bookings_archive (an upsert, so a run interrupted before
+    delete_bookings can simply be repeated).
+    """
+    if not rows:
+        return []
+    return supabase.table("bookings_archive").upsert([dict(r) for r in rows]).execute().data or []
+
+
+def delete_bookings(booking_ids, statuses, before):
+    """
+    Deletes those of booking_ids that are still in one of `statuses` and
+    start before `before`, so a row changed since it was read is kept.
+    Returns the deleted rows.
+    """
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return []
+    rows = supabase.table("bookings").delete().in_("booking_id", booking_ids).in_("status", list(statuses)) \
+        .lt("booking_date", before.isoformat()).execute().data or []
+    if replica is not None:
+        replica.remove("bookings", [r["booking_id"] for r in rows])
+    return rows
+
+
+# -- users ---------------------------------------------------------------------
+
+def get_user(user_id):
+    local = _replica()
+    if local is not None:
+        rows = local.query("users", "user_id = ?", [user_id])
+    else:
+        rows = supabase.table("users").select(USER_COLUMNS).eq("user_id", user_id).execute().data
+    return rows[0] if rows else None
+
+
+def get_users(user_ids):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    local = _replica()
+    if local is not None:
+        return local.query("users", f"user_id IN ({_placeholders(user_ids)})", user_ids)
+    return supabase.table("users").select("user_id, name").in_("user_id", user_ids).execute().data or []
+
+
+def list_users(role=None):
+    local = _replica()
+    if local is not None:
+        if role is None:
+            return local.query("users", order="user_id")
+        return local.query("users", "role = ?", [role], order="user_id")
+    query = supabase.table("users").select(USER_COLUMNS)
+    if role is not None:
+        query = query.eq("role", role)
+    return query.execute().data or []
+
+
+def insert_user(user):
+    rows = _write_through("users", supabase.table("users").insert(_stamp(user)).execute().data)
+    return rows[0] if rows else None
+
+
+def upsert_user(user):
+    rows = _write_through("users", supabase.table("users").upsert(_stamp(user)).execute().data)
+    return rows[0] if rows else None
+
+
+# -- venues --------------------------------------------------------------------
+
+def list_venues():
+    local = _replica()
+    if local is not None:
+        return local.query("venues", order="venue_id")
+    return supabase.table("venues").select(VENUE_COLUMNS).execute().data or []
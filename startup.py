@@ -0,0 +1,21 @@
+import time
+from contextlib import contextmanager
+
+_started = time.perf_counter()
+_phases = []
+
+
+@contextmanager
+def phase(name):
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - begin))
+
+
+def report():
+    """Returns a one-line summary of the timed startup phases."""
+    total = time.perf_counter() - _started
+    parts = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in _phases)
+    return f"Startup took {total * 1000:.0f}ms ({parts})"
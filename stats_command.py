@@ -0,0 +1,11 @@
+from config import bot
+from db_helpers import get_user_info
+import metrics
+
+@bot.message_handler(commands=['stats'])
+def stats_command(message):
+    user = get_user_info(message.from_user.id)
+    if not user or user["role"].strip().lower() != "admin":
+        bot.send_message(message.from_user.id, "You do not have permission to view bot statistics. Press /start to restart.")
+        return
+    bot.send_message(message.from_user.id, metrics.render_summary())
@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from ratelimit import BucketMap
+
+# Shown once per burst of throttled requests, not for every one dropped.
+SLOW_DOWN_TEXT = "You're sending requests too quickly. Please wait a moment and try again."
+
+
+def parse_limits(text):
+    """
+    Parses "name=rate/burst,..." (e.g. "default=1/5,book=0.2/2") into
+    {name: (rate per second, burst)}. The burst may be left out.
+    """
+    limits = {}
+    for item in (text or "").split(","):
+        name, sep, spec = item.strip().partition("=")
+        if not sep:
+            continue
+        rate, _, burst = spec.partition("/")
+        limits[name.strip().lstrip("/").lower()] = (float(rate), float(burst) if burst else None)
+    return limits
+
+
+def command_of(update):
+    """
+    Name an update is throttled under: the command of "/book@bot args", the
+    action of callback data such as "confirm_start" or "pickdur_1:00"
+    ("confirm", "pickdur"), or "message" for plain replies.
+    """
+    data = getattr(update, "data", None)
+    if data is not None:
+        return data.split("_", 1)[0].lower() or "callback"
+    text = getattr(update, "text", None) or ""
+    if text.startswith("/"):
+        return text[1:].split(None, 1)[0].split("@", 1)[0].lower() or "message"
+    return "message"
+
+
+class _Seen:
+    """Keys remembered for `window` seconds, oldest first."""
+
+    def __init__(self, window, clock):
+        self.window = window
+        self.clock = clock
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        """Records key; returns False if it was already seen within the window."""
+        now = self.clock()
+        while self._keys:
+            oldest, at = next(iter(self._keys.items()))
+            if now - at <= self.window:
+                break
+            del self._keys[oldest]
+        if key in self._keys:
+            return False
+        self._keys[key] = now
+        return True
+
+
+class Throttle:
+    """
+    Sheds updates before any handler runs, so repeated taps and command spam
+    never reach the database:
+
+    - every user has a token bucket per command (see command_of) listed in
+      `limits`, and one "default" bucket shared by everything else;
+    - a callback query is dropped when its ID, or the same button on the same
+      message from the same user, was seen within `dedupe_window` seconds,
+      which catches both redelivered updates and double taps;
+    - registering a next-step handler replaces a pending registration of the
+      same callback in that chat instead of queueing a second one.
+
+    Dropped callback queries are still answered so the client stops waiting,
+    and the user is told to slow down once per burst.
+    """
+
+    def __init__(self, limits, dedupe_window=2.0, clock=time.monotonic):
+        self.limits = dict(limits)
+        self.limits.setdefault("default", (1.0, 5.0))
+        self.dedupe_window = dedupe_window
+        self.buckets = BucketMap(self._rate_for, self._capacity_for, clock=clock)
+        self._seen = _Seen(dedupe_window, clock)
+        self._warned = set()
+        self._lock = threading.Lock()
+        self.shed = Counter()
+        self.collapsed_steps = 0
+
+    def limit_key(self, update):
+        """
+        command_of(update) if it has a limit of its own, otherwise "default":
+        anything a user types shares one bucket and one counter, so made-up
+        commands neither dodge the limit nor add buckets and metrics.
+        """
+        command = command_of(update)
+        return command if command in self.limits else "default"
+
+    def _limit(self, key):
+        return self.limits[key[1]]
+
+    def _rate_for(self, key):
+        return self._limit(key)[0]
+
+    def _capacity_for(self, key):
+        return self._limit(key)[1]
+
+    def admit(self, update):
+        """
+        Returns (True, None) for an update that may be handled, otherwise
+        (False, reason) with reason "duplicate" or "throttled".
+        """
+        user = getattr(update, "from_user", None)
+        if user is None:
+            return True, None
+        command = self.limit_key(update)
+        if getattr(update, "data", None) is not None:
+            message = getattr(update, "message", None)
+            tap = (user.id, getattr(message, "message_id", None), update.data)
+            with self._lock:
+                fresh = self._seen.add(("id", update.id))
+                fresh = self._seen.add(("tap",) + tap) and fresh
+            if not fresh:
+                self._count("duplicate", command)
+                return False, "duplicate"
+        key = (user.id, command)
+        if self.buckets.get(key).try_acquire() > 0:
+            self._count("throttled", command)
+            return False, "throttled"
+        with self._lock:
+            self._warned.discard(key)
+        return True, None
+
+    def _count(self, reason, command):
+        with self._lock:
+            self.shed[reason] += 1
+            self.shed[f"{reason}_{command}"] += 1
+
+    def should_warn(self, update):
+        """True the first time a user is throttled on a bucket since they were last admitted."""
+        key = (update.from_user.id, self.limit_key(update))
+        with self._lock:
+            if key in self._warned:
+                return False
+            self._warned.add(key)
+            return True
+
+    def filter_updates(self, bot, updates):
+        """Returns the updates to process; answers the callback queries it drops."""
+        kept = []
+        for update in updates:
+            if update.message is not None:
+                event = update.message
+            elif update.callback_query is not None:
+                event = update.callback_query
+            else:
+                kept.append(update)
+                continue
+            admitted, reason = self.admit(event)
+            if admitted:
+                kept.append(update)
+            elif event is update.callback_query:
+                warn = reason == "throttled" and self.should_warn(event)
+                bot._exec_task(_answer_dropped, event, bot, SLOW_DOWN_TEXT if warn else None)
+            elif self.should_warn(event):
+                bot._exec_task(_warn_sender, event, bot)
+        return kept
+
+    def collapse_step(self, backend, chat_id, callback):
+        """Removes a pending next-step registration of callback in chat_id."""
+        handlers = getattr(backend, "handlers", None)
+        pending = handlers.get(chat_id) if handlers is not None else None
+        if not pending:
+            return
+        kept = [h for h in pending if h.callback is not callback]
+        if len(kept) != len(pending):
+            with self._lock:
+                self.collapsed_steps += len(pending) - len(kept)
+            if kept:
+                handlers[chat_id] = kept
+            else:
+                handlers.pop(chat_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = {f"shed_{reason}": n for reason, n in sorted(self.shed.items())}
+            stats["collapsed_steps"] = self.collapsed_steps
+        stats["buckets"] = len(self.buckets)
+        return stats
+
+
+# The update goes first so the keyed executor runs these on the sender's worker.
+def _answer_dropped(call, bot, text):
+    bot.answer_callback_query(call.id, text)
+
+
+def _warn_sender(message, bot):
+    bot.send_message(message.chat.id, SLOW_DOWN_TEXT)
+
+
+def install(bot, throttle):
+    """
+    Puts throttle in front of every handler of this bot instance, including
+    pending next-step handlers, for both polling and webhook delivery.
+    """
+    process_new_updates = bot.process_new_updates
+    register_by_chat_id = bot.register_next_step_handler_by_chat_id
+
+    def throttled_process_new_updates(updates):
+        # Polling resumes after last_update_id, which telebot only advances
+        # for updates it processes; dropped ones must not be fetched again.
+        for update in updates:
+            bot.last_update_id = max(bot.last_update_id, update.update_id)
+        updates = throttle.filter_updates(bot, updates)
+        if updates:
+            process_new_updates(updates)
+
+    def collapsing_register(chat_id, callback, *args, **kwargs):
+        throttle.collapse_step(bot.next_step_backend, chat_id, callback)
+        register_by_chat_id(chat_id, callback, *args, **kwargs)
+
+    bot.process_new_updates = throttled_process_new_updates
+    bot.register_next_step_handler_by_chat_id = collapsing_register
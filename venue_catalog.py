@@ -0,0 +1,105 @@
+import json
+import threading
+from config import logger, VENUE_REFRESH_INTERVAL
+import repository
+
+
+def normalize(text):
+    return (text or "").strip().lower()
+
+
+def _parse_roles(allowed_roles):
+    allowed_roles = allowed_roles or []
+    if isinstance(allowed_roles, str):
+        allowed_roles = json.loads(allowed_roles)
+    return frozenset(normalize(r) for r in allowed_roles)
+
+
+class _Snapshot:
+    """Immutable view of the venues table; replaced wholesale on refresh."""
+
+    def __init__(self, rows):
+        self.venues = []
+        self.by_id = {}
+        self.by_key = {}
+        by_role = {}
+        for row in rows:
+            venue = dict(row)
+            venue["name"] = (row.get("name") or "").strip()
+            key = str(venue["venue_id"])
+            self.venues.append(venue)
+            self.by_id[key] = venue
+            self.by_key[normalize(venue["name"])] = venue
+            for role in _parse_roles(row.get("allowed_roles")):
+                by_role.setdefault(role, []).append(venue)
+        self.by_role = {role: tuple(vs) for role, vs in by_role.items()}
+
+
+class VenueCatalog:
+    """
+    In-memory catalog of venues with normalized names and precompiled access
+    rules. Loaded once, then refreshed by a background thread.
+    """
+
+    def __init__(self, refresh_interval=VENUE_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fetch(self):
+        return repository.list_venues()
+
+    def load(self):
+        snapshot = _Snapshot(self._fetch())
+        self._snapshot = snapshot
+        return snapshot
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                snapshot = self._snapshot or self.load()
+        return snapshot
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="venue-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._load_lock:
+                    self.load()
+            except Exception:
+                logger.exception("Failed to refresh venue catalog:")
+            self._stop.wait(self.refresh_interval)
+
+    def all(self):
+        return list(self._current().venues)
+
+    def get(self, venue_id):
+        return self._current().by_id.get(str(venue_id))
+
+    def find(self, name):
+        return self._current().by_key.get(normalize(name))
+
+    def name_of(self, venue_id, default="Unknown Venue"):
+        venue = self.get(venue_id)
+        return venue["name"] if venue else default
+
+    def ids_for(self, names):
+        by_key = self._current().by_key
+        return [by_key[normalize(n)]["venue_id"] for n in names if normalize(n) in by_key]
+
+    def venues_for_role(self, role):
+        return list(self._current().by_role.get(normalize(role), ()))
+
+
+catalog = VenueCatalog()
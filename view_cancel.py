@@ -1,8 +1,8 @@
-from datetime import datetime as dt
-from telebot import types
-from config import bot, supabase
-from db_helpers import get_user_info, get_all_venues, get_all_users, parse_duration, get_user_bookings, get_venue_ids_for
-from booking_utils import cancel_booking
+from config import bot
+from db_helpers import get_user_info, get_user_bookings, get_venue_ids_for
+from booking_listing import listing_messages, LISTING_LIMIT
+from booking_utils import cancel_bookings, parse_selection, filter_selection
+import repository
 
 @bot.message_handler(commands=['cancel'])
 def cancel_command(message):
@@ -10,51 +10,70 @@ def cancel_command(message):
     if not user:
         return
     is_admin = (user["role"].strip().lower() == "admin")
-    bookings = get_user_bookings(user["user_id"], is_admin=is_admin)
+    bookings = get_user_bookings(user["user_id"], is_admin=is_admin, limit=LISTING_LIMIT + 1)
     if not bookings:
         bot.send_message(user["user_id"], "You have no active bookings to cancel. Press /start to restart.")
         return
-    venues = get_all_venues()
-    users = get_all_users()
-    venue_dict = {str(v["venue_id"]): v["name"] for v in venues}
-    users_dict = {str(u["user_id"]): u["name"] for u in users}
-    response_lines = []
-    for b in bookings:
-        booking_start = dt.fromisoformat(b["booking_date"])
-        dur = parse_duration(b["duration"])
-        end_dt = booking_start + dur
-        start_str = booking_start.strftime("%Y-%m-%d %H:%M")
-        end_str   = end_dt.strftime("%Y-%m-%d %H:%M")
-        venue_name = venue_dict.get(str(b["venue_id"]), "Unknown Venue")
-        user_name  = users_dict.get(str(b["user_id"]), "Unknown User")
-        line = (
-            f"Booking ID: {b['booking_id']}\n"
-            f"Venue: {venue_name}\n"
-            f"Name: {user_name}\n"
-            f"Start: {start_str}\n"
-            f"End: {end_str}\n"
-            f"Status: {b['status']}\n"
-            f"Reason: {b.get('reason','')}\n"
-            "----------------------"
-        )
-        response_lines.append(line)
-    final_msg = "\n".join(response_lines)
-    final_msg += "\nPlease enter the Booking ID to cancel:"
-    bot.send_message(user["user_id"], final_msg)
+    prompt = ("Please enter the Booking ID(s) to cancel (e.g. 12, 15 18), or 'all', "
+              "optionally followed by a venue and/or date (e.g. all MPSH 2025-03-01). "
+              "Start with 'series' to cancel the whole recurring series of a booking (e.g. series 12):")
+    for text in listing_messages(bookings, footer=prompt):
+        bot.send_message(user["user_id"], text)
     bot.register_next_step_handler(message, process_cancel)
 
 def process_cancel(message):
+    user_id = message.from_user.id
+    text = (message.text or "").strip()
+    whole_series = text.lower().startswith("series")
+    if whole_series:
+        text = text[len("series"):]
     try:
-        booking_id = int(message.text.strip())
-        user_id = message.from_user.id
-        user = get_user_info(user_id)
-        is_admin = (user and user["role"].strip().lower() == "admin")
-        if cancel_booking(booking_id, user_id, is_admin=is_admin):
-            bot.send_message(message.from_user.id, f"Booking {booking_id} cancelled successfully. Press /start to restart.")
-        else:
-            bot.send_message(message.from_user.id, "Unable to cancel booking. Please check the Booking ID. Press /start to restart.")
+        booking_ids, venue, day = parse_selection(text)
     except ValueError:
-        bot.send_message(message.from_user.id, "Invalid Booking ID. Press /start to restart.")
+        bot.send_message(user_id, "Invalid Booking ID. Press /start to restart.")
+        return
+    user = get_user_info(user_id)
+    is_admin = bool(user and user["role"].strip().lower() == "admin")
+    if booking_ids is None:
+        if is_admin and venue is None and day is None:
+            bot.send_message(user_id, "Please narrow 'all' down with a venue and/or date. Press /start to restart.")
+            return
+        selected = filter_selection(get_user_bookings(user_id, is_admin=is_admin), venue, day)
+        if not selected:
+            bot.send_message(user_id, "No active bookings match that selection. Press /start to restart.")
+            return
+        booking_ids = sorted(b.booking_id for b in selected)
+        bot.send_message(user_id, f"This will cancel {len(booking_ids)} booking(s): {', '.join(map(str, booking_ids))}"
+                                  f"{' and the rest of their series' if whole_series else ''}.\n"
+                                  "Reply 'yes' to confirm, or anything else to keep them.")
+        bot.register_next_step_handler(message, confirm_cancel_all, booking_ids, whole_series)
+        return
+    cancel_selected(user_id, booking_ids, is_admin, whole_series)
+
+def confirm_cancel_all(message, booking_ids, whole_series):
+    user_id = message.from_user.id
+    if (message.text or "").strip().lower() != "yes":
+        bot.send_message(user_id, "No bookings were cancelled. Press /start to restart.")
+        return
+    user = get_user_info(user_id)
+    is_admin = bool(user and user["role"].strip().lower() == "admin")
+    cancel_selected(user_id, booking_ids, is_admin, whole_series)
+
+def cancel_selected(user_id, booking_ids, is_admin, whole_series):
+    cancelled = cancel_bookings(booking_ids, user_id, is_admin=is_admin, whole_series=whole_series)
+    cancelled_ids = sorted(b.booking_id for b in cancelled)
+    done = set(cancelled_ids)
+    failed = [i for i in booking_ids if i not in done]
+    lines = []
+    if len(cancelled_ids) == 1:
+        lines.append(f"Booking {cancelled_ids[0]} cancelled successfully.")
+    elif cancelled_ids:
+        lines.append(f"Cancelled {len(cancelled_ids)} bookings: {', '.join(map(str, cancelled_ids))}.")
+    if failed or not booking_ids:
+        lines.append("Unable to cancel booking. Please check the Booking ID" +
+                     (f": {', '.join(map(str, failed))}." if failed else "."))
+    lines.append("Press /start to restart.")
+    bot.send_message(user_id, "\n".join(lines))
 
 @bot.message_handler(commands=['view'])
 def view_command(message):
@@ -63,37 +82,13 @@ def view_command(message):
         return
     if user["role"].strip().lower() == "jcrc":
         venue_ids = get_venue_ids_for(["Dining Hall", "Reading Room", "MPSH"])
-        data = supabase.table("bookings").select("*").in_("venue_id", venue_ids).eq("status", "confirmed").execute()
-        bookings = data.data if data.data else []
+        bookings = repository.list_bookings(venue_ids, "confirmed", upcoming=True, limit=LISTING_LIMIT + 1)
     else:
         is_admin = (user["role"].strip().lower() == "admin")
-        bookings = get_user_bookings(user["user_id"], is_admin=is_admin)
+        bookings = get_user_bookings(user["user_id"], is_admin=is_admin, limit=LISTING_LIMIT + 1)
     if not bookings:
         bot.send_message(user["user_id"], "No active bookings found.")
         return
-    venues = get_all_venues()
-    users = get_all_users()
-    venue_dict = {str(v["venue_id"]): v["name"] for v in venues}
-    users_dict = {str(u["user_id"]): u["name"] for u in users}
-    response_lines = []
-    for b in bookings:
-        booking_start = dt.fromisoformat(b["booking_date"])
-        dur = parse_duration(b["duration"])
-        end_dt = booking_start + dur
-        start_time = booking_start.strftime("%Y-%m-%d %H:%M")
-        end_time = end_dt.strftime("%Y-%m-%d %H:%M")
-        venue_name = venue_dict.get(str(b["venue_id"]), "Unknown Venue")
-        user_name = users_dict.get(str(b["user_id"]), "Unknown User")
-        line = (
-            f"Booking ID: {b['booking_id']}\n"
-            f"Venue: {venue_name}\n"
-            f"Name: {user_name}\n"
-            f"Start: {start_time}\n"
-            f"End: {end_time}\n"
-            f"Status: {b['status']}\n"
-            f"Reason: {b.get('reason','')}\n"
-            "----------------------"
-        )
-        response_lines.append(line)
-    bot.send_message(user["user_id"], "\n".join(response_lines))
+    for text in listing_messages(bookings):
+        bot.send_message(user["user_id"], text)
 
@@ -0,0 +1,75 @@
+import hmac
+import json
+import secrets
+import signal
+import threading
+import telebot
+from config import bot, logger, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, HTTP_HOST, HTTP_PORT
+import local_http
+
+_shutting_down = threading.Event()
+# Telegram sends this back on every delivery; set by run_webhook.
+_secret_token = None
+
+
+def webhook_app(environ, start_response):
+    if environ.get("REQUEST_METHOD") != "POST":
+        return local_http.respond(start_response, "405 Method Not Allowed", "POST only")
+    if _shutting_down.is_set():
+        # Telegram retries non-2xx deliveries, so nothing is lost while we stop.
+        return local_http.respond(start_response, "503 Service Unavailable", "shutting down")
+    token = environ.get("HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN", "")
+    if not _secret_token or not hmac.compare_digest(token, _secret_token):
+        return local_http.respond(start_response, "403 Forbidden", "bad secret token")
+    try:
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        payload = environ["wsgi.input"].read(length).decode("utf-8")
+        update = telebot.types.Update.de_json(payload)
+    except (ValueError, KeyError, json.JSONDecodeError):
+        return local_http.respond(start_response, "400 Bad Request", "invalid update")
+    bot.process_new_updates([update])
+    return local_http.respond(start_response, "200 OK", "ok")
+
+
+def health_app(environ, start_response):
+    if _shutting_down.is_set():
+        return local_http.respond(start_response, "503 Service Unavailable", '{"status": "stopping"}',
+                                  content_type="application/json")
+    return local_http.respond(start_response, "200 OK", '{"status": "ok"}', content_type="application/json")
+
+
+def run_webhook(server, on_shutdown=()):
+    """
+    Serves Telegram updates on WEBHOOK_PATH of the running local HTTP server
+    until SIGTERM/SIGINT, then stops accepting updates, lets queued handlers
+    finish and runs on_shutdown hooks.
+    """
+    global _secret_token
+    # Handlers trust from_user.id, so unauthenticated updates must never get through.
+    if WEBHOOK_SECRET:
+        _secret_token = WEBHOOK_SECRET
+    elif WEBHOOK_URL:
+        # We register the webhook ourselves, so a fresh secret for this run will do.
+        _secret_token = secrets.token_urlsafe(32)
+    else:
+        raise RuntimeError("WEBHOOK_SECRET must be set when the webhook is registered outside the bot (no WEBHOOK_URL)")
+    local_http.route(WEBHOOK_PATH, webhook_app)
+    local_http.route("/healthz", health_app)
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=_secret_token)
+    logger.critical(f"Bot is serving webhook on {HTTP_HOST}:{HTTP_PORT}{WEBHOOK_PATH}...")
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    stop.wait()
+
+    logger.critical("Webhook shutting down...")
+    _shutting_down.set()
+    server.shutdown()
+    server.server_close()
+    executor = getattr(bot, "executor", None)
+    if executor is not None:
+        executor.shutdown()
+    for hook in on_shutdown:
+        hook()